@@ -3,7 +3,6 @@ from flask_migrate import Migrate
 from flask_sqlalchemy import SQLAlchemy
 from flask_jwt_extended import JWTManager
 from config import Config
-import ell
 
 db = SQLAlchemy()
 migrate = Migrate()
@@ -23,15 +22,49 @@ def create_app(config_class=Config):
     migrate.init_app(app, db)
     jwt.init_app(app)
     
+    # Spans por etapa, Server-Timing y métricas
+    from app.services.telemetry import telemetry
+    telemetry.init_app(app)
+    
     # Importar modelos
-    from app.models import user, chat, document
-    
-    # Inicializar ell una sola vez
-    ell.init(
-        store=app.config.get('ELL_STORE_PATH', './ell_store'),
-        verbose=True,
-        autocommit=True
-    )
+    from app.models import user, chat, document, passage, cache_generation, stream_token
+    
+    # Índice vectorial en memoria sincronizado con Document
+    from app.services.embedding_cache import embedding_cache
+    from app.services.embedding_store import embedding_store
+    from app.services.vector_index import vector_index, register_events
+    embedding_cache.init_app(app)
+    embedding_store.init_app(app)
+    vector_index.init_app(app)
+    register_events()
+    
+    # Configuración de ell; se inicializa una sola vez al definir el primer LMP
+    from app.services.ell_recorder import ell_recorder
+    ell_recorder.init_app(app)
+    
+    # Caché de respuestas de los LMPs
+    from app.services.llm_cache import llm_cache
+    llm_cache.init_app(app)
+    
+    # Pool asíncrono y acotado para llamadas a los modelos
+    from app.services.async_llm import llm_pool
+    llm_pool.init_app(app)
+    
+    # Enrutado por latencia entre proveedores, con hedging y failover
+    from app.services.model_router import model_router
+    model_router.init_app(app)
+    
+    # Preprocesado de imágenes fuera del hilo de la petición
+    from app.services.images import image_processor
+    image_processor.init_app(app)
+    
+    # Herramientas de los LMPs: ejecución paralela y memoización por conversación
+    from app.services.tools import tool_executor
+    tool_executor.init_app(app)
+    
+    # Best-of-n concurrente sobre el pool
+    from app.services.ensemble import ensemble
+    ensemble.init_app(app)
     
     # Registrar blueprints
     from app.chat import bp as chat_bp
@@ -1,8 +1,33 @@
-from flask import jsonify, request, current_app
-from flask_jwt_extended import jwt_required, get_jwt_identity
+import base64
+import hashlib
+from typing import Optional
+from flask import jsonify, request, current_app, Response, stream_with_context
+from flask_jwt_extended import get_jwt, get_jwt_identity
+from werkzeug.exceptions import RequestEntityTooLarge
 from . import bp
+from app import db
 from app.models.document import Document
+from app.services.coalescing import single_flight
 from app.services.ell_service import ell_service
+from app.services.ensemble import ensemble
+from app.services.images import InvalidImage, UploadTooLarge, image_processor
+from app.services.llm_cache import llm_cache
+from app.services.streaming import json_events
+from app.services.telemetry import telemetry, traced_jwt_required
+
+DOCUMENTS_PAGE_SIZE = 50
+DOCUMENTS_MAX_PAGE_SIZE = 200
+
+def _encode_cursor(document_id: int) -> str:
+    return base64.urlsafe_b64encode(str(document_id).encode()).decode()
+
+def _decode_cursor(cursor: Optional[str]) -> Optional[int]:
+    if not cursor:
+        return None
+    try:
+        return int(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (UnicodeDecodeError, ValueError) as e:
+        raise ValueError(f"Cursor inválido: {cursor}") from e
 
 @bp.route('/health')
 def health():
@@ -12,8 +37,16 @@ def health():
         'service': 'bot-experto-api'
     })
 
+@bp.route('/metrics')
+def metrics():
+    """Métricas del proceso en el formato de texto de Prometheus."""
+    token = current_app.config.get('METRICS_TOKEN')
+    if token and request.headers.get('Authorization') != f"Bearer {token}":
+        return jsonify({'error': 'No autorizado'}), 401
+    return Response(telemetry.render(), mimetype='text/plain; version=0.0.4')
+
 @bp.route('/query', methods=['POST'])
-@jwt_required()
+@traced_jwt_required()
 async def query():
     """Endpoint para realizar consultas a través de la API."""
     try:
@@ -27,16 +60,43 @@ async def query():
         
         user_id = get_jwt_identity()
         current_app.logger.info(f"API consulta recibida de usuario {user_id}: {query}")
+        
+        if data.get('stream'):
+            completion = ell_service.stream_query(query)
+            return Response(stream_with_context(json_events(completion)),
+                            mimetype='text/event-stream',
+                            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+        
+        if data.get('ensemble'):
+            # true usa la configuración; un objeto admite n, models, quorum y deadline
+            options = data['ensemble'] if isinstance(data['ensemble'], dict) else {}
+            try:
+                options = ensemble.options(**{key: options.get(key) for key in ('n', 'models', 'quorum', 'deadline')})
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            with telemetry.span('ensemble'):
+                result = await ensemble.arun(query, **options)
+            return jsonify({
+                'response': result.pop('response'),
+                'ensemble': result,
+                'status': 'success'
+            })
             
-        response = await ell_service.query_with_context(
-            query=query,
-            max_results=data.get('max_results', 5)
-        )
+        if data.get('tools'):
+            # Los resultados de las búsquedas se memoizan por usuario y sesión de chat
+            conversation = f"{user_id}:{get_jwt().get('chat_session') or 'default'}"
+            response = await ell_service.aquery_with_tools(query, conversation=conversation)
+        else:
+            response = await ell_service.aquery(query, domain=data.get('domain'))
         
         return jsonify({
             'response': response,
             'status': 'success'
         })
+    
+    except TimeoutError:
+        current_app.logger.error(f"Timeout en API query: {query}")
+        return jsonify({'error': 'El modelo no respondió a tiempo'}), 504
                              
     except Exception as e:
         current_app.logger.error(f"Error en API query: {str(e)}")
@@ -45,33 +105,122 @@ async def query():
             'details': str(e)
         }), 500
 
+@bp.route('/images/query', methods=['POST'])
+@traced_jwt_required()
+def image_query():
+    """Analiza una imagen: multipart con los campos image y query, o el cuerpo image/* con ?query=.
+    
+    La subida se copia por bloques a memoria acotada, se reduce fuera del hilo de la
+    petición y el análisis se cachea por hash perceptual y consulta.
+    """
+    source = None
+    try:
+        # Con multipart, Werkzeug aplica el límite al parsear el formulario (413)
+        request.max_content_length = image_processor.config['max_upload_bytes']
+        with telemetry.span('upload'):
+            if request.mimetype.startswith('image/'):
+                query = request.args.get('query', '')
+                source = image_processor.spool(request.stream)
+            else:
+                query = request.form.get('query', '')
+                upload = request.files.get('image')
+                source = upload.stream if upload is not None else None
+        if source is None:
+            return jsonify({'error': 'Se requiere una imagen'}), 400
+        if not query or len(query) > 500:
+            return jsonify({'error': 'Se requiere una consulta de hasta 500 caracteres'}), 400
+        
+        with telemetry.span('preprocess'):
+            image = image_processor.preprocess(source)
+        model = current_app.config['DEFAULT_MODEL']
+        key = llm_cache.make_key(model, {'task': 'analyze_image'}, [image['hash'], query])
+        response = llm_cache.get(key)
+        cached = response is not None
+        if not cached:
+            with telemetry.span('model'):
+                # Reenvíos simultáneos de la misma captura comparten una sola llamada
+                response = single_flight.do(key, lambda: ell_service.analyze_image(image['data_url'], query).text)
+            llm_cache.set(key, response)
+        
+        return jsonify({
+            'response': response,
+            'image': {'hash': image['hash'], 'original_size': image['original_size'], 'size': image['size']},
+            'cached': cached,
+            'status': 'success'
+        })
+    
+    except (UploadTooLarge, RequestEntityTooLarge):
+        return jsonify({'error': 'La imagen es demasiado grande'}), 413
+    except InvalidImage:
+        return jsonify({'error': 'Imagen no válida'}), 400
+    except TimeoutError:
+        current_app.logger.error("Timeout procesando imagen")
+        return jsonify({'error': 'La imagen no pudo procesarse a tiempo'}), 504
+    except Exception as e:
+        current_app.logger.error(f"Error en API image query: {str(e)}")
+        return jsonify({
+            'error': 'Error interno del servidor',
+            'details': str(e)
+        }), 500
+    finally:
+        if source is not None:
+            source.close()
+
 @bp.route('/documents', methods=['GET'])
-@jwt_required()
+@traced_jwt_required()
 def get_documents():
-    """Endpoint para obtener documentos disponibles."""
+    """Endpoint para obtener documentos disponibles, paginado por cursor.
+    
+    Sólo lee las columnas del listado. El ETag se calcula con un agregado del
+    dominio (número de documentos, id máximo y última modificación), así que un
+    If-None-Match vigente responde 304 sin consultar la página.
+    """
     try:
         domain = request.args.get('domain')
-        query = Document.query
+        limit = max(min(request.args.get('limit', DOCUMENTS_PAGE_SIZE, type=int), DOCUMENTS_MAX_PAGE_SIZE), 1)
+        try:
+            after = _decode_cursor(request.args.get('cursor'))
+        except ValueError:
+            return jsonify({'error': 'Cursor inválido'}), 400
         
+        # Marcador barato del dominio: cambia con cada alta, baja o modificación
+        marker = db.session.query(db.func.count(Document.id), db.func.max(Document.id),
+                                  db.func.max(Document.updated_at))
         if domain:
-            query = query.filter_by(domain=domain)
-            
-        documents = query.all()
-        return jsonify({
-            'documents': [
-                {
-                    'id': doc.id,
-                    'title': doc.title,
-                    'domain': doc.domain,
-                    'created_at': doc.created_at.isoformat()
-                }
-                for doc in documents
-            ]
-        })
+            marker = marker.filter(Document.domain == domain)
+        etag = hashlib.sha256(repr((marker.one(), domain, after, limit)).encode('utf-8')).hexdigest()
+        if etag in request.if_none_match:
+            response = Response(status=304)
+        else:
+            query = db.session.query(Document.id, Document.title, Document.domain, Document.created_at)
+            if domain:
+                query = query.filter(Document.domain == domain)
+            if after is not None:
+                query = query.filter(Document.id > after)
+            rows = query.order_by(Document.id).limit(limit + 1).all()
+            has_more = len(rows) > limit
+            rows = rows[:limit]
+            next_cursor = _encode_cursor(rows[-1].id) if has_more and rows else None
+            response = jsonify({
+                'documents': [
+                    {
+                        'id': row.id,
+                        'title': row.title,
+                        'domain': row.domain,
+                        'created_at': row.created_at.isoformat() if row.created_at else None
+                    }
+                    for row in rows
+                ],
+                'next_cursor': next_cursor
+            })
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        response.vary.add('Authorization')
+        return response
         
     except Exception as e:
         current_app.logger.error(f"Error obteniendo documentos: {str(e)}")
         return jsonify({
             'error': 'Error interno del servidor',
             'details': str(e)
-        }), 500 
\ No newline at end of file
+        }), 500 
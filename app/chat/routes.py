@@ -1,15 +1,56 @@
-from flask import current_app, render_template, request, jsonify
+from flask import current_app, render_template, request, jsonify, Response, stream_with_context
 from werkzeug.exceptions import BadRequest
-from datetime import datetime
+from itsdangerous import URLSafeTimedSerializer, BadSignature
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime, timedelta
+import uuid
 from . import bp
+from app import db
+from app.models.stream_token import ConsumedStreamToken
 from app.services.ell_service import ell_service
-from flask_jwt_extended import jwt_required, get_jwt_identity, create_access_token
+from flask_jwt_extended import get_jwt_identity, get_jwt, create_access_token
 from config import Config
-import ell
-from ell import Message
+from app.services.lazy import lazy_ell
+from app.services.streaming import html_events
+from app.services.coalescing import request_key, single_flight
+from app.services.llm_cache import llm_cache
+from app.services import chat_history
+from app.services.context_builder import assemble_history, schedule_summary_update
+from app.services.telemetry import telemetry, traced_jwt_required
+
+STREAM_TOKEN_MAX_AGE = 60
+MESSAGES_PAGE_SIZE = 20
+MESSAGES_MAX_PAGE_SIZE = 100
+
+def _stream_serializer():
+    return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt='chat-stream')
+
+def _consume_stream_token(jti: str) -> bool:
+    """Marca el token como usado; False si ya se usó, en este o en otro proceso.
+
+    Los tokens consumidos hace más de STREAM_TOKEN_MAX_AGE ya no pasan la firma,
+    así que sus filas se pueden borrar.
+    """
+    now = datetime.utcnow()
+    ConsumedStreamToken.query.filter(
+        ConsumedStreamToken.consumed_at < now - timedelta(seconds=STREAM_TOKEN_MAX_AGE)
+    ).delete(synchronize_session=False)
+    db.session.add(ConsumedStreamToken(jti=jti, consumed_at=now))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return False
+    return True
+
+def _current_chat():
+    """Chat de la sesión actual según la identidad y el claim chat_session del JWT."""
+    user = chat_history.resolve_user(get_jwt_identity())
+    return chat_history.get_or_create_chat(user.id, get_jwt().get('chat_session'),
+                                           domain=request.values.get('domain'))
 
 @bp.route('/query', methods=['POST'])
-@jwt_required()
+@traced_jwt_required()
 def query():
     """Endpoint para procesar consultas del chat."""
     try:
@@ -22,22 +63,41 @@ def query():
         
         user_id = get_jwt_identity()
         current_app.logger.info(f"Consulta recibida de usuario {user_id}: {query}")
+        chat = _current_chat()
+        chat_id = chat.id
+        
+        if request.form.get('stream'):
+            # El widget abre un EventSource con un token firmado, de corta duración y de un solo uso
+            token = _stream_serializer().dumps({'query': query, 'user_id': user_id, 'chat_id': chat_id,
+                                                'jti': uuid.uuid4().hex})
+            return render_template('components/message_stream.html',
+                              stream_token=token,
+                              timestamp=datetime.utcnow())
         
-        # Crear mensajes usando las funciones helper de ell
-        messages = [
-            ell.system("You are a helpful assistant."),
-            ell.user(query)
-        ]
+        with telemetry.span('history'):
+            history = assemble_history(chat_id)
+            messages = ell_service.build_messages(query, history)
         
         try:
             # La respuesta será un Message del asistente
-            assistant_message = ell_service.query_with_context(messages=messages)
-            
-            if not assistant_message:
-                raise ValueError("No se recibió respuesta del modelo")
-            
-            # Extraer el contenido del mensaje del asistente
-            response_text = assistant_message.content if hasattr(assistant_message, 'content') else str(assistant_message)
+            # Las consultas idénticas en curso comparten una sola llamada al modelo
+            if current_app.config.get('CHAT_TOOLS'):
+                # Búsquedas en documentos vía herramientas, memoizadas por chat
+                response_text = ell_service.query_with_tools(query, history, conversation=f"chat:{chat_id}")
+            else:
+                with telemetry.span('model'):
+                    assistant_message = single_flight.do(
+                        request_key(current_app.config['DEFAULT_MODEL'], messages),
+                        lambda: ell_service.query_with_context(messages=messages, cache_domain=chat.domain)
+                    )
+                
+                if not assistant_message:
+                    raise ValueError("No se recibió respuesta del modelo")
+                
+                # Extraer el contenido del mensaje del asistente
+                response_text = assistant_message.text if hasattr(assistant_message, 'text') else str(assistant_message)
+            chat_history.record_exchange(chat_id, query, response_text)
+            schedule_summary_update(chat_id)
             
             return render_template('components/message.html',
                               message=response_text,
@@ -58,16 +118,44 @@ def query():
         return render_template('components/message.html',
                            error="Error interno del servidor"), 500
 
+@bp.route('/stream/<token>', methods=['GET'])
+def stream(token):
+    """Transmite la respuesta del modelo como Server-Sent Events."""
+    try:
+        payload = _stream_serializer().loads(token, max_age=STREAM_TOKEN_MAX_AGE)
+    except BadSignature:
+        return Response('event: error\ndata: Token inválido\n\n',
+                        mimetype='text/event-stream', status=403)
+    if not payload.get('jti') or not _consume_stream_token(payload['jti']):
+        return Response('event: error\ndata: Token ya utilizado\n\n',
+                        mimetype='text/event-stream', status=403)
+    
+    current_app.logger.info(f"Streaming para usuario {payload['user_id']}: {payload['query']}")
+    completion = ell_service.stream_query(payload['query'],
+                                          history=assemble_history(payload['chat_id']))
+    
+    def events():
+        yield from html_events(completion)
+        if completion.text:
+            chat_history.record_exchange(payload['chat_id'], payload['query'], completion.text)
+            schedule_summary_update(payload['chat_id'])
+    
+    return Response(stream_with_context(events()),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @bp.route('/messages', methods=['GET'])
-@jwt_required()
+@traced_jwt_required()
 def get_messages():
-    """Obtiene el historial de mensajes del usuario."""
-    user_id = get_jwt_identity()
+    """Obtiene el historial de mensajes del usuario, paginado por cursor."""
     try:
-        # Implementar lógica para obtener mensajes
-        messages = []  # Obtener de la base de datos
+        limit = min(request.args.get('limit', MESSAGES_PAGE_SIZE, type=int), MESSAGES_MAX_PAGE_SIZE)
+        messages, previous_cursor = chat_history.page(_current_chat().id,
+                                                      before=request.args.get('before'),
+                                                      limit=max(limit, 1))
         return render_template('components/message_history.html',
-                             messages=messages)
+                             messages=messages,
+                             previous_cursor=previous_cursor)
     except Exception as e:
         current_app.logger.error(f"Error al obtener mensajes: {str(e)}")
         return render_template('components/message.html',
@@ -77,11 +165,14 @@ def get_messages():
 def widget():
     """Retorna el HTML del widget del chat."""
     # Generar un token de acceso para el widget
-    access_token = create_access_token(identity="widget_user")
+    # Cada carga del widget abre una sesión de chat propia
+    access_token = create_access_token(identity="widget_user",
+                                       additional_claims={'chat_session': uuid.uuid4().hex})
     
     return render_template('widget/chat.html', access_token=access_token)
 
-@ell.simple(model=Config.DEFAULT_MODEL)
+@llm_cache.cached(model=Config.DEFAULT_MODEL)
+@lazy_ell.simple(model=Config.DEFAULT_MODEL)
 def generate_response(prompt: str):
     """You are a helpful AI assistant."""
     return prompt
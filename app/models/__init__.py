@@ -1,3 +1,6 @@
 from app.models.user import User
 from app.models.chat import Chat
-from app.models.document import Document 
\ No newline at end of file
+from app.models.document import Document
+from app.models.passage import Passage
+from app.models.cache_generation import CacheGeneration
+from app.models.stream_token import ConsumedStreamToken
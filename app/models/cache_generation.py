@@ -0,0 +1,8 @@
+from app import db
+
+class CacheGeneration(db.Model):
+    """Generación de la caché de respuestas por dominio, compartida por todos los procesos."""
+    __tablename__ = 'cache_generations'
+    
+    scope = db.Column(db.String(64), primary_key=True)
+    generation = db.Column(db.Integer, nullable=False, default=0)
@@ -10,12 +10,17 @@ class Chat(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     domain = db.Column(db.String(64), index=True)
+    session_key = db.Column(db.String(64))
+    summary = db.Column(db.Text)
+    summary_tokens = db.Column(db.Integer)
+    summary_until_id = db.Column(db.Integer)
     
     messages = db.relationship('Message', backref='chat', lazy='dynamic',
                              cascade='all, delete-orphan')
     
     __table_args__ = (
         db.Index('idx_chat_user_date', 'user_id', 'created_at'),
+        db.Index('idx_chat_user_session', 'user_id', 'session_key'),
     )
 
 class Message(db.Model):
@@ -27,7 +32,9 @@ class Message(db.Model):
     content = db.Column(db.Text, nullable=False)
     role = db.Column(db.String(20), nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    token_count = db.Column(db.Integer)
     
     __table_args__ = (
         db.CheckConstraint(role.in_(['user', 'assistant']), name='valid_role'),
+        db.Index('idx_message_chat_time', 'chat_id', 'timestamp', 'id'),
     )
\ No newline at end of file
@@ -1,4 +1,6 @@
+from datetime import datetime
 from app import db
+from app.models.types import Float32Vector
 
 class Document(db.Model):
     __tablename__ = 'documents'
@@ -7,6 +9,18 @@ class Document(db.Model):
     title = db.Column(db.String(256), nullable=False)
     content = db.Column(db.Text, nullable=False)
     domain = db.Column(db.String(64), nullable=False)
-    embedding = db.Column(db.PickleType)
+    embedding = db.Column(Float32Vector)
     doc_metadata = db.Column(db.JSON)
-    created_at = db.Column(db.DateTime, server_default=db.func.now()) 
\ No newline at end of file
+    source_path = db.Column(db.String(512), index=True)
+    content_hash = db.Column(db.String(64), index=True)
+    # Firma MinHash (uint32) de los documentos canónicos, para detectar casi duplicados al ingerir
+    minhash = db.Column(db.LargeBinary)
+    created_at = db.Column(db.DateTime, server_default=db.func.now())
+    # Junto con el número de filas, marca de cambios por dominio que leen los workers (ver vector_index)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        # Filtro por dominio y paginación por id en el listado de documentos
+        db.Index('idx_document_domain', 'domain', 'id'),
+        db.Index('idx_document_domain_updated', 'domain', 'updated_at'),
+    ) 
\ No newline at end of file
@@ -0,0 +1,22 @@
+from app import db
+from app.models.types import Float32Vector
+
+class Passage(db.Model):
+    __tablename__ = 'passages'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    document_id = db.Column(db.Integer, db.ForeignKey('documents.id', ondelete='CASCADE'),
+                            nullable=False)
+    position = db.Column(db.Integer, nullable=False)
+    content = db.Column(db.Text, nullable=False)
+    start_offset = db.Column(db.Integer, nullable=False)
+    end_offset = db.Column(db.Integer, nullable=False)
+    token_count = db.Column(db.Integer, nullable=False)
+    embedding = db.Column(Float32Vector)
+    
+    document = db.relationship('Document', backref=db.backref(
+        'passages', order_by='Passage.position', cascade='all, delete-orphan', passive_deletes=True))
+    
+    __table_args__ = (
+        db.Index('idx_passage_document_position', 'document_id', 'position'),
+    )
@@ -0,0 +1,9 @@
+from datetime import datetime
+from app import db
+
+class ConsumedStreamToken(db.Model):
+    """Tokens de streaming ya usados; la clave primaria hace atómico el primer uso entre procesos."""
+    __tablename__ = 'consumed_stream_tokens'
+    
+    jti = db.Column(db.String(32), primary_key=True)
+    consumed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
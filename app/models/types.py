@@ -0,0 +1,21 @@
+import numpy as np
+from app import db
+
+EMBEDDING_DTYPE = np.dtype('<f4')
+
+class Float32Vector(db.TypeDecorator):
+    """Vector float32 almacenado como blob binario de tamaño fijo."""
+
+    impl = db.LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return np.asarray(value, dtype=EMBEDDING_DTYPE).ravel().tobytes()
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        # Vista de solo lectura sobre el buffer, sin copiar
+        return np.frombuffer(value, dtype=EMBEDDING_DTYPE)
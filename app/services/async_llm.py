@@ -0,0 +1,261 @@
+import asyncio
+import contextlib
+import os
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import TYPE_CHECKING, Any, AsyncIterator, Coroutine, Dict, List, Optional
+from flask import Flask
+
+if TYPE_CHECKING:
+    from ell import Message
+    from app.services.model_router import Endpoint
+
+def provider_for(model: str) -> str:
+    """Proveedor responsable de un modelo según su nombre."""
+    return 'anthropic' if model.startswith('claude') else 'openai'
+
+class AsyncLLMPool:
+    """Ejecuta llamadas a modelos en un event loop propio del proceso.
+
+    Los clientes HTTP asíncronos y los semáforos viven en un único loop en un
+    hilo dedicado, así que las vistas síncronas y las asíncronas de Flask
+    (que crean un loop por petición) comparten el pool de conexiones y los
+    límites de concurrencia global y por proveedor.
+    """
+
+    def __init__(self, app: Flask = None):
+        self.config: Dict[str, Any] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._clients: Dict[str, Any] = {}
+        self._global_limit: Optional[asyncio.Semaphore] = None
+        self._provider_limits: Dict[str, asyncio.Semaphore] = {}
+        self.in_flight = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask):
+        """Inicializa la extensión con la aplicación Flask."""
+        app.config.setdefault('LLM_MAX_CONCURRENCY', 256)
+        app.config.setdefault('LLM_PROVIDER_CONCURRENCY', {'openai': 128, 'anthropic': 64})
+        app.config.setdefault('LLM_TIMEOUT', 60)
+        app.config.setdefault('LLM_MAX_CONNECTIONS', 200)
+        app.config.setdefault('OPENAI_BASE_URL', None)
+
+        self.config = {
+            'max_concurrency': app.config['LLM_MAX_CONCURRENCY'],
+            'provider_concurrency': dict(app.config['LLM_PROVIDER_CONCURRENCY']),
+            'timeout': app.config['LLM_TIMEOUT'],
+            'max_connections': app.config['LLM_MAX_CONNECTIONS'],
+            'openai_api_key': app.config.get('OPENAI_API_KEY'),
+            'openai_base_url': app.config.get('OPENAI_BASE_URL'),
+            'anthropic_api_key': app.config.get('ANTHROPIC_API_KEY'),
+        }
+
+        if not hasattr(app, 'extensions'):
+            app.extensions = {}
+        app.extensions['async_llm'] = self
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        # Tras un fork el hilo del loop no existe en el hijo: se crea uno nuevo
+        if self._loop is None or self._pid != os.getpid():
+            with self._lock:
+                if self._loop is None or self._pid != os.getpid():
+                    loop = asyncio.new_event_loop()
+                    thread = threading.Thread(target=loop.run_forever, name='llm-pool', daemon=True)
+                    thread.start()
+                    self._loop, self._thread, self._pid = loop, thread, os.getpid()
+                    self._clients = {}
+                    self._global_limit = None
+                    self._provider_limits = {}
+        return self._loop
+
+    def _http_client(self, module):
+        import httpx
+        limits = httpx.Limits(max_connections=self.config['max_connections'],
+                              max_keepalive_connections=self.config['max_connections'])
+        return module.DefaultAsyncHttpxClient(limits=limits)
+
+    def _client(self, provider: str, endpoint: Optional['Endpoint'] = None):
+        key = (provider, endpoint.base_url, endpoint.api_key, endpoint.max_retries) if endpoint else provider
+        client = self._clients.get(key)
+        if client is None:
+            options = {}
+            if endpoint is not None:
+                options = {'api_key': endpoint.api_key, 'max_retries': endpoint.max_retries}
+            if provider == 'anthropic':
+                import anthropic
+                options.setdefault('api_key', self.config['anthropic_api_key'])
+                if endpoint is not None and endpoint.base_url:
+                    options['base_url'] = endpoint.base_url
+                client = anthropic.AsyncAnthropic(http_client=self._http_client(anthropic), **options)
+            else:
+                import openai
+                options.setdefault('api_key', self.config['openai_api_key'])
+                options['base_url'] = endpoint.base_url if endpoint is not None else self.config['openai_base_url']
+                client = openai.AsyncOpenAI(http_client=self._http_client(openai), **options)
+            self._clients[key] = client
+        return client
+
+    def _limits(self, provider: str):
+        if self._global_limit is None:
+            self._global_limit = asyncio.Semaphore(self.config['max_concurrency'])
+        limit = self._provider_limits.get(provider)
+        if limit is None:
+            size = self.config['provider_concurrency'].get(provider, self.config['max_concurrency'])
+            limit = self._provider_limits[provider] = asyncio.Semaphore(size)
+        return self._global_limit, limit
+
+    @contextlib.asynccontextmanager
+    async def _slot(self, provider: str, deadline: float):
+        """Cupo global y del proveedor; la espera termina con TimeoutError en deadline (hora del loop)."""
+        global_limit, provider_limit = self._limits(provider)
+        async with contextlib.AsyncExitStack() as stack:
+            async with asyncio.timeout_at(deadline):
+                await stack.enter_async_context(global_limit)
+                await stack.enter_async_context(provider_limit)
+            self.in_flight += 1
+            try:
+                yield
+            finally:
+                self.in_flight -= 1
+
+    async def _call(self, provider: str, messages: List['Message'], model: str,
+                    endpoint: Optional['Endpoint'] = None, **params) -> str:
+        from app.services.telemetry import telemetry
+
+        client = self._client(provider, endpoint)
+        started = time.perf_counter()
+        if provider == 'anthropic':
+            system = '\n'.join(m.text for m in messages if m.role == 'system')
+            response = await client.messages.create(
+                model=model,
+                system=system,
+                messages=[{'role': m.role, 'content': m.text} for m in messages if m.role != 'system'],
+                max_tokens=params.pop('max_tokens', 1024),
+                **params
+            )
+            telemetry.record_llm(provider, model, time.perf_counter() - started)
+            telemetry.record_tokens(model, response.usage.input_tokens, response.usage.output_tokens)
+            return ''.join(block.text for block in response.content if block.type == 'text')
+        response = await client.chat.completions.create(
+            model=model,
+            messages=[{'role': m.role, 'content': m.text} for m in messages],
+            **params
+        )
+        telemetry.record_llm(provider, model, time.perf_counter() - started)
+        if response.usage is not None:
+            telemetry.record_tokens(model, response.usage.prompt_tokens, response.usage.completion_tokens)
+        return response.choices[0].message.content or ''
+
+    async def complete(self, messages: List['Message'], model: str, timeout: Optional[float] = None,
+                       endpoint: Optional['Endpoint'] = None, **params) -> str:
+        """Corrutina que respeta los límites de concurrencia; debe ejecutarse en el loop del pool.
+
+        endpoint (ver model_router) fija proveedor, base_url y credenciales; sin él
+        se usa el cliente por defecto del proveedor del modelo.
+        """
+        provider = endpoint.provider if endpoint is not None else provider_for(model)
+        deadline = asyncio.get_running_loop().time() + (timeout or self.config['timeout'])
+        # El tiempo de espera por un cupo también cuenta para el timeout
+        async with asyncio.timeout_at(deadline):
+            async with self._slot(provider, deadline):
+                return await self._call(provider, messages, model, endpoint, **params)
+
+    async def _stream_call(self, provider: str, messages: List['Message'], model: str,
+                           endpoint: Optional['Endpoint'] = None, **params) -> AsyncIterator[str]:
+        from app.services.telemetry import telemetry
+
+        client = self._client(provider, endpoint)
+        started = time.perf_counter()
+        if provider == 'anthropic':
+            response = await client.messages.create(
+                model=model,
+                system='\n'.join(m.text for m in messages if m.role == 'system'),
+                messages=[{'role': m.role, 'content': m.text} for m in messages if m.role != 'system'],
+                max_tokens=params.pop('max_tokens', 1024),
+                stream=True,
+                **params
+            )
+        else:
+            response = await client.chat.completions.create(
+                model=model,
+                messages=[{'role': m.role, 'content': m.text} for m in messages],
+                stream=True,
+                stream_options={'include_usage': True},
+                **params
+            )
+        input_tokens = output_tokens = None
+        try:
+            async for event in response:
+                if provider == 'anthropic':
+                    if event.type == 'message_start':
+                        input_tokens = event.message.usage.input_tokens
+                    elif event.type == 'message_delta':
+                        output_tokens = event.usage.output_tokens
+                    elif event.type == 'content_block_delta' and event.delta.type == 'text_delta':
+                        yield event.delta.text
+                    continue
+                if event.usage is not None:
+                    input_tokens, output_tokens = event.usage.prompt_tokens, event.usage.completion_tokens
+                if event.choices and event.choices[0].delta.content:
+                    yield event.choices[0].delta.content
+        finally:
+            # Cerrar la conexión al proveedor si el cliente se desconecta
+            await response.close()
+            telemetry.record_llm(provider, model, time.perf_counter() - started)
+            if input_tokens is not None and output_tokens is not None:
+                telemetry.record_tokens(model, input_tokens, output_tokens)
+
+    async def stream(self, messages: List['Message'], model: str, timeout: Optional[float] = None,
+                     endpoint: Optional['Endpoint'] = None, **params) -> AsyncIterator[str]:
+        """Generador asíncrono de fragmentos que mantiene el cupo hasta cerrar el stream.
+
+        El timeout limita la espera por el cupo y el silencio entre fragmentos,
+        no la duración de la respuesta completa.
+        """
+        provider = endpoint.provider if endpoint is not None else provider_for(model)
+        timeout = timeout or self.config['timeout']
+        async with self._slot(provider, asyncio.get_running_loop().time() + timeout):
+            chunks = self._stream_call(provider, messages, model, endpoint, **params)
+            try:
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(anext(chunks), timeout)
+                    except StopAsyncIteration:
+                        return
+                    yield chunk
+            finally:
+                await chunks.aclose()
+
+    def submit(self, coro: Coroutine) -> Future:
+        """Programa una corrutina en el loop del pool."""
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+
+    async def acomplete(self, messages: List['Message'], model: str, timeout: Optional[float] = None,
+                        **params) -> str:
+        """Versión awaitable desde cualquier loop; cancelar la espera cancela la llamada al proveedor."""
+        self._ensure_loop()
+        future = self.submit(self.complete(messages, model, timeout=timeout, **params))
+        return await asyncio.wrap_future(future)
+
+    def complete_sync(self, messages: List['Message'], model: str, timeout: Optional[float] = None,
+                      **params) -> str:
+        """Versión bloqueante para vistas síncronas."""
+        self._ensure_loop()
+        timeout = timeout or self.config['timeout']
+        future = self.submit(self.complete(messages, model, timeout=timeout, **params))
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise TimeoutError(f"Sin respuesta de {model} tras {timeout} s")
+        except BaseException:
+            future.cancel()
+            raise
+
+# Instancia global del pool
+llm_pool = AsyncLLMPool()
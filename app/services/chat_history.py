@@ -0,0 +1,70 @@
+import base64
+from datetime import datetime
+from typing import List, Optional, Tuple
+from app import db
+from app.models.chat import Chat, Message
+from app.models.user import User
+
+DEFAULT_SESSION = 'default'
+
+def resolve_user(identity) -> User:
+    """Usuario de una identidad JWT: id numérico o nombre de usuario (p. ej. widget_user)."""
+    identity = str(identity)
+    user = db.session.get(User, int(identity)) if identity.isdigit() else \
+        User.query.filter_by(username=identity).first()
+    if user is None and not identity.isdigit():
+        # Usuario técnico para identidades sin registro, como el widget embebido
+        user = User(username=identity, email=f"{identity}@localhost", is_active=True)
+        db.session.add(user)
+        db.session.commit()
+    return user
+
+def get_or_create_chat(user_id: int, session_key: Optional[str] = None,
+                       domain: Optional[str] = None) -> Chat:
+    """Chat activo de un usuario para una sesión."""
+    session_key = session_key or DEFAULT_SESSION
+    chat = Chat.query.filter_by(user_id=user_id, session_key=session_key) \
+        .order_by(Chat.created_at.desc()).first()
+    if chat is None:
+        chat = Chat(user_id=user_id, session_key=session_key, domain=domain)
+        db.session.add(chat)
+        db.session.commit()
+    return chat
+
+def record_exchange(chat_id: int, user_text: str, assistant_text: str):
+    """Guarda la pregunta y la respuesta en una sola transacción, con su conteo de tokens."""
+    from app.services.chunking import count_tokens
+
+    now = datetime.utcnow()
+    db.session.add_all([
+        Message(chat_id=chat_id, role='user', content=user_text, timestamp=now,
+                token_count=count_tokens(user_text)),
+        Message(chat_id=chat_id, role='assistant', content=assistant_text, timestamp=now,
+                token_count=count_tokens(assistant_text)),
+    ])
+    db.session.query(Chat).filter_by(id=chat_id).update({'updated_at': now})
+    db.session.commit()
+
+def encode_cursor(message: Message) -> str:
+    raw = f"{message.timestamp.isoformat()}|{message.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    timestamp, message_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+    return datetime.fromisoformat(timestamp), int(message_id)
+
+def page(chat_id: int, before: Optional[str] = None, limit: int = 20) -> Tuple[List[Message], Optional[str]]:
+    """Página de mensajes anteriores al cursor usando keyset sobre (chat_id, timestamp, id).
+
+    Retorna los mensajes en orden cronológico y el cursor de la página anterior,
+    o None si no hay más.
+    """
+    query = Message.query.filter(Message.chat_id == chat_id)
+    if before:
+        timestamp, message_id = decode_cursor(before)
+        query = query.filter(db.tuple_(Message.timestamp, Message.id) < (timestamp, message_id))
+    rows = query.order_by(Message.timestamp.desc(), Message.id.desc()).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    rows.reverse()
+    return rows, (encode_cursor(rows[0]) if has_more and rows else None)
@@ -0,0 +1,91 @@
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Dict, List
+
+if TYPE_CHECKING:
+    import tiktoken
+
+DEFAULT_ENCODING = 'o200k_base'
+# Caracteres en los que se prefiere cortar un fragmento, de mayor a menor prioridad
+BOUNDARIES = ('\n\n', '\n', '. ', '? ', '! ', '; ', ', ', ' ')
+
+@lru_cache(maxsize=8)
+def get_encoding(model: str = None) -> 'tiktoken.Encoding':
+    """Tokenizador del modelo, cargado una sola vez por proceso."""
+    import tiktoken
+
+    if model:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            pass
+    return tiktoken.get_encoding(DEFAULT_ENCODING)
+
+def count_tokens(text: str, model: str = None) -> int:
+    """Cuenta los tokens de un texto."""
+    return len(get_encoding(model).encode(text, disallowed_special=()))
+
+def _boundary_before(text: str, end: int, min_end: int) -> int:
+    """Última frontera natural dentro de text[min_end:end], o end si no hay ninguna."""
+    for boundary in BOUNDARIES:
+        position = text.rfind(boundary, min_end, end)
+        if position != -1:
+            return position + len(boundary)
+    return end
+
+def chunk_text(text: str, max_tokens: int = 300, overlap_tokens: int = 0,
+               model: str = None) -> List[Dict[str, Any]]:
+    """Divide el texto en pasajes de hasta max_tokens con offsets de caracteres.
+
+    Los cortes se alinean con la frontera natural más cercana (párrafo, línea,
+    oración, palabra) dentro del último cuarto de cada ventana de tokens.
+    """
+    encoding = get_encoding(model)
+    tokens = encoding.encode(text, disallowed_special=())
+    if not tokens:
+        return []
+    _, offsets = encoding.decode_with_offsets(tokens)
+    offsets.append(len(text))
+
+    passages = []
+    token_start = 0
+    while token_start < len(tokens):
+        token_end = min(token_start + max_tokens, len(tokens))
+        start = offsets[token_start]
+        end = offsets[token_end]
+        if token_end < len(tokens):
+            min_end = offsets[token_start + (3 * (token_end - token_start)) // 4]
+            end = _boundary_before(text, end, min_end)
+            # Retroceder hasta el token que contiene la frontera elegida
+            while token_end > token_start + 1 and offsets[token_end - 1] >= end:
+                token_end -= 1
+            end = offsets[token_end]
+        content = text[start:end]
+        if content.strip():
+            passages.append({
+                'content': content,
+                'start_offset': start,
+                'end_offset': end,
+                'token_count': token_end - token_start
+            })
+        if token_end >= len(tokens):
+            break
+        token_start = max(token_end - overlap_tokens, token_start + 1)
+    return passages
+
+def chunk_segments(text: str, segments: List[Dict[str, Any]], max_tokens: int = 300,
+                   overlap_tokens: int = 0, model: str = None) -> List[Dict[str, Any]]:
+    """Como chunk_text, pero sin que un pasaje cruce el límite de una página o sección.
+
+    segments son rangos de text con start_offset/end_offset (ver extractors).
+    """
+    if not segments:
+        return chunk_text(text, max_tokens=max_tokens, overlap_tokens=overlap_tokens, model=model)
+    passages = []
+    for segment in segments:
+        start = segment['start_offset']
+        for passage in chunk_text(text[start:segment['end_offset']], max_tokens=max_tokens,
+                                  overlap_tokens=overlap_tokens, model=model):
+            passage['start_offset'] += start
+            passage['end_offset'] += start
+            passages.append(passage)
+    return passages
@@ -0,0 +1,40 @@
+import threading
+from typing import TYPE_CHECKING, Any, Dict
+from flask import current_app
+
+if TYPE_CHECKING:
+    from openai import OpenAI
+    from app.services.model_router import Endpoint
+
+_openai_client = None
+_endpoint_clients: Dict[tuple, Any] = {}
+_lock = threading.Lock()
+
+def get_openai_client() -> 'OpenAI':
+    """Retorna un cliente OpenAI compartido por el proceso."""
+    global _openai_client
+    if _openai_client is None:
+        from openai import OpenAI
+        _openai_client = OpenAI(api_key=current_app.config.get('OPENAI_API_KEY'),
+                                base_url=current_app.config.get('OPENAI_BASE_URL'))
+    return _openai_client
+
+def get_client(endpoint: 'Endpoint') -> Any:
+    """Cliente síncrono (OpenAI o Anthropic) de un endpoint del router, compartido por el proceso."""
+    key = (endpoint.provider, endpoint.base_url, endpoint.api_key, endpoint.max_retries)
+    client = _endpoint_clients.get(key)
+    if client is None:
+        with _lock:
+            client = _endpoint_clients.get(key)
+            if client is None:
+                options = {'api_key': endpoint.api_key, 'max_retries': endpoint.max_retries}
+                if endpoint.base_url:
+                    options['base_url'] = endpoint.base_url
+                if endpoint.provider == 'anthropic':
+                    from anthropic import Anthropic
+                    client = Anthropic(**options)
+                else:
+                    from openai import OpenAI
+                    client = OpenAI(**options)
+                _endpoint_clients[key] = client
+    return client
@@ -0,0 +1,239 @@
+import asyncio
+import hashlib
+import json
+import threading
+import weakref
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Iterator, List
+from app.services.llm_cache import normalize_value
+
+def request_key(model: str, messages: Any, **params) -> str:
+    """Clave de coalescencia: modelo, parámetros y lista de mensajes normalizada."""
+    payload = json.dumps({
+        'model': model,
+        'params': normalize_value(params),
+        'messages': normalize_value(messages)
+    }, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class _Broadcast:
+    """Reparte los fragmentos de un stream a varios consumidores.
+
+    No hay un hilo productor: el consumidor que necesita un fragmento aún no
+    recibido lo lee del stream original bajo un candado. Así el stream sigue
+    avanzando aunque el primer consumidor se desconecte, y se cierra cuando
+    no queda ninguno. on_done se llama al terminar, para que nadie más se
+    una a una respuesta ya completa.
+    """
+
+    def __init__(self, stream, on_done: Callable[['_Broadcast'], None] = None):
+        self.stream = stream
+        self.on_done = on_done
+        self.iterator = None
+        self.chunks: List[str] = []
+        self.done = False
+        self.error = None
+        self.consumers = 0
+        self.producer = threading.Lock()
+        self.changed = threading.Condition()
+
+    def _pull(self):
+        try:
+            if self.iterator is None:
+                self.iterator = iter(self.stream)
+            chunk = next(self.iterator)
+            with self.changed:
+                self.chunks.append(chunk)
+                self.changed.notify_all()
+        except StopIteration:
+            self._finish()
+        except Exception as e:
+            self._finish(e)
+
+    def _finish(self, error: Exception = None):
+        with self.changed:
+            self.done = True
+            self.error = error
+            self.changed.notify_all()
+        if self.on_done is not None:
+            self.on_done(self)
+
+    def consume(self) -> Iterator[str]:
+        position = 0
+        while True:
+            with self.changed:
+                if position < len(self.chunks):
+                    chunk = self.chunks[position]
+                    position += 1
+                elif self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                else:
+                    chunk = None
+            if chunk is not None:
+                yield chunk
+            elif self.producer.acquire(blocking=False):
+                try:
+                    if position >= len(self.chunks) and not self.done:
+                        self._pull()
+                finally:
+                    self.producer.release()
+            else:
+                with self.changed:
+                    if position >= len(self.chunks) and not self.done:
+                        self.changed.wait(0.05)
+
+    def close(self):
+        if self.iterator is not None and hasattr(self.iterator, 'close'):
+            with self.producer:
+                self.iterator.close()
+
+class SharedStream:
+    """Vista de un consumidor sobre un stream compartido; expone timings() del original.
+
+    El consumidor se da de baja al terminar de iterar, con close() o, si nunca
+    se llegó a iterar (p. ej. el cliente se desconectó antes), al recolectarse.
+    """
+
+    def __init__(self, flight: 'SingleFlight', key: str, broadcast: _Broadcast):
+        self._broadcast = broadcast
+        self._release = weakref.finalize(self, flight._release_stream, key, broadcast)
+
+    def __iter__(self) -> Iterator[str]:
+        try:
+            yield from self._broadcast.consume()
+        finally:
+            self._release()
+
+    def close(self):
+        self._release()
+
+    @property
+    def text(self) -> str:
+        return ''.join(self._broadcast.chunks)
+
+    def timings(self) -> Dict[str, Any]:
+        timings = getattr(self._broadcast.stream, 'timings', None)
+        return timings() if timings else {}
+
+class _Flight:
+    """Llamada en curso compartida por sus receptores."""
+
+    def __init__(self):
+        self.future = Future()
+        self.source = None
+        self.waiters = 0
+
+class SingleFlight:
+    """Coalescencia de llamadas idénticas en curso: una llamada al proveedor, varios receptores."""
+
+    def __init__(self):
+        self._calls: Dict[str, _Flight] = {}
+        self._streams: Dict[str, _Broadcast] = {}
+        self._lock = threading.Lock()
+        self._counters = {'calls': 0, 'coalesced': 0}
+
+    def _join(self, key: str, start: Callable[[], Future]) -> _Flight:
+        with self._lock:
+            flight = self._calls.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._calls[key] = _Flight()
+            flight.waiters += 1
+            self._counters['calls' if leader else 'coalesced'] += 1
+        if leader:
+            try:
+                flight.source = start()
+            except BaseException as e:
+                self._settle(key, flight, error=e)
+                raise
+            flight.source.add_done_callback(lambda done: self._chain(key, flight, done))
+        return flight
+
+    def _chain(self, key: str, flight: _Flight, done: Future):
+        if done.cancelled():
+            self._settle(key, flight, error=asyncio.CancelledError())
+        elif done.exception() is not None:
+            self._settle(key, flight, error=done.exception())
+        else:
+            self._settle(key, flight, result=done.result())
+
+    def _settle(self, key: str, flight: _Flight, result: Any = None, error: BaseException = None):
+        with self._lock:
+            if self._calls.get(key) is flight:
+                del self._calls[key]
+        if flight.future.done():
+            return
+        if error is not None:
+            flight.future.set_exception(error)
+        else:
+            flight.future.set_result(result)
+
+    def _leave(self, flight: _Flight):
+        """Un receptor abandona la espera; si era el último se cancela la llamada original."""
+        with self._lock:
+            flight.waiters -= 1
+            abandoned = flight.waiters == 0
+        if abandoned and flight.source is not None and not flight.future.done():
+            flight.source.cancel()
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        """Ejecuta fn una sola vez por clave entre las llamadas concurrentes y comparte el resultado."""
+        def start() -> Future:
+            source = Future()
+            try:
+                source.set_result(fn())
+            except Exception as e:
+                source.set_exception(e)
+            return source
+        flight = self._join(key, start)
+        try:
+            return flight.future.result()
+        finally:
+            self._leave(flight)
+
+    async def ado(self, key: str, start: Callable[[], Future]) -> Any:
+        """Versión asíncrona: start retorna un concurrent Future (p. ej. del pool de LLM).
+
+        Cancelar a un receptor no afecta a los demás; la llamada original sólo se
+        cancela cuando ya no queda nadie esperándola.
+        """
+        flight = self._join(key, start)
+        try:
+            return await asyncio.shield(asyncio.wrap_future(flight.future))
+        finally:
+            self._leave(flight)
+
+    def stream(self, key: str, factory: Callable[[], Any]) -> SharedStream:
+        """Comparte un stream de tokens entre peticiones idénticas concurrentes."""
+        with self._lock:
+            broadcast = self._streams.get(key)
+            leader = broadcast is None
+            if leader:
+                broadcast = self._streams[key] = _Broadcast(
+                    factory(), on_done=lambda done: self._forget_stream(key, done))
+            broadcast.consumers += 1
+            self._counters['calls' if leader else 'coalesced'] += 1
+        return SharedStream(self, key, broadcast)
+
+    def _forget_stream(self, key: str, broadcast: _Broadcast):
+        with self._lock:
+            if self._streams.get(key) is broadcast:
+                del self._streams[key]
+
+    def _release_stream(self, key: str, broadcast: _Broadcast):
+        with self._lock:
+            broadcast.consumers -= 1
+            last = broadcast.consumers == 0
+        if last:
+            self._forget_stream(key, broadcast)
+            if not broadcast.done:
+                broadcast.close()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counters, saved=self._counters['coalesced'])
+
+# Instancia global del coalescedor
+single_flight = SingleFlight()
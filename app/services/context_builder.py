@@ -0,0 +1,248 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence
+import numpy as np
+from flask import current_app
+from app import db
+from app.models.chat import Chat, Message
+from app.models.document import Document
+from app.models.passage import Passage
+from app.services.lazy import lazy_ell
+from config import Config
+
+if TYPE_CHECKING:
+    import ell
+
+# Tokens reservados por mensaje para el formato del chat (rol, separadores)
+MESSAGE_OVERHEAD_TOKENS = 4
+SUMMARY_BATCH_LIMIT = 200
+# Rondas por actualización: un resumen más largo puede sacar otros turnos de la ventana
+SUMMARY_MAX_ROUNDS = 3
+
+_summary_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='chat-summary')
+# Chats con una actualización del resumen en curso en este proceso
+_summarizing = set()
+_summarizing_lock = threading.Lock()
+
+def rank_passages(query_vector: np.ndarray, document_ids: Sequence[int]) -> List[Dict[str, Any]]:
+    """Ordena por similitud coseno los pasajes de los documentos candidatos."""
+    if not document_ids:
+        return []
+    rows = (db.session.query(Passage.id, Passage.document_id, Passage.position, Passage.content,
+                             Passage.start_offset, Passage.end_offset, Passage.token_count,
+                             Passage.embedding, Document.title, Document.domain)
+            .join(Document, Document.id == Passage.document_id)
+            .filter(Passage.document_id.in_(list(document_ids)))
+            .filter(Passage.embedding.isnot(None))
+            .all())
+    if not rows:
+        return []
+
+    matrix = np.vstack([row.embedding for row in rows])
+    norms = np.linalg.norm(matrix, axis=1) * (np.linalg.norm(query_vector) or 1.0)
+    scores = (matrix @ query_vector) / np.where(norms == 0, 1.0, norms)
+    return [
+        {
+            'id': rows[i].id,
+            'document_id': rows[i].document_id,
+            'title': rows[i].title,
+            'domain': rows[i].domain,
+            'position': rows[i].position,
+            'content': rows[i].content,
+            'start_offset': rows[i].start_offset,
+            'end_offset': rows[i].end_offset,
+            'token_count': rows[i].token_count,
+            'score': float(scores[i])
+        }
+        for i in np.argsort(-scores)
+    ]
+
+def pack_passages(passages: List[Dict[str, Any]], token_budget: int) -> List[Dict[str, Any]]:
+    """Selecciona en orden de relevancia los pasajes que caben en el presupuesto de tokens.
+
+    Usa el token_count almacenado, por lo que no se tokeniza nada en la petición.
+    El resultado se reordena por documento y posición para conservar la lectura.
+    """
+    selected, used = [], 0
+    for passage in passages:
+        if used + passage['token_count'] > token_budget:
+            continue
+        selected.append(passage)
+        used += passage['token_count']
+    return sorted(selected, key=lambda p: (p['document_id'], p['position']))
+
+def cite_passages(passages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Agrega la página o sección de cada pasaje según la procedencia guardada en doc_metadata."""
+    from app.services.extractors import locate
+
+    if not passages:
+        return passages
+    metadata = dict(db.session.query(Document.id, Document.doc_metadata)
+                    .filter(Document.id.in_({p['document_id'] for p in passages})))
+    for passage in passages:
+        segments = ((metadata.get(passage['document_id']) or {}).get('provenance') or {}).get('segments')
+        segment = locate(segments, passage['start_offset']) if segments else None
+        if segment is not None:
+            passage.update({key: segment[key] for key in ('page', 'section') if segment.get(key)})
+    return passages
+
+def _citation(passage: Dict[str, Any]) -> str:
+    if passage.get('page'):
+        return f"p. {passage['page']}"
+    if passage.get('section'):
+        return passage['section']
+    return f"{passage['start_offset']}-{passage['end_offset']}"
+
+def format_passages(passages: List[Dict[str, Any]]) -> str:
+    """Formatea los pasajes seleccionados como contexto citando su origen."""
+    return "\n\n".join(
+        f"[{p['title']} · {_citation(p)}] ({p['domain']})\n{p['content']}"
+        for p in passages
+    )
+
+def message_tokens(message: Message) -> int:
+    """Tokens de un mensaje según el conteo almacenado; estima si es un registro antiguo sin conteo."""
+    count = message.token_count if message.token_count is not None else len(message.content) // 4
+    return count + MESSAGE_OVERHEAD_TOKENS
+
+def history_budget(model: str) -> int:
+    budgets = current_app.config.get('CONTEXT_TOKEN_BUDGETS', {})
+    return budgets.get(model, budgets.get('default', 3000))
+
+def recent_budget(chat: Chat, model: str) -> int:
+    """Tokens para los turnos recientes: el presupuesto del modelo menos lo que ocupa el resumen.
+
+    assemble_history y update_summary usan el mismo, así que cada turno está
+    en el resumen o en la ventana reciente, nunca en ambos ni en ninguno.
+    """
+    budget = history_budget(model)
+    if chat.summary:
+        budget -= (chat.summary_tokens or len(chat.summary) // 4) + MESSAGE_OVERHEAD_TOKENS
+    return max(budget, 0)
+
+def _whole_turns(selected: List[Message]) -> List[Message]:
+    """Pasa a orden cronológico sin dejar al inicio una respuesta cuya pregunta no cupo."""
+    selected.reverse()
+    while selected and selected[0].role != 'user':
+        selected.pop(0)
+    return selected
+
+def select_recent(chat_id: int, budget: int, after_id: Optional[int] = None,
+                  batch_size: int = 50) -> List[Message]:
+    """Turnos posteriores a after_id que caben en el presupuesto, en orden cronológico y por pares completos."""
+    selected, used = [], 0
+    query = Message.query.filter(Message.chat_id == chat_id)
+    if after_id:
+        query = query.filter(Message.id > after_id)
+    query = query.order_by(Message.timestamp.desc(), Message.id.desc())
+    offset_cursor = None
+    while True:
+        page_query = query
+        if offset_cursor is not None:
+            page_query = page_query.filter(db.tuple_(Message.timestamp, Message.id) < offset_cursor)
+        rows = page_query.limit(batch_size).all()
+        for message in rows:
+            tokens = message_tokens(message)
+            if used + tokens > budget:
+                return _whole_turns(selected)
+            selected.append(message)
+            used += tokens
+        if len(rows) < batch_size:
+            selected.reverse()
+            return selected
+        offset_cursor = (rows[-1].timestamp, rows[-1].id)
+
+def assemble_history(chat_id: int, model: Optional[str] = None) -> List['ell.Message']:
+    """Historial para el prompt: resumen acumulado de los turnos antiguos más los recientes que caben.
+
+    El resumen ocupa parte del presupuesto; el resto se llena con los turnos más
+    recientes aún no resumidos usando los conteos de tokens almacenados, sin
+    volver a tokenizar.
+    """
+    import ell
+
+    model = model or current_app.config['DEFAULT_MODEL']
+    chat = db.session.get(Chat, chat_id)
+    if chat is None:
+        return []
+    history = []
+    if chat.summary:
+        history.append(ell.system(f"Resumen de la conversación anterior:\n{chat.summary}"))
+    for message in select_recent(chat_id, recent_budget(chat, model), after_id=chat.summary_until_id):
+        history.append(ell.user(message.content) if message.role == 'user'
+                       else ell.assistant(message.content))
+    return history
+
+@lazy_ell.simple(model=Config.SUMMARY_MODEL, temperature=0.0)
+def summarize_turns(previous_summary: str, transcript: str):
+    """You maintain a concise running summary of a conversation. Keep facts, decisions and open questions. Answer in the conversation's language."""
+    return (f"Current summary:\n{previous_summary or '(empty)'}\n\n"
+            f"New turns to fold in:\n{transcript}\n\nReturn the updated summary.")
+
+def update_summary(chat_id: int, model: Optional[str] = None) -> bool:
+    """Incorpora al resumen los turnos aún no resumidos que ya no caben en la ventana de assemble_history.
+
+    Si otra actualización del mismo chat está en curso en este proceso no se
+    hace nada: los turnos pendientes entran en la siguiente. Entre procesos, el
+    resumen sólo se guarda si summary_until_id no cambió mientras se generaba.
+    """
+    with _summarizing_lock:
+        if chat_id in _summarizing:
+            return False
+        _summarizing.add(chat_id)
+    try:
+        folded = False
+        for _ in range(SUMMARY_MAX_ROUNDS):
+            if not _update_summary(chat_id, model):
+                break
+            folded = True
+        return folded
+    finally:
+        with _summarizing_lock:
+            _summarizing.discard(chat_id)
+
+def _update_summary(chat_id: int, model: Optional[str] = None) -> bool:
+    from app.services.chunking import count_tokens
+
+    model = model or current_app.config['DEFAULT_MODEL']
+    chat = db.session.get(Chat, chat_id)
+    if chat is None:
+        return False
+    recent = select_recent(chat_id, recent_budget(chat, model), after_id=chat.summary_until_id)
+    query = Message.query.filter(Message.chat_id == chat_id)
+    if recent:
+        query = query.filter(db.tuple_(Message.timestamp, Message.id) < (recent[0].timestamp, recent[0].id))
+    if chat.summary_until_id:
+        query = query.filter(Message.id > chat.summary_until_id)
+    dropped = query.order_by(Message.timestamp, Message.id).limit(SUMMARY_BATCH_LIMIT).all()
+    if not dropped:
+        return False
+    transcript = "\n".join(f"{m.role}: {m.content}" for m in dropped)
+    previous_until = chat.summary_until_id
+    summary = summarize_turns(chat.summary or '', transcript)
+    # Compare-and-set: otra actualización pudo incorporar ya estos turnos
+    updated = Chat.query.filter(Chat.id == chat_id,
+                                Chat.summary_until_id == previous_until if previous_until is not None
+                                else Chat.summary_until_id.is_(None)) \
+        .update({'summary': summary, 'summary_tokens': count_tokens(summary),
+                 'summary_until_id': dropped[-1].id}, synchronize_session=False)
+    db.session.commit()
+    return bool(updated)
+
+def shutdown_summaries(wait: bool = True):
+    """Detiene el ejecutor de resúmenes, esperando por defecto a las actualizaciones en curso."""
+    _summary_executor.shutdown(wait=wait)
+
+def schedule_summary_update(chat_id: int, model: Optional[str] = None):
+    """Actualiza el resumen en segundo plano, fuera del camino de la petición."""
+    app = current_app._get_current_object()
+
+    def run():
+        with app.app_context():
+            try:
+                update_summary(chat_id, model)
+            except Exception as e:
+                app.logger.error(f"Error actualizando resumen del chat {chat_id}: {str(e)}")
+                db.session.rollback()
+
+    _summary_executor.submit(run)
@@ -0,0 +1,114 @@
+import re
+import zlib
+from typing import Dict, Hashable, List, Optional, Set, Tuple
+import numpy as np
+
+# Primo de Mersenne 2^61 - 1 para el hashing universal (a·x + b) mod p
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64((1 << 32) - 1)
+SHINGLE_BLOCK = 2048
+
+def shingles(text: str, size: int = 5) -> Set[int]:
+    """Hashes estables (CRC32) de los n-gramas de palabras del texto normalizado."""
+    words = re.findall(r'\w+', text.lower())
+    if len(words) < size:
+        return {zlib.crc32(' '.join(words).encode('utf-8'))} if words else set()
+    return {zlib.crc32(' '.join(words[i:i + size]).encode('utf-8')) for i in range(len(words) - size + 1)}
+
+class MinHasher:
+    """Firmas MinHash con num_perm permutaciones deterministas (iguales en todos los procesos)."""
+
+    def __init__(self, num_perm: int = 128, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        # a, b < 2^32 para que a·x + b no desborde uint64 con x < 2^32
+        self.a = rng.integers(1, MAX_HASH, num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, MAX_HASH, num_perm, dtype=np.uint64)
+        self.num_perm = num_perm
+
+    def signature(self, hashes: Set[int]) -> np.ndarray:
+        signature = np.full(self.num_perm, MAX_HASH, dtype=np.uint64)
+        values = np.fromiter(hashes, dtype=np.uint64, count=len(hashes))
+        # Por bloques: la matriz temporal es num_perm × SHINGLE_BLOCK
+        for start in range(0, len(values), SHINGLE_BLOCK):
+            block = values[start:start + SHINGLE_BLOCK]
+            permuted = ((self.a[:, None] * block[None, :] + self.b[:, None]) % MERSENNE_PRIME) & MAX_HASH
+            np.minimum(signature, permuted.min(axis=1), out=signature)
+        return signature.astype(np.uint32)
+
+def similarity(first: np.ndarray, second: np.ndarray) -> float:
+    """Jaccard estimado: fracción de posiciones iguales de dos firmas."""
+    return float(np.count_nonzero(first == second)) / len(first)
+
+def lsh_params(threshold: float, num_perm: int, false_positive_weight: float = 0.1) -> Tuple[int, int]:
+    """(bandas, filas) que minimizan el área de falsos positivos y negativos alrededor de threshold.
+
+    Los falsos negativos pesan más: un candidato de más sólo cuesta comparar
+    dos firmas, mientras que un duplicado no detectado se indexa otra vez.
+    """
+    below = np.linspace(0, threshold, 100)
+    above = np.linspace(threshold, 1, 100)
+    best, best_error = (1, num_perm), None
+    for bands in range(1, num_perm + 1):
+        for rows in range(1, num_perm // bands + 1):
+            false_positive = (1 - (1 - below ** rows) ** bands).mean() * threshold
+            false_negative = ((1 - above ** rows) ** bands).mean() * (1 - threshold)
+            error = false_positive_weight * false_positive + (1 - false_positive_weight) * false_negative
+            if best_error is None or error < best_error:
+                best, best_error = (bands, rows), error
+    return best
+
+class MinHashLSH:
+    """Índice LSH por bandas: cada consulta sólo compara contra los documentos que comparten una banda.
+
+    Insertar y consultar cuestan O(bandas), así que deduplicar un corpus es
+    aproximadamente lineal en vez de comparar todos los pares.
+    """
+
+    def __init__(self, threshold: float = 0.85, num_perm: int = 128):
+        self.threshold = threshold
+        self.bands, self.rows = lsh_params(threshold, num_perm)
+        self._buckets: List[Dict[bytes, Set[Hashable]]] = [{} for _ in range(self.bands)]
+        self._signatures: Dict[Hashable, np.ndarray] = {}
+
+    def _keys(self, signature: np.ndarray) -> List[bytes]:
+        return [signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(self.bands)]
+
+    def insert(self, key: Hashable, signature: np.ndarray):
+        self.remove(key)
+        self._signatures[key] = signature
+        for buckets, band in zip(self._buckets, self._keys(signature)):
+            buckets.setdefault(band, set()).add(key)
+
+    def remove(self, key: Hashable):
+        signature = self._signatures.pop(key, None)
+        if signature is None:
+            return
+        for buckets, band in zip(self._buckets, self._keys(signature)):
+            members = buckets.get(band)
+            if members is not None:
+                members.discard(key)
+                if not members:
+                    del buckets[band]
+
+    def rename(self, key: Hashable, new_key: Hashable):
+        """Cambia la clave de una firma ya insertada (p. ej. un id provisional por el definitivo)."""
+        signature = self._signatures.get(key)
+        if signature is not None:
+            self.remove(key)
+            self.insert(new_key, signature)
+
+    def match(self, signature: np.ndarray, exclude: Optional[Hashable] = None) -> Optional[Tuple[Hashable, float]]:
+        """Documento más parecido con similitud estimada >= threshold, o None."""
+        candidates = set()
+        for buckets, band in zip(self._buckets, self._keys(signature)):
+            candidates.update(buckets.get(band, ()))
+        candidates.discard(exclude)
+        best = None
+        for key in candidates:
+            score = similarity(signature, self._signatures[key])
+            if score >= self.threshold and (best is None or score > best[1]):
+                best = (key, score)
+        return best
+
+    def __len__(self):
+        return len(self._signatures)
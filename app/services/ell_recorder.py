@@ -0,0 +1,103 @@
+import atexit
+import threading
+from typing import Any, Dict
+from flask import Flask
+
+RECORDING_MODES = ('async', 'sync', 'off')
+
+class EllRecorder:
+    """Configura ell una sola vez por proceso según ELL_RECORDING.
+
+    - ``async``: invocaciones en cola, escritas por lotes en segundo plano.
+    - ``sync``: escritura directa en el store (comportamiento original de ell).
+    - ``off``: no se registra nada.
+
+    init_app sólo guarda la configuración: ell se importa e inicializa con
+    ensure_initialized al definir el primer LMP o durante la precarga.
+    """
+
+    def __init__(self, app: Flask = None):
+        self.store = None
+        self.settings: Dict[str, Any] = {}
+        self._initialized = False
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask):
+        """Inicializa la extensión con la aplicación Flask."""
+        app.config.setdefault('ELL_STORE_PATH', './ell_store')
+        app.config.setdefault('ELL_VERBOSE', False)
+        app.config.setdefault('ELL_RECORDING', 'async')
+        app.config.setdefault('ELL_RECORD_SAMPLE_RATE', 1.0)
+        app.config.setdefault('ELL_RECORD_MAX_PENDING', 10000)
+        app.config.setdefault('ELL_RECORD_BATCH_SIZE', 200)
+        app.config.setdefault('ELL_RECORD_FLUSH_INTERVAL', 1.0)
+
+        if app.config['ELL_RECORDING'] not in RECORDING_MODES:
+            raise ValueError(f"Modo de registro de ell desconocido: {app.config['ELL_RECORDING']}")
+        # La primera aplicación del proceso define la configuración de ell
+        if not self.settings:
+            self.settings = {
+                'store_path': app.config['ELL_STORE_PATH'],
+                'verbose': app.config['ELL_VERBOSE'],
+                'mode': app.config['ELL_RECORDING'],
+                'sample_rate': app.config['ELL_RECORD_SAMPLE_RATE'],
+                'max_pending': app.config['ELL_RECORD_MAX_PENDING'],
+                'batch_size': app.config['ELL_RECORD_BATCH_SIZE'],
+                'flush_interval': app.config['ELL_RECORD_FLUSH_INTERVAL'],
+            }
+
+        if not hasattr(app, 'extensions'):
+            app.extensions = {}
+        app.extensions['ell_recorder'] = self
+
+    def ensure_initialized(self):
+        """Ejecuta ell.init una sola vez por proceso."""
+        if self._initialized or not self.settings:
+            return
+        with self._lock:
+            if self._initialized:
+                return
+            import ell
+            self.store = self._create_store()
+            ell.init(store=self.store, verbose=self.settings['verbose'], autocommit=True)
+            if self._write_behind():
+                atexit.register(self.store.close)
+            self._initialized = True
+
+    def _create_store(self):
+        mode = self.settings['mode']
+        if mode == 'off':
+            return None
+        from ell.stores.sql import SQLiteStore
+        store = SQLiteStore(self.settings['store_path'])
+        if mode == 'sync':
+            return store
+        from app.services.ell_store import WriteBehindStore
+        return WriteBehindStore(store,
+                                max_pending=self.settings['max_pending'],
+                                batch_size=self.settings['batch_size'],
+                                flush_interval=self.settings['flush_interval'],
+                                sample_rate=self.settings['sample_rate'])
+
+    def _write_behind(self) -> bool:
+        if self.store is None:
+            return False
+        from app.services.ell_store import WriteBehindStore
+        return isinstance(self.store, WriteBehindStore)
+
+    def flush(self):
+        if self._write_behind():
+            self.store.flush()
+
+    def close(self):
+        """Vacía la cola de escritura diferida y detiene su hilo."""
+        if self._write_behind():
+            self.store.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return self.store.stats() if self._write_behind() else {}
+
+# Instancia global del registro de invocaciones
+ell_recorder = EllRecorder()
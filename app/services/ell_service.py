@@ -1,8 +1,13 @@
-import ell
-from typing import List, Dict, Any
+import asyncio
+from typing import TYPE_CHECKING, List, Dict, Any, Tuple, Union
 from flask import current_app, Flask
-from PIL import Image
-from ell import Message, ContentBlock
+from app.services.lazy import lazy_ell
+from app.services.llm_cache import llm_cache
+from app.services.tools import search_documents
+
+if TYPE_CHECKING:
+    from PIL import Image
+    from ell import Message
 
 class EllService:
     def __init__(self, app: Flask = None):
@@ -20,8 +25,9 @@ class EllService:
         
         self.store_path = app.config['ELL_STORE_PATH']
         
-        # Inicializar ell con almacenamiento y autocommit
-        ell.init(store=self.store_path, autocommit=True, verbose=True)
+        # ell se inicializa una sola vez mediante el registro de invocaciones
+        from app.services.ell_recorder import ell_recorder
+        ell_recorder.init_app(app)
         
         # Inicializar LMPs
         self.lmps = self._create_lmps(app)
@@ -40,14 +46,64 @@ class EllService:
 
     @staticmethod
     def _create_basic_lmp(app):
-        @ell.simple(model=app.config['DEFAULT_MODEL'])
+        @llm_cache.cached(model=app.config['DEFAULT_MODEL'])
+        @lazy_ell.simple(model=app.config['DEFAULT_MODEL'])
         def basic_query(query: str):
             """Asistente básico para consultas simples."""
             return query
         return basic_query
 
-    @ell.complex(model="gpt-4o")
-    def query_with_context(self, messages: List[Message]) -> str:
+    @staticmethod
+    def build_messages(query: str, history: List['Message'] = None) -> List['Message']:
+        """Crea los mensajes de una consulta usando las funciones helper de ell.
+
+        history es el historial ya ajustado al presupuesto de tokens
+        (ver context_builder.assemble_history).
+        """
+        import ell
+
+        return [
+            ell.system("You are a helpful assistant."),
+            *(history or []),
+            ell.user(query)
+        ]
+
+    def stream_query(self, query: str, model: str = None, history: List['Message'] = None):
+        """Stream de tokens para una consulta, compartido entre peticiones idénticas concurrentes."""
+        from app.services.coalescing import request_key, single_flight
+        from app.services.streaming import CompletionStream
+
+        model = model or current_app.config['DEFAULT_MODEL']
+        messages = self.build_messages(query, history)
+        return single_flight.stream(request_key(model, messages, stream=True),
+                                    lambda: CompletionStream(messages, model=model))
+
+    async def aquery(self, query: str, model: str = None, timeout: float = None,
+                     domain: str = None) -> str:
+        """Consulta asíncrona a través del pool de concurrencia, con caché de respuestas."""
+        from app.services.async_llm import llm_pool
+        from app.services.coalescing import request_key, single_flight
+        from app.services.model_router import model_router
+        from app.services.telemetry import telemetry
+
+        model = model or current_app.config['DEFAULT_MODEL']
+        messages = self.build_messages(query)
+        key = llm_cache.make_key(model, {}, messages, domain=domain)
+        cached = llm_cache.get(key)
+        if cached is not None:
+            return cached
+        # Las consultas idénticas en curso comparten una sola llamada al proveedor
+        with telemetry.span('model'):
+            text = await single_flight.ado(
+                request_key(model, messages),
+                lambda: llm_pool.submit(model_router.complete(messages, model=model, timeout=timeout))
+            )
+        llm_cache.set(key, text)
+        return text
+
+    @llm_cache.cached(model="gpt-4o")
+    @lazy_ell.complex(model="gpt-4o")
+    def query_with_context(self, messages: List['Message']) -> str:
         """You are a helpful assistant."""
         try:
             # Con @ell.complex, retornamos los mensajes directamente
@@ -56,26 +112,120 @@ class EllService:
             current_app.logger.error(f"Error en ELL query: {str(e)}")
             raise
 
-    @ell.complex(model="gpt-4o")
-    def analyze_image(self, image: Image.Image, query: str) -> List[ell.Message]:
+    @lazy_ell.complex(model="gpt-4o")
+    def analyze_image(self, image: Union['Image.Image', str], query: str) -> List['Message']:
         """You are a vision expert that can analyze images and provide detailed descriptions."""
+        import ell
+        from ell.types.message import ImageContent
+
+        # Una data URL (ver images.preprocess) se envía tal cual, sin volver a codificarla
+        if isinstance(image, str):
+            image = ImageContent(url=image)
         return [
             ell.system("Analyze the image and answer the query about it."),
             ell.user([image, query])
         ]
 
-    @ell.tool()
-    def search_documents(self: 'EllService', query: str, max_results: int = 5) -> str:
-        """Search through available documents and return relevant content."""
-        return f"Relevant content for: {query}"
+    def search_candidates(self, query: str, domain: str = None, k: int = 5, mode: str = None,
+                          query_vector=None) -> List[Tuple[int, float]]:
+        """Documentos candidatos como pares (id, score) según el modo vector, lexical o hybrid."""
+        from app.services import lexical_index
+        from app.services.embeddings import embed_query
+        from app.services.telemetry import telemetry
+        from app.services.vector_index import vector_index
+
+        mode = mode or current_app.config.get('RETRIEVAL_MODE', 'hybrid')
+        if mode in ('lexical', 'hybrid') and not lexical_index.is_available():
+            mode = 'vector'
+        with telemetry.span('lexical'):
+            lexical = lexical_index.search(query, domain=domain, k=k * 2) if mode != 'vector' else []
+        if mode == 'lexical':
+            return lexical[:k]
+        if query_vector is None:
+            query_vector = embed_query(query)
+        with telemetry.span('vector'):
+            vector = vector_index.search(query_vector, domain=domain, k=k * 2 if lexical else k)
+        if mode == 'vector':
+            return vector
+        return lexical_index.reciprocal_rank_fusion([vector, lexical])[:k]
 
-    @ell.complex(model="gpt-4", tools=[search_documents])
-    def advanced_query(self, query: str) -> List[ell.Message]:
+    def retrieve(self, query: str, domain: str = None, max_results: int = 5,
+                 mode: str = None) -> List[Dict[str, Any]]:
+        """Recupera los documentos más relevantes para la consulta."""
+        from app.models.document import Document
+
+        hits = self.search_candidates(query, domain=domain, k=max_results, mode=mode)
+        if not hits:
+            return []
+        documents = {doc.id: doc for doc in Document.query.filter(Document.id.in_([doc_id for doc_id, _ in hits]))}
+        return [
+            {
+                'id': doc_id,
+                'title': documents[doc_id].title,
+                'domain': documents[doc_id].domain,
+                'content': documents[doc_id].content,
+                'score': score
+            }
+            for doc_id, score in hits
+            # Los casi duplicados sólo guardan el enlace a su canónico (ver ingestion)
+            if doc_id in documents and not (documents[doc_id].doc_metadata or {}).get('duplicate_of')
+        ]
+
+    def retrieve_passages(self, query: str, domain: str = None, max_documents: int = 10,
+                          token_budget: int = None, mode: str = None) -> List[Dict[str, Any]]:
+        """Recupera los mejores pasajes de los documentos candidatos dentro de un presupuesto de tokens."""
+        from app.services.context_builder import cite_passages, pack_passages, rank_passages
+        from app.services.embeddings import embed_query
+        from app.services.telemetry import telemetry
+
+        token_budget = token_budget or current_app.config.get('RETRIEVAL_TOKEN_BUDGET', 2000)
+        query_vector = embed_query(query)
+        hits = self.search_candidates(query, domain=domain, k=max_documents, mode=mode,
+                                      query_vector=query_vector)
+        with telemetry.span('rerank'):
+            passages = rank_passages(query_vector, [doc_id for doc_id, _ in hits])
+        return cite_passages(pack_passages(passages, token_budget))
+
+    @lazy_ell.complex(model="gpt-4", tools=[search_documents])
+    def advanced_query(self, messages: List['Message']) -> List['Message']:
         """You are an advanced assistant that can search through documents and provide comprehensive answers."""
+        import ell
+
         return [
             ell.system("Use the search tool to find relevant information before answering."),
-            ell.user(query)
+            *messages
         ]
 
+    def query_with_tools(self, query: str, history: List['Message'] = None,
+                         conversation: str = None) -> str:
+        """Consulta con búsqueda en documentos: ejecuta las herramientas de cada turno hasta una respuesta final.
+
+        conversation identifica el chat para memoizar los resultados de las herramientas.
+        """
+        import ell
+        from app.services.telemetry import telemetry
+        from app.services.tools import tool_executor
+
+        messages = [*(history or []), ell.user(query)]
+        for _ in range(tool_executor.config['max_rounds']):
+            with telemetry.span('model'):
+                response = self.advanced_query(messages)
+            if not response.tool_calls:
+                return response.text
+            with telemetry.span('tools'):
+                messages = [*messages, response, tool_executor.run(response, conversation)]
+        # Última ronda sin nuevas búsquedas: se responde con lo recuperado
+        with telemetry.span('model'):
+            return self.advanced_query(messages, api_params={'tool_choice': 'none'}).text
+
+    async def aquery_with_tools(self, query: str, history: List['Message'] = None,
+                                conversation: str = None) -> str:
+        """Versión asíncrona de query_with_tools para vistas async.
+
+        Los LMPs de ell son síncronos: las rondas corren en un hilo aparte, con
+        una copia del contexto de la petición, sin bloquear el event loop.
+        """
+        return await asyncio.to_thread(self.query_with_tools, query, history, conversation)
+
 # Instancia global del servicio
 ell_service = EllService() 
\ No newline at end of file
@@ -0,0 +1,183 @@
+import os
+import random
+import threading
+from collections import deque
+from typing import Any, Dict, List, Optional, Set, Tuple
+from ell.stores.store import Store
+
+class WriteBehindStore(Store):
+    """Store de ell que registra las invocaciones en segundo plano y por lotes.
+
+    Las invocaciones se encolan en memoria y un hilo las escribe en el store
+    real en una sola transacción por lote, fuera del camino de la petición.
+    La cola está acotada: bajo presión se descartan las más antiguas. Los LMPs
+    nunca se descartan porque las invocaciones los referencian.
+    """
+
+    def __init__(self, inner: Store, max_pending: int = 10000, batch_size: int = 200,
+                 flush_interval: float = 1.0, sample_rate: float = 1.0):
+        super().__init__(inner.blob_store)
+        self.inner = inner
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.sample_rate = sample_rate
+        self._lmps: List[Tuple[Any, Dict[str, Any]]] = []
+        self._invocations: deque = deque(maxlen=max_pending)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._thread: Optional[threading.Thread] = None
+        self._pid = None
+        self._counters = {'queued': 0, 'written': 0, 'dropped': 0, 'sampled_out': 0, 'errors': 0}
+
+    def _ensure_worker(self):
+        # Tras un fork el hilo no existe en el hijo: se crea uno nuevo
+        if self._thread is None or self._pid != os.getpid():
+            with self._lock:
+                if self._thread is None or self._pid != os.getpid():
+                    self._thread = threading.Thread(target=self._run, name='ell-recorder', daemon=True)
+                    self._pid = os.getpid()
+                    self._thread.start()
+
+    def _run(self):
+        while not self._stopped:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    # Escritura diferida
+
+    def write_lmp(self, serialized_lmp, uses: Dict[str, Any]) -> Optional[Any]:
+        with self._lock:
+            self._lmps.append((serialized_lmp, uses))
+        self._ensure_worker()
+        return None
+
+    def write_invocation(self, invocation, consumes: Set[str]) -> Optional[Any]:
+        from app.services.telemetry import telemetry
+
+        # Las métricas cuentan todas las invocaciones, también las no muestreadas
+        api_params = getattr(invocation.contents, 'invocation_api_params', None) or {}
+        model = api_params.get('model', 'ell')
+        if invocation.latency_ms:
+            telemetry.record_llm('ell', model, invocation.latency_ms / 1000)
+        telemetry.record_tokens(model, invocation.prompt_tokens, invocation.completion_tokens)
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            self._count('sampled_out')
+            return None
+        with self._lock:
+            if len(self._invocations) == self._invocations.maxlen:
+                self._counters['dropped'] += 1
+            self._invocations.append((invocation, consumes))
+            self._counters['queued'] += 1
+            full = len(self._invocations) >= self.batch_size
+        self._ensure_worker()
+        if full:
+            self._wakeup.set()
+        return None
+
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def _take(self) -> Tuple[List, List]:
+        with self._lock:
+            lmps, self._lmps = self._lmps, []
+            batch = [self._invocations.popleft()
+                     for _ in range(min(self.batch_size, len(self._invocations)))]
+        return lmps, batch
+
+    def flush(self):
+        """Escribe todo lo pendiente en el store real."""
+        while True:
+            lmps, batch = self._take()
+            if not lmps and not batch:
+                return
+            for serialized_lmp, uses in lmps:
+                try:
+                    self.inner.write_lmp(serialized_lmp, uses)
+                except Exception:
+                    self._count('errors')
+            if batch:
+                self._write_batch(batch)
+
+    def _write_batch(self, batch: List[Tuple[Any, Set[str]]]):
+        if getattr(self.inner, 'engine', None) is None:
+            return self._write_each(batch)
+        from sqlmodel import Session, select
+        from ell.stores.models.core import InvocationTrace, SerializedLMP
+
+        try:
+            with Session(self.inner.engine) as session:
+                counts: Dict[str, int] = {}
+                for invocation, consumes in batch:
+                    counts[invocation.lmp_id] = counts.get(invocation.lmp_id, 0) + 1
+                    session.add(invocation.contents)
+                    session.add(invocation)
+                    for consumed_id in consumes:
+                        session.add(InvocationTrace(invocation_consumer_id=invocation.id,
+                                                    invocation_consuming_id=consumed_id))
+                lmps = session.exec(select(SerializedLMP)
+                                    .where(SerializedLMP.lmp_id.in_(list(counts)))).all()
+                for lmp in lmps:
+                    lmp.num_invocations = (lmp.num_invocations or 0) + counts[lmp.lmp_id]
+                session.commit()
+            self._count('written', len(batch))
+        except Exception:
+            # Un registro inválido no debe perder el lote completo
+            self._write_each(batch)
+
+    def _write_each(self, batch: List[Tuple[Any, Set[str]]]):
+        for invocation, consumes in batch:
+            try:
+                self.inner.write_invocation(invocation, consumes)
+                self._count('written')
+            except Exception:
+                self._count('errors')
+
+    def close(self, timeout: float = 10.0):
+        """Detiene el hilo y vacía la cola antes de terminar el proceso."""
+        self._stopped = True
+        self._wakeup.set()
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            self._thread.join(timeout)
+        self.flush()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counters, pending=len(self._invocations))
+
+    # Lecturas y evaluaciones: se delegan al store real
+
+    def write_evaluation(self, evaluation):
+        self.flush()
+        return self.inner.write_evaluation(evaluation)
+
+    def write_evaluation_run(self, evaluation_run):
+        return self.inner.write_evaluation_run(evaluation_run)
+
+    def write_evaluation_run_intermediate(self, row_result):
+        self.flush()
+        return self.inner.write_evaluation_run_intermediate(row_result)
+
+    def write_evaluation_run_end(self, evaluation_run_id, successful, end_time, error, summaries):
+        return self.inner.write_evaluation_run_end(evaluation_run_id, successful, end_time, error, summaries)
+
+    def write_evaluation_run_labeler_summaries(self, summaries):
+        return self.inner.write_evaluation_run_labeler_summaries(summaries)
+
+    def get_cached_invocations(self, lmp_id: str, state_cache_key: str):
+        self.flush()
+        return self.inner.get_cached_invocations(lmp_id, state_cache_key)
+
+    def get_versions_by_fqn(self, fqn: str):
+        self.flush()
+        return self.inner.get_versions_by_fqn(fqn)
+
+    def get_eval_versions_by_name(self, name: str):
+        return self.inner.get_eval_versions_by_name(name)
+
+    def __getattr__(self, name: str):
+        if name == 'inner':
+            raise AttributeError(name)
+        return getattr(self.inner, name)
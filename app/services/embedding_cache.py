@@ -0,0 +1,170 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+from flask import Flask
+from app.models.types import EMBEDDING_DTYPE
+
+# Límite de parámetros por consulta en las versiones antiguas de SQLite
+LOOKUP_BATCH = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    model TEXT NOT NULL,
+    text_hash BLOB NOT NULL,
+    dim INTEGER NOT NULL,
+    vector BLOB NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (model, text_hash)
+) WITHOUT ROWID
+"""
+
+def text_hash(text: str) -> bytes:
+    """SHA-256 del texto; junto con el modelo identifica el embedding."""
+    return hashlib.sha256(text.encode('utf-8')).digest()
+
+class EmbeddingCache:
+    """Caché persistente de embeddings por modelo y hash del texto.
+
+    Los vectores viven en un archivo SQLite local (modo WAL, así que los
+    procesos de ingesta y los workers pueden leer y escribir a la vez) y los
+    más usados se mantienen además en un LRU en memoria. Las búsquedas se
+    hacen por lotes, de modo que sólo los textos nuevos llegan al proveedor.
+    """
+
+    def __init__(self, app: Flask = None, path: Optional[str] = None, hot_entries: int = 10000):
+        self.path = path
+        self.hot_entries = hot_entries
+        self._hot: 'OrderedDict[Tuple[str, bytes], np.ndarray]' = OrderedDict()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._counters = {'hot_hits': 0, 'disk_hits': 0, 'misses': 0, 'errors': 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask):
+        """Inicializa la extensión con la aplicación Flask."""
+        app.config.setdefault('EMBEDDING_CACHE_PATH', './embedding_cache.sqlite')
+        app.config.setdefault('EMBEDDING_CACHE_HOT_ENTRIES', 10000)
+        self.path = app.config['EMBEDDING_CACHE_PATH'] or None
+        self.hot_entries = app.config['EMBEDDING_CACHE_HOT_ENTRIES']
+        if not hasattr(app, 'extensions'):
+            app.extensions = {}
+        app.extensions['embedding_cache'] = self
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def _connection(self) -> sqlite3.Connection:
+        """Conexión por hilo y proceso: las conexiones no sobreviven a un fork."""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(SCHEMA)
+            self._local.connection, self._local.pid = connection, os.getpid()
+        return connection
+
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def _remember(self, key: Tuple[str, bytes], vector: np.ndarray):
+        with self._lock:
+            self._hot[key] = vector
+            self._hot.move_to_end(key)
+            while len(self._hot) > self.hot_entries:
+                self._hot.popitem(last=False)
+
+    def get_many(self, model: str, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """Embeddings guardados para cada texto, o None si no están."""
+        keys = [(model, text_hash(text)) for text in texts]
+        found: Dict[Tuple[str, bytes], np.ndarray] = {}
+        with self._lock:
+            for key in keys:
+                vector = self._hot.get(key)
+                if vector is not None:
+                    self._hot.move_to_end(key)
+                    found[key] = vector
+        hot_hits = sum(1 for key in keys if key in found)
+        self._count('hot_hits', hot_hits)
+
+        missing = list({key[1] for key in keys if key not in found})
+        if missing and self.enabled:
+            try:
+                connection = self._connection()
+                for start in range(0, len(missing), LOOKUP_BATCH):
+                    batch = missing[start:start + LOOKUP_BATCH]
+                    rows = connection.execute(
+                        f"SELECT text_hash, vector FROM embeddings WHERE model = ? "
+                        f"AND text_hash IN ({', '.join('?' * len(batch))})", [model, *batch])
+                    for digest, blob in rows:
+                        vector = np.frombuffer(blob, dtype=EMBEDDING_DTYPE)
+                        found[(model, digest)] = vector
+                        self._remember((model, digest), vector)
+            except sqlite3.Error:
+                # Sin caché en disco se recalcula: nunca debe romper una consulta
+                self._count('errors')
+            self._count('disk_hits', sum(1 for key in keys if key in found) - hot_hits)
+        return [found.get(key) for key in keys]
+
+    def put_many(self, model: str, texts: List[str], vectors: np.ndarray):
+        """Guarda embeddings nuevos en el LRU y en disco, en una sola transacción."""
+        vectors = np.asarray(vectors, dtype=EMBEDDING_DTYPE)
+        rows = []
+        for text, vector in zip(texts, vectors):
+            digest, blob = text_hash(text), vector.tobytes()
+            # Copia propia en el LRU: no retener la matriz completa del lote
+            self._remember((model, digest), np.frombuffer(blob, dtype=EMBEDDING_DTYPE))
+            rows.append((model, digest, vector.shape[0], blob, time.time()))
+        if not rows or not self.enabled:
+            return
+        try:
+            connection = self._connection()
+            with connection:
+                connection.executemany(
+                    "INSERT OR IGNORE INTO embeddings (model, text_hash, dim, vector, created_at) "
+                    "VALUES (?, ?, ?, ?, ?)", rows)
+        except sqlite3.Error:
+            self._count('errors')
+
+    def embed(self, model: str, texts: List[str],
+              compute: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """Embeddings de texts calculando con compute sólo los textos que no están en la caché."""
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        cached = self.get_many(model, texts)
+        # Un texto repetido dentro del lote se calcula una sola vez
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, cached) if vector is None))
+        self._count('misses', len(missing))
+        computed = {}
+        if missing:
+            vectors = compute(missing)
+            self.put_many(model, missing, vectors)
+            computed = dict(zip(missing, vectors))
+        return np.stack([vector if vector is not None else computed[text]
+                         for text, vector in zip(texts, cached)]).astype(np.float32, copy=False)
+
+    def clear(self):
+        """Vacía el LRU y el archivo."""
+        with self._lock:
+            self._hot.clear()
+        if self.enabled:
+            connection = self._connection()
+            with connection:
+                connection.execute("DELETE FROM embeddings")
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._counters, 'hot_entries': len(self._hot)}
+
+# Instancia global de la caché de embeddings
+embedding_cache = EmbeddingCache()
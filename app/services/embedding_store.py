@@ -0,0 +1,189 @@
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+import numpy as np
+from flask import Flask
+from app import db
+from app.models.types import EMBEDDING_DTYPE
+
+MANIFEST_FILE = 'manifest.json'
+IDS_FILE = 'ids.npy'
+VECTORS_FILE = 'vectors.npy'
+
+def _version(stat: os.stat_result) -> Tuple[int, int]:
+    return stat.st_ino, stat.st_mtime_ns
+
+class EmbeddingSegment:
+    """Segmento de embeddings en disco abierto como memoria mapeada de solo lectura.
+
+    Los vectores se guardan normalizados y ordenados por (dominio, id), de modo
+    que cada dominio es un rango contiguo del archivo. Todos los workers que
+    abren el mismo segmento comparten las páginas a través del page cache.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+            self.version = _version(os.fstat(f.fileno()))
+            self.manifest = json.load(f)
+        self.ids = np.load(os.path.join(path, self.manifest.get('ids', IDS_FILE)), mmap_mode='r')
+        self.vectors = np.load(os.path.join(path, self.manifest.get('vectors', VECTORS_FILE)), mmap_mode='r')
+        self.domains: Dict[str, Tuple[int, int]] = {
+            domain: tuple(bounds) for domain, bounds in self.manifest['domains'].items()
+        }
+
+    @property
+    def dim(self) -> int:
+        return self.manifest['dim']
+
+    @property
+    def max_id(self) -> int:
+        return self.manifest.get('max_id', 0)
+
+    @property
+    def built_at(self) -> Optional[datetime]:
+        """Inicio de la construcción; las filas modificadas después se leen de la base."""
+        built_at = self.manifest.get('built_at')
+        return datetime.fromisoformat(built_at) if built_at else None
+
+    def __len__(self):
+        return self.manifest['count']
+
+    def partition(self, domain: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Retorna vistas (ids, vectores) sin copia para un dominio."""
+        start, end = self.domains.get(domain, (0, 0))
+        return self.ids[start:end], self.vectors[start:end]
+
+    def get(self, doc_id: int, domain: str) -> Optional[np.ndarray]:
+        """Busca el vector de un documento dentro de su dominio."""
+        ids, vectors = self.partition(domain)
+        row = np.searchsorted(ids, doc_id)
+        if row < len(ids) and ids[row] == doc_id:
+            return vectors[row]
+        return None
+
+class EmbeddingStore:
+    """Gestiona el segmento de embeddings compartido entre workers."""
+
+    def __init__(self, app: Flask = None):
+        self.path = None
+        self._segment = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask):
+        """Inicializa la extensión con la aplicación Flask."""
+        app.config.setdefault('EMBEDDING_SEGMENT_PATH', './embedding_store')
+        self.path = app.config['EMBEDDING_SEGMENT_PATH']
+        if not hasattr(app, 'extensions'):
+            app.extensions = {}
+        app.extensions['embedding_store'] = self
+
+    def exists(self) -> bool:
+        return bool(self.path) and os.path.exists(os.path.join(self.path, MANIFEST_FILE))
+
+    @property
+    def segment(self) -> Optional[EmbeddingSegment]:
+        """Segmento abierto de forma perezosa; None si aún no se ha construido."""
+        if self._segment is None and self.exists():
+            with self._lock:
+                if self._segment is None:
+                    try:
+                        self._segment = EmbeddingSegment(self.path)
+                    except FileNotFoundError:
+                        # Otro proceso publicó un segmento entre el manifiesto y los vectores
+                        self._segment = EmbeddingSegment(self.path)
+        return self._segment
+
+    def refresh(self) -> Optional[EmbeddingSegment]:
+        """Segmento actual, volviendo a mapearlo si otro proceso publicó uno nuevo."""
+        segment = self._segment
+        if segment is not None:
+            try:
+                version = _version(os.stat(os.path.join(self.path, MANIFEST_FILE)))
+            except FileNotFoundError:
+                version = None
+            if version != segment.version:
+                self.reload()
+        return self.segment
+
+    def reload(self):
+        """Descarta el segmento abierto para que se vuelva a mapear en el próximo acceso."""
+        with self._lock:
+            self._segment = None
+
+    def build(self, batch_size: int = 1000) -> int:
+        """Construye el segmento desde la base de datos y lo publica de forma atómica.
+
+        Los vectores se escriben por lotes directamente en archivos mapeados
+        con nombres nuevos, y se publican reemplazando el manifiesto con un solo
+        os.replace: un lector abre el segmento anterior o el nuevo, nunca un
+        directorio a medias. Los archivos anteriores se borran después; quien
+        ya los tenga mapeados conserva su mapeo.
+        """
+        from app.models.document import Document
+
+        built_at = datetime.utcnow()
+        embedded = db.session.query(Document).filter(Document.embedding.isnot(None))
+        total, last_id = embedded.with_entities(db.func.count(Document.id), db.func.max(Document.id)).one()
+        rows = (embedded.with_entities(Document.id, Document.domain, Document.embedding, Document.updated_at)
+                .filter(Document.id <= (last_id or 0))
+                .order_by(Document.domain, Document.id)
+                .execution_options(yield_per=batch_size))
+
+        os.makedirs(self.path, exist_ok=True)
+        version = f"{int(built_at.timestamp() * 1000)}-{os.getpid()}"
+        ids_file, vectors_file = f"ids-{version}.npy", f"vectors-{version}.npy"
+        ids = (np.lib.format.open_memmap(os.path.join(self.path, ids_file), mode='w+',
+                                         dtype=np.int64, shape=(total,))
+               if total else np.zeros(0, dtype=np.int64))
+        vectors = None
+        dim = None
+        domains = {}
+        count = 0
+        for doc_id, domain, embedding, updated_at in rows:
+            if updated_at is not None and updated_at >= built_at:
+                # Modificadas durante la construcción (quizá sin contar en total): el índice las lee de la base
+                continue
+            norm = np.linalg.norm(embedding)
+            if norm == 0:
+                continue
+            if dim is None:
+                dim = embedding.shape[0]
+                vectors = np.lib.format.open_memmap(os.path.join(self.path, vectors_file), mode='w+',
+                                                    dtype=EMBEDDING_DTYPE, shape=(total, dim))
+            elif embedding.shape[0] != dim:
+                raise ValueError(f"Dimensión de embedding inválida para documento {doc_id}")
+            domains.setdefault(domain, [count, count])[1] = count + 1
+            ids[count] = doc_id
+            vectors[count] = embedding / norm
+            count += 1
+        # Las filas finales sin usar (embeddings nulos) no pertenecen a ningún dominio
+        if total:
+            ids.flush()
+        else:
+            np.save(os.path.join(self.path, ids_file), ids)
+        if vectors is not None:
+            vectors.flush()
+        else:
+            np.save(os.path.join(self.path, vectors_file), np.zeros((0, 0), dtype=EMBEDDING_DTYPE))
+        max_id = int(ids[:count].max()) if count else 0
+        del ids, vectors
+
+        manifest_path = os.path.join(self.path, MANIFEST_FILE)
+        tmp_path = f"{manifest_path}.tmp-{os.getpid()}"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'dim': dim or 0, 'count': count, 'max_id': max_id, 'built_at': built_at.isoformat(),
+                       'ids': ids_file, 'vectors': vectors_file, 'domains': domains}, f)
+        os.replace(tmp_path, manifest_path)
+        for name in os.listdir(self.path):
+            if name.endswith('.npy') and name not in (ids_file, vectors_file):
+                os.remove(os.path.join(self.path, name))
+        self.reload()
+        return count
+
+# Instancia global del almacenamiento
+embedding_store = EmbeddingStore()
@@ -0,0 +1,33 @@
+from typing import TYPE_CHECKING, List, Optional
+import numpy as np
+from flask import current_app
+from app.services.clients import get_openai_client
+
+if TYPE_CHECKING:
+    from app.services.embedding_cache import EmbeddingCache
+
+def embed_with_client(client, texts: List[str], model: str,
+                      cache: Optional['EmbeddingCache'] = None) -> np.ndarray:
+    """Calcula embeddings con un cliente explícito (útil fuera del contexto de Flask).
+
+    Con cache sólo se envían al proveedor los textos que no estén guardados.
+    """
+    if not texts:
+        return np.empty((0, 0), dtype=np.float32)
+    if cache is not None:
+        return cache.embed(model, texts, lambda missing: embed_with_client(client, missing, model))
+    response = client.embeddings.create(model=model, input=texts)
+    return np.asarray([item.embedding for item in response.data], dtype=np.float32)
+
+def embed_texts(texts: List[str], model: Optional[str] = None) -> np.ndarray:
+    """Calcula embeddings para una lista de textos como matriz float32, pasando por la caché."""
+    from app.services.embedding_cache import embedding_cache
+    from app.services.telemetry import telemetry
+
+    model = model or current_app.config.get('EMBEDDING_MODEL', 'text-embedding-3-small')
+    with telemetry.span('embedding'):
+        return embed_with_client(get_openai_client(), texts, model, cache=embedding_cache)
+
+def embed_query(text: str, model: Optional[str] = None) -> np.ndarray:
+    """Calcula el embedding de una consulta individual."""
+    return embed_texts([text], model=model)[0]
@@ -0,0 +1,178 @@
+import asyncio
+import math
+import re
+import time
+from typing import Any, Dict, List, Optional
+from flask import Flask
+from app.services.lmps import ensemble_candidate, ensemble_judge
+
+INVALID_OPTIONS = ("Opciones de ensemble inválidas: n y quorum deben ser enteros positivos, "
+                   "deadline un número positivo de segundos y models una lista de nombres")
+
+def candidate_messages(query: str) -> List[Any]:
+    # Los prompts se definen una sola vez en lmps.py; aquí sólo se construyen
+    # los mensajes para enviarlos por el router asíncrono
+    return ensemble_candidate.__wrapped__(query)
+
+def judge_messages(query: str, candidates: List[str]) -> List[Any]:
+    return ensemble_judge.__wrapped__(query, candidates)
+
+def _integer(value: Any) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool) or \
+        isinstance(value, float) and value.is_integer()
+
+def _number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+def parse_choice(verdict: str, count: int) -> Optional[int]:
+    """Índice (desde 0) de la opción elegida por el juez, o None si no se entiende."""
+    match = re.search(r'\d+', verdict or '')
+    if not match:
+        return None
+    choice = int(match.group()) - 1
+    return choice if 0 <= choice < count else None
+
+class Ensemble:
+    """Best-of-n concurrente: candidatos en paralelo, juez temprano y plazo total.
+
+    Los candidatos se generan en el pool asíncrono (respetando sus límites de
+    concurrencia), repartidos entre los modelos indicados. En cuanto hay
+    ``quorum`` candidatos el juez empieza y los pendientes se cancelan. Si el
+    plazo no alcanza para el juez se responde con el primer candidato.
+    """
+
+    def __init__(self, app: Flask = None):
+        self.config: Dict[str, Any] = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask):
+        """Inicializa la extensión con la aplicación Flask."""
+        app.config.setdefault('ENSEMBLE_N', 3)
+        app.config.setdefault('ENSEMBLE_MAX_N', 5)
+        app.config.setdefault('ENSEMBLE_QUORUM', 2)
+        app.config.setdefault('ENSEMBLE_DEADLINE', 20.0)
+        app.config.setdefault('ENSEMBLE_JUDGE_TIMEOUT', 5.0)
+        app.config.setdefault('ENSEMBLE_TEMPERATURE', 1.0)
+        app.config.setdefault('ENSEMBLE_MODELS', [app.config['DEFAULT_MODEL']])
+        app.config.setdefault('ENSEMBLE_JUDGE_MODEL', app.config['DEFAULT_MODEL'])
+
+        self.config = {
+            'n': app.config['ENSEMBLE_N'],
+            'max_n': app.config['ENSEMBLE_MAX_N'],
+            'quorum': app.config['ENSEMBLE_QUORUM'],
+            'deadline': app.config['ENSEMBLE_DEADLINE'],
+            'judge_timeout': app.config['ENSEMBLE_JUDGE_TIMEOUT'],
+            'temperature': app.config['ENSEMBLE_TEMPERATURE'],
+            'models': list(app.config['ENSEMBLE_MODELS']),
+            'judge_model': app.config['ENSEMBLE_JUDGE_MODEL'],
+        }
+
+        if not hasattr(app, 'extensions'):
+            app.extensions = {}
+        app.extensions['ensemble'] = self
+
+    def options(self, n: Optional[int] = None, models: Optional[List[str]] = None,
+                quorum: Optional[int] = None, deadline: Optional[float] = None) -> Dict[str, Any]:
+        """Valida las opciones de una petición contra la configuración.
+
+        Los valores llegan del JSON de la petición: cualquier tipo inesperado
+        se rechaza con ValueError y un mensaje fijo, nunca con un TypeError.
+        """
+        if any(value is not None and not _integer(value) for value in (n, quorum)) or \
+                (deadline is not None and not _number(deadline)):
+            raise ValueError(INVALID_OPTIONS)
+        models = [models] if isinstance(models, str) else models
+        if models is not None and (not isinstance(models, list) or
+                                   not all(isinstance(model, str) for model in models)):
+            raise ValueError(INVALID_OPTIONS)
+        n = self.config['n'] if n is None else int(n)
+        models = models or self.config['models']
+        if not 1 <= n <= self.config['max_n']:
+            raise ValueError(f"n debe estar entre 1 y {self.config['max_n']}")
+        unknown = set(models) - set(self.config['models'])
+        if unknown:
+            raise ValueError(f"Modelos no permitidos: {', '.join(sorted(unknown))}")
+        quorum = min(self.config['quorum'] if quorum is None else int(quorum), n)
+        deadline = min(self.config['deadline'] if deadline is None else float(deadline), self.config['deadline'])
+        if quorum < 1 or deadline <= 0:
+            raise ValueError(INVALID_OPTIONS)
+        return {'n': n, 'models': models, 'quorum': quorum, 'deadline': deadline}
+
+    async def run(self, query: str, n: int, models: List[str], quorum: int, deadline: float) -> Dict[str, Any]:
+        """Corrutina del pipeline; debe ejecutarse en el loop del pool de modelos."""
+        from app.services.model_router import model_router
+
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        deadline_at = started + deadline
+        # Tiempo reservado para el juez dentro del plazo total
+        judge_budget = min(self.config['judge_timeout'], deadline / 2) if quorum > 1 else 0
+
+        tasks = {
+            asyncio.ensure_future(model_router.complete(candidate_messages(query), model=models[i % len(models)],
+                                                        timeout=deadline,
+                                                        temperature=self.config['temperature'])): models[i % len(models)]
+            for i in range(n)
+        }
+        pending = set(tasks)
+        candidates, failed = [], 0
+        try:
+            while pending and len(candidates) < quorum:
+                remaining = deadline_at - judge_budget - loop.time()
+                if remaining <= 0:
+                    break
+                done, pending = await asyncio.wait(pending, timeout=remaining,
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None and task.result().strip():
+                        candidates.append({'model': tasks[task], 'text': task.result(),
+                                           'ms': round((loop.time() - started) * 1000, 1)})
+                    else:
+                        failed += 1
+        finally:
+            for task in pending:
+                task.cancel()
+
+        if not candidates:
+            raise TimeoutError(f"Ningún candidato respondió en {deadline} s")
+
+        selected, judged = 0, False
+        remaining = deadline_at - loop.time()
+        if len(candidates) > 1 and remaining > 0:
+            try:
+                verdict = await model_router.complete(judge_messages(query, [c['text'] for c in candidates]),
+                                                      model=self.config['judge_model'], timeout=remaining,
+                                                      temperature=0.0)
+                choice = parse_choice(verdict, len(candidates))
+                if choice is not None:
+                    selected, judged = choice, True
+            except Exception:
+                # Sin veredicto se usa el candidato más rápido
+                pass
+
+        return {
+            'response': candidates[selected]['text'],
+            'model': candidates[selected]['model'],
+            'selected': selected,
+            'judged': judged,
+            'candidates': [{'model': c['model'], 'ms': c['ms']} for c in candidates],
+            'failed': failed,
+            'cancelled': len(pending),
+            'elapsed_ms': round((loop.time() - started) * 1000, 1)
+        }
+
+    async def arun(self, query: str, **options) -> Dict[str, Any]:
+        """Versión awaitable desde cualquier loop; cancelar la espera cancela el pipeline."""
+        from app.services.async_llm import llm_pool
+
+        options = self.options(**options)
+        future = llm_pool.submit(self.run(query, **options))
+        started = time.monotonic()
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), options['deadline'] + 1)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"Ensemble sin respuesta tras {time.monotonic() - started:.1f} s")
+
+# Instancia global del ensemble
+ensemble = Ensemble()
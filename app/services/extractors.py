@@ -0,0 +1,131 @@
+import os
+from bisect import bisect_right
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Extractores por extensión; cada uno retorna {'format', 'content', 'segments'}
+EXTRACTORS: Dict[str, Callable[[str], Dict[str, Any]]] = {}
+
+# Separador entre páginas y secciones en el contenido extraído
+SEGMENT_SEPARATOR = '\n\n'
+
+def register_extractor(*extensions: str):
+    """Registra un extractor para las extensiones indicadas (en minúsculas, con punto)."""
+    def decorator(func: Callable[[str], Dict[str, Any]]):
+        for extension in extensions:
+            EXTRACTORS[extension] = func
+        return func
+    return decorator
+
+def supported_extensions() -> Tuple[str, ...]:
+    return tuple(EXTRACTORS)
+
+def extractor_for(path: str) -> Optional[Callable[[str], Dict[str, Any]]]:
+    return EXTRACTORS.get(os.path.splitext(path)[1].lower())
+
+def extract(path: str) -> Dict[str, Any]:
+    """Texto del archivo y sus segmentos naturales (páginas o secciones) con offsets."""
+    extractor = extractor_for(path)
+    if extractor is None:
+        raise ValueError(f"Formato no soportado: {path}")
+    return extractor(path)
+
+def join_segments(parts: List[Tuple[Dict[str, Any], str]]) -> Tuple[str, List[Dict[str, Any]]]:
+    """Concatena textos etiquetados y retorna el contenido con el rango de cada uno."""
+    content, segments, offset = [], [], 0
+    for label, text in parts:
+        text = text.strip()
+        if not text:
+            continue
+        if content:
+            content.append(SEGMENT_SEPARATOR)
+            offset += len(SEGMENT_SEPARATOR)
+        segments.append({**label, 'start_offset': offset, 'end_offset': offset + len(text)})
+        content.append(text)
+        offset += len(text)
+    return ''.join(content), segments
+
+def provenance(extraction: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Procedencia a guardar en doc_metadata; None si el documento es un único bloque de texto."""
+    if extraction['format'] == 'text':
+        return None
+    return {'format': extraction['format'], 'segments': extraction['segments']}
+
+def locate(segments: List[Dict[str, Any]], offset: int) -> Optional[Dict[str, Any]]:
+    """Segmento que contiene offset (búsqueda binaria sobre los inicios)."""
+    index = bisect_right([segment['start_offset'] for segment in segments], offset) - 1
+    return segments[index] if index >= 0 else None
+
+@register_extractor('.txt')
+def extract_text(path: str) -> Dict[str, Any]:
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        content = f.read()
+    return {'format': 'text', 'content': content,
+            'segments': [{'start_offset': 0, 'end_offset': len(content)}] if content else []}
+
+@register_extractor('.md', '.markdown')
+def extract_markdown(path: str) -> Dict[str, Any]:
+    """Texto plano del Markdown dividido en secciones por encabezado, con su ruta (p. ej. 'Plan > Metas')."""
+    import markdown
+    from bs4 import BeautifulSoup
+
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        html = markdown.markdown(f.read(), extensions=['tables', 'fenced_code'])
+    soup = BeautifulSoup(html, 'html.parser')
+
+    parts, headings, blocks = [], [], []
+    label: Dict[str, Any] = {'section': None, 'level': 0}
+
+    def close():
+        if blocks:
+            parts.append((label, '\n\n'.join(blocks)))
+            blocks.clear()
+
+    for element in soup.find_all(recursive=False):
+        if element.name in ('h1', 'h2', 'h3', 'h4', 'h5', 'h6'):
+            close()
+            level = int(element.name[1])
+            title = element.get_text(' ', strip=True)
+            headings[:] = [heading for heading in headings if heading[0] < level] + [(level, title)]
+            label = {'section': ' > '.join(heading[1] for heading in headings), 'level': level}
+            blocks.append(title)
+            continue
+        # Listas, tablas y código conservan un elemento por línea
+        separator = '\n' if element.name in ('ul', 'ol', 'pre', 'table') else ' '
+        text = element.get_text(separator, strip=True)
+        if text:
+            blocks.append(text)
+    close()
+    content, segments = join_segments(parts)
+    return {'format': 'markdown', 'content': content, 'segments': segments}
+
+def pdf_page_count(path: str) -> int:
+    from pypdf import PdfReader
+
+    with open(path, 'rb') as f:
+        return len(PdfReader(f).pages)
+
+def extract_pdf_pages(path: str, start: int, end: int) -> List[str]:
+    """Texto de las páginas [start, end) leyendo el archivo bajo demanda.
+
+    Con un archivo abierto (y no una ruta) pypdf no carga el PDF completo en
+    memoria: sólo se leen los objetos de las páginas pedidas.
+    """
+    from pypdf import PdfReader
+
+    with open(path, 'rb') as f:
+        reader = PdfReader(f)
+        return [reader.pages[number].extract_text() or '' for number in range(start, min(end, len(reader.pages)))]
+
+def assemble_pages(texts: List[str]) -> Dict[str, Any]:
+    """Extracción de un PDF a partir del texto de sus páginas, en orden."""
+    content, segments = join_segments([({'page': number + 1}, text) for number, text in enumerate(texts)])
+    return {'format': 'pdf', 'content': content, 'segments': segments}
+
+@register_extractor('.pdf')
+def extract_pdf(path: str, pages_per_read: int = 16) -> Dict[str, Any]:
+    """Extracción secuencial por bloques de páginas (la ingesta reparte los PDF grandes entre procesos)."""
+    count = pdf_page_count(path)
+    texts: List[str] = []
+    for start in range(0, count, pages_per_read):
+        texts.extend(extract_pdf_pages(path, start, start + pages_per_read))
+    return assemble_pages(texts)
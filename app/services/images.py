@@ -0,0 +1,162 @@
+import base64
+import io
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import IO, TYPE_CHECKING, Any, Dict, Optional
+from flask import Flask
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+class UploadTooLarge(ValueError):
+    """La subida supera IMAGE_MAX_UPLOAD_BYTES."""
+
+class InvalidImage(ValueError):
+    """El archivo no es una imagen legible o supera IMAGE_MAX_PIXELS."""
+
+def spool_upload(stream: IO[bytes], max_bytes: int, spool_bytes: int,
+                 chunk_size: int = 64 * 1024) -> IO[bytes]:
+    """Copia un stream en bloques a un archivo temporal que pasa a disco tras spool_bytes."""
+    spooled = tempfile.SpooledTemporaryFile(max_size=spool_bytes)
+    total = 0
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        total += len(chunk)
+        if total > max_bytes:
+            spooled.close()
+            raise UploadTooLarge(f"La imagen supera {max_bytes // (1024 * 1024)} MB")
+        spooled.write(chunk)
+    spooled.seek(0)
+    return spooled
+
+def target_size(width: int, height: int, max_side: int, min_side: int):
+    """Tamaño útil para el modelo de visión: lado mayor <= max_side y lado menor <= min_side."""
+    scale = min(1.0, max_side / max(width, height), min_side / min(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+def dhash(image: 'Image.Image', size: int = 8) -> str:
+    """Hash perceptual por diferencias: estable frente a recompresión y reescalado."""
+    from PIL import Image
+
+    pixels = list(image.convert('L').resize((size + 1, size), Image.Resampling.LANCZOS).getdata())
+    bits = 0
+    for row in range(size):
+        for col in range(size):
+            left = pixels[row * (size + 1) + col]
+            bits = (bits << 1) | (left > pixels[row * (size + 1) + col + 1])
+    return f"{bits:0{size * size // 4}x}"
+
+def color_signature(image: 'Image.Image', size: int = 2) -> str:
+    """Color medio de cada zona, cuantizado a 16 niveles por canal.
+
+    Complementa a dhash, que sólo ve diferencias de luminancia: dos imágenes
+    uniformes (o con los mismos gradientes) de distinto color tienen el mismo
+    dhash pero no la misma firma.
+    """
+    from PIL import Image
+
+    pixels = image.convert('RGB').resize((size, size), Image.Resampling.BOX).getdata()
+    return ''.join(f"{channel >> 4:x}" for pixel in pixels for channel in pixel)
+
+def image_key(image: 'Image.Image') -> str:
+    """Clave de caché de una imagen: estructura (dhash) más color."""
+    return f"{dhash(image)}-{color_signature(image)}"
+
+def preprocess(source: IO[bytes], max_side: int, min_side: int, quality: int,
+               max_pixels: int) -> Dict[str, Any]:
+    """Decodifica, reduce y recodifica como JPEG; pensado para ejecutarse fuera del hilo de la petición."""
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    try:
+        image = Image.open(source)
+    except (UnidentifiedImageError, Image.DecompressionBombError) as e:
+        raise InvalidImage(str(e)) from e
+    with image:
+        original = image.size
+        # Image.open sólo lee la cabecera: se rechaza antes de decodificar, sin tocar el
+        # Image.MAX_IMAGE_PIXELS global que comparten los hilos del pool
+        if original[0] * original[1] > max_pixels:
+            raise InvalidImage(f"La imagen supera {max_pixels} píxeles")
+        # En JPEG, draft decodifica directamente a una escala reducida
+        image.draft('RGB', target_size(*original, max_side, min_side))
+        try:
+            image = ImageOps.exif_transpose(image)
+            if image.mode != 'RGB':
+                image = image.convert('RGB')
+            image.thumbnail(target_size(*image.size, max_side, min_side), Image.Resampling.LANCZOS)
+        except (OSError, Image.DecompressionBombError) as e:
+            # Archivos truncados o dañados
+            raise InvalidImage(str(e)) from e
+        buffer = io.BytesIO()
+        image.save(buffer, format='JPEG', quality=quality, optimize=True)
+        return {
+            'hash': image_key(image),
+            'original_size': original,
+            'size': image.size,
+            'data_url': 'data:image/jpeg;base64,' + base64.b64encode(buffer.getvalue()).decode('ascii'),
+        }
+
+class ImageProcessor:
+    """Preprocesado de imágenes en un pool de hilos acotado.
+
+    PIL libera el GIL al decodificar y reescalar, así que un pool de hilos
+    basta para sacar ese trabajo del hilo de la petición sin copiar la
+    subida a otro proceso.
+    """
+
+    def __init__(self, app: Flask = None):
+        self.config: Dict[str, Any] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask):
+        """Inicializa la extensión con la aplicación Flask."""
+        app.config.setdefault('IMAGE_MAX_UPLOAD_BYTES', 20 * 1024 * 1024)
+        app.config.setdefault('IMAGE_SPOOL_BYTES', 1024 * 1024)
+        app.config.setdefault('IMAGE_MAX_SIDE', 2048)
+        app.config.setdefault('IMAGE_MIN_SIDE', 768)
+        app.config.setdefault('IMAGE_JPEG_QUALITY', 85)
+        app.config.setdefault('IMAGE_MAX_PIXELS', 50_000_000)
+        app.config.setdefault('IMAGE_WORKERS', 4)
+        app.config.setdefault('IMAGE_TIMEOUT', 30)
+
+        self.config = {
+            'max_upload_bytes': app.config['IMAGE_MAX_UPLOAD_BYTES'],
+            'spool_bytes': app.config['IMAGE_SPOOL_BYTES'],
+            'max_side': app.config['IMAGE_MAX_SIDE'],
+            'min_side': app.config['IMAGE_MIN_SIDE'],
+            'quality': app.config['IMAGE_JPEG_QUALITY'],
+            'max_pixels': app.config['IMAGE_MAX_PIXELS'],
+            'workers': app.config['IMAGE_WORKERS'],
+            'timeout': app.config['IMAGE_TIMEOUT'],
+        }
+
+        if not hasattr(app, 'extensions'):
+            app.extensions = {}
+        app.extensions['images'] = self
+
+    def _ensure_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.config['workers'],
+                                                        thread_name_prefix='image-preprocess')
+        return self._executor
+
+    def spool(self, stream: IO[bytes]) -> IO[bytes]:
+        return spool_upload(stream, self.config['max_upload_bytes'], self.config['spool_bytes'])
+
+    def preprocess(self, source: IO[bytes]) -> Dict[str, Any]:
+        """Preprocesa en el pool y espera el resultado como mucho IMAGE_TIMEOUT segundos."""
+        future = self._ensure_executor().submit(preprocess, source, self.config['max_side'],
+                                                self.config['min_side'], self.config['quality'],
+                                                self.config['max_pixels'])
+        return future.result(self.config['timeout'])
+
+# Instancia global del procesador de imágenes
+image_processor = ImageProcessor()
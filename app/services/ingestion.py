@@ -0,0 +1,399 @@
+import hashlib
+import logging
+import multiprocessing
+import os
+import queue
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import numpy as np
+from app import db
+from app.models.document import Document
+from app.models.passage import Passage
+from app.services.chunking import chunk_segments
+from app.services.extractors import (assemble_pages, extract, extract_pdf_pages, pdf_page_count,
+                                     provenance, supported_extensions)
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_EXTENSIONS = supported_extensions()
+HASH_BLOCK_SIZE = 1 << 20
+
+# Estado por proceso del pool, inicializado en _init_worker
+_worker: Dict[str, Any] = {}
+
+def file_hash(path: str) -> str:
+    """SHA-256 del archivo leído por bloques, sin cargarlo completo en memoria."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _init_worker(api_key: Optional[str], model: str, chunk_tokens: int, embed: bool,
+                 cache_path: Optional[str] = None, dedup_perm: int = 0, pdf_pages_per_task: int = 16):
+    _worker.update(model=model, chunk_tokens=chunk_tokens, client=None, cache=None, minhasher=None,
+                   pdf_pages_per_task=pdf_pages_per_task)
+    if dedup_perm:
+        from app.services.dedup import MinHasher
+        _worker['minhasher'] = MinHasher(dedup_perm)
+    if embed:
+        from openai import OpenAI
+        _worker['client'] = OpenAI(api_key=api_key)
+        if cache_path:
+            # Cada proceso abre su propia conexión; el LRU en memoria no se comparte entre procesos
+            from app.services.embedding_cache import EmbeddingCache
+            _worker['cache'] = EmbeddingCache(path=cache_path, hot_entries=0)
+
+def process_pages(task: Tuple[str, int, int]) -> Dict[str, Any]:
+    """Extrae un rango de páginas de un PDF dentro de un proceso del pool."""
+    path, start, end = task
+    try:
+        return {'status': 'pages', 'path': path, 'start': start, 'texts': extract_pdf_pages(path, start, end)}
+    except Exception as e:
+        return {'status': 'error', 'path': path, 'start': start, 'error': str(e)}
+
+def process_file(task: Tuple) -> Dict[str, Any]:
+    """Extrae, fragmenta y calcula el embedding de un archivo dentro de un proceso del pool.
+
+    task es (ruta, dominio, hash conocido) o, para un PDF ya extraído por
+    rangos de páginas, (ruta, dominio, None, extracción). Un PDF con más de
+    pdf_pages_per_task páginas retorna 'split' para repartir sus páginas.
+    """
+    path, domain, known_hash = task[:3]
+    extraction = task[3] if len(task) > 3 else None
+    try:
+        if extraction is None:
+            digest = file_hash(path)
+            if digest == known_hash:
+                return {'status': 'skipped', 'path': path}
+            if path.lower().endswith('.pdf'):
+                page_count = pdf_page_count(path)
+                if page_count > _worker['pdf_pages_per_task']:
+                    return {'status': 'split', 'path': path, 'domain': domain, 'content_hash': digest,
+                            'page_count': page_count}
+            extraction = extract(path)
+        else:
+            digest = extraction['content_hash']
+
+        content = extraction['content']
+        minhash = None
+        if _worker['minhasher'] is not None:
+            from app.services.dedup import shingles
+            hashes = shingles(content)
+            if hashes:
+                minhash = _worker['minhasher'].signature(hashes).tobytes()
+        # Los pasajes no cruzan páginas ni secciones
+        passages = chunk_segments(content, extraction['segments'], max_tokens=_worker['chunk_tokens'])
+        embedding = None
+        if _worker['client'] is not None and passages:
+            from app.services.embeddings import embed_with_client
+            vectors = embed_with_client(_worker['client'], [p['content'] for p in passages],
+                                        _worker['model'], cache=_worker['cache'])
+            for passage, vector in zip(passages, vectors):
+                passage['embedding'] = vector.tobytes()
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+            embedding = vectors.mean(axis=0).tobytes()
+
+        return {
+            'status': 'ok',
+            'path': path,
+            'title': os.path.basename(path),
+            'domain': domain,
+            'content': content,
+            'content_hash': digest,
+            'embedding': embedding,
+            'minhash': minhash,
+            'provenance': provenance(extraction),
+            'passages': passages,
+            'chunks': len(passages)
+        }
+    except Exception as e:
+        return {'status': 'error', 'path': path, 'error': str(e)}
+
+class IngestionPipeline:
+    """Ingesta paralela e incremental de documentos con inserciones por lotes."""
+
+    def __init__(self, app, workers: Optional[int] = None, batch_size: int = 50,
+                 chunk_tokens: int = 300, embed: bool = True, report_every: int = 100,
+                 dedup_threshold: Optional[float] = None):
+        self.app = app
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.chunk_tokens = chunk_tokens
+        self.embed = embed and bool(app.config.get('OPENAI_API_KEY'))
+        self.report_every = report_every
+        self.dedup_threshold = (app.config.get('INGEST_DEDUP_THRESHOLD', 0.85)
+                                if dedup_threshold is None else dedup_threshold)
+        self.dedup_perm = app.config.get('INGEST_DEDUP_NUM_PERM', 128) if self.dedup_threshold else 0
+        self.pdf_pages_per_task = app.config.get('INGEST_PDF_PAGES_PER_TASK', 16)
+        # Archivos en vuelo: acota los resultados que esperan mientras se confirma un lote
+        self.max_pending = self.workers * 2
+        self.stats = {'files': 0, 'inserted': 0, 'updated': 0, 'skipped': 0, 'duplicates': 0,
+                      'errors': 0, 'chunks': 0}
+        self._domains = set()
+        self._lsh = None
+        # Claves del LSH de los documentos nuevos del lote, que se descartan si no se confirma
+        self._batch_keys: List[int] = []
+        # Documentos nuevos del lote en el LSH con una clave provisional negativa hasta el flush
+        self._staged: Dict[int, Document] = {}
+        self._links: List[Tuple[Document, int]] = []
+        self._next_key = -1
+
+    def discover(self, path: str) -> Iterator[Tuple[str, str]]:
+        """Recorre el árbol de forma perezosa retornando (ruta, dominio)."""
+        for root, _, files in os.walk(path):
+            for file in sorted(files):
+                if file.endswith(SUPPORTED_EXTENSIONS):
+                    file_path = os.path.join(root, file)
+                    yield file_path, os.path.basename(os.path.dirname(file_path))
+
+    def _known_documents(self) -> Dict[str, Tuple[int, str]]:
+        rows = db.session.query(Document.source_path, Document.id, Document.content_hash) \
+            .filter(Document.source_path.isnot(None))
+        return {source_path: (doc_id, content_hash) for source_path, doc_id, content_hash in rows}
+
+    @staticmethod
+    def _vector(blob: Optional[bytes]) -> Optional[np.ndarray]:
+        return np.frombuffer(blob, dtype=np.float32) if blob else None
+
+    def _load_signatures(self):
+        """Índice LSH con las firmas de los documentos canónicos ya guardados."""
+        from app.services.dedup import MinHashLSH
+
+        self._lsh = MinHashLSH(self.dedup_threshold, self.dedup_perm)
+        rows = db.session.query(Document.id, Document.minhash).filter(Document.minhash.isnot(None))
+        for doc_id, minhash in rows.execution_options(yield_per=1000):
+            self._lsh.insert(doc_id, np.frombuffer(minhash, dtype=np.uint32))
+
+    def _duplicate_of(self, result: Dict[str, Any], existing) -> Optional[Tuple[int, float]]:
+        """(clave del canónico, similitud); la clave es provisional si el canónico es del mismo lote."""
+        if self._lsh is None or result.get('minhash') is None:
+            return None
+        return self._lsh.match(np.frombuffer(result['minhash'], dtype=np.uint32),
+                               exclude=existing[0] if existing else None)
+
+    def _stage(self, doc: Document) -> int:
+        key = self._next_key
+        self._next_key -= 1
+        self._staged[key] = doc
+        return key
+
+    def _commit(self):
+        """Confirma la transacción; tras el flush las claves provisionales pasan a ser los ids asignados."""
+        if self._staged:
+            db.session.flush()
+            ids = {key: doc.id for key, doc in self._staged.items()}
+            for key, doc_id in ids.items():
+                self._lsh.rename(key, doc_id)
+            for doc, key in self._links:
+                doc.doc_metadata = {**doc.doc_metadata, 'duplicate_of': ids[key]}
+            self._batch_keys = [ids.get(key, key) for key in self._batch_keys]
+            self._staged.clear()
+            self._links.clear()
+        db.session.commit()
+
+    def _apply(self, result: Dict[str, Any], known: Dict[str, Tuple[int, str]]):
+        existing = known.get(result['path'])
+        duplicate = self._duplicate_of(result, existing)
+        embedding = self._vector(result['embedding'])
+        if existing:
+            doc = db.session.get(Document, existing[0])
+            doc.title = result['title']
+            doc.domain = result['domain']
+            doc.content = result['content']
+            doc.content_hash = result['content_hash']
+            doc.embedding = embedding
+            doc.passages.clear()
+            self.stats['updated'] += 1
+        else:
+            doc = Document(
+                title=result['title'],
+                content=result['content'],
+                domain=result['domain'],
+                source_path=result['path'],
+                content_hash=result['content_hash'],
+                embedding=embedding
+            )
+            db.session.add(doc)
+            self.stats['inserted'] += 1
+        metadata = {key: value for key, value in (doc.doc_metadata or {}).items()
+                    if key not in ('duplicate_of', 'similarity', 'provenance')}
+        if duplicate is not None:
+            # Se guarda el enlace al canónico, sin contenido, embedding ni pasajes que indexar
+            doc.content = ''
+            doc.embedding = None
+            doc.minhash = None
+            doc.doc_metadata = {**metadata, 'duplicate_of': duplicate[0], 'similarity': round(duplicate[1], 3)}
+            if duplicate[0] < 0:
+                # Canónico del mismo lote: el id se completa en _commit
+                self._links.append((doc, duplicate[0]))
+            if existing:
+                self._lsh.remove(existing[0])
+            self.stats['duplicates'] += 1
+            result['chunks'] = 0
+            self._domains.add(result['domain'])
+            return
+        doc.minhash = result.get('minhash')
+        if result.get('provenance'):
+            # Páginas o secciones con sus offsets, para citar y ubicar los pasajes
+            metadata['provenance'] = result['provenance']
+        doc.doc_metadata = metadata or None
+        if self._lsh is not None and doc.minhash is not None:
+            key = existing[0] if existing else self._stage(doc)
+            self._lsh.insert(key, np.frombuffer(doc.minhash, dtype=np.uint32))
+            if not existing:
+                self._batch_keys.append(key)
+        doc.passages.extend(
+            Passage(
+                position=position,
+                content=passage['content'],
+                start_offset=passage['start_offset'],
+                end_offset=passage['end_offset'],
+                token_count=passage['token_count'],
+                embedding=self._vector(passage.get('embedding'))
+            )
+            for position, passage in enumerate(result['passages'])
+        )
+        self._domains.add(result['domain'])
+
+    def _flush(self, batch: List[Dict[str, Any]], known: Dict[str, Tuple[int, str]]):
+        """Confirma un lote; si falla, reintenta archivo por archivo para aislar el error."""
+        if not batch:
+            return
+        counts = (self.stats['inserted'], self.stats['updated'], self.stats['duplicates'])
+        self._batch_keys.clear()
+        try:
+            for result in batch:
+                self._apply(result, known)
+            self._commit()
+            self.stats['chunks'] += sum(result['chunks'] for result in batch)
+        except Exception as e:
+            db.session.rollback()
+            self._discard_signatures()
+            logger.warning(f"Lote fallido, reintentando individualmente: {str(e)}")
+            self.stats['inserted'], self.stats['updated'], self.stats['duplicates'] = counts
+            for result in batch:
+                try:
+                    self._apply(result, known)
+                    self._commit()
+                    self.stats['chunks'] += result['chunks']
+                except Exception as e:
+                    db.session.rollback()
+                    self._discard_signatures()
+                    self.stats['errors'] += 1
+                    logger.error(f"Error guardando {result['path']}: {str(e)}")
+                self._batch_keys.clear()
+        batch.clear()
+
+    def _discard_signatures(self):
+        """Quita del LSH las firmas de documentos nuevos que no llegaron a confirmarse."""
+        if self._lsh is not None:
+            for key in self._batch_keys:
+                self._lsh.remove(key)
+        self._batch_keys.clear()
+        self._staged.clear()
+        self._links.clear()
+
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        elapsed = max(elapsed, 1e-9)
+        return {
+            **self.stats,
+            'elapsed_s': round(elapsed, 2),
+            'files_per_s': round(self.stats['files'] / elapsed, 2),
+            'chunks_per_s': round(self.stats['chunks'] / elapsed, 2)
+        }
+
+    def _results(self, pool, tasks: Iterator[Tuple]) -> Iterator[Dict[str, Any]]:
+        """Resultados por archivo a medida que terminan.
+
+        Los PDF grandes vuelven como 'split': sus páginas se reparten en rangos
+        entre los procesos del pool y, con todas las páginas extraídas, el
+        documento se fragmenta y se calcula su embedding en otra tarea.
+
+        Un archivo nuevo sólo se envía al pool cuando hay menos de max_pending
+        tareas en vuelo, así que la cola de resultados no crece mientras el
+        proceso principal confirma lotes. Las tareas de páginas de un PDF ya
+        empezado se envían siempre, para poder terminarlo.
+        """
+        done: 'queue.Queue[Dict[str, Any]]' = queue.Queue()
+        pending = 0
+        pdfs: Dict[str, Dict[str, Any]] = {}
+        tasks = iter(tasks)
+
+        def submit(func, task: Tuple):
+            nonlocal pending
+            pending += 1
+            pool.apply_async(func, (task,), callback=done.put,
+                             error_callback=lambda e: done.put({'status': 'error', 'path': task[0],
+                                                                'error': str(e)}))
+
+        def refill():
+            while pending < self.max_pending:
+                task = next(tasks, None)
+                if task is None:
+                    return
+                submit(process_file, task)
+
+        refill()
+        while pending:
+            result = done.get()
+            pending -= 1
+            refill()
+            status, path = result['status'], result['path']
+            if status == 'split':
+                starts = range(0, result['page_count'], self.pdf_pages_per_task)
+                pdfs[path] = {**result, 'texts': [''] * result['page_count'], 'remaining': len(starts)}
+                for start in starts:
+                    submit(process_pages, (path, start, start + self.pdf_pages_per_task))
+            elif status == 'pages':
+                pdf = pdfs.get(path)
+                if pdf is None:
+                    continue
+                pdf['texts'][result['start']:result['start'] + len(result['texts'])] = result['texts']
+                pdf['remaining'] -= 1
+                if pdf['remaining'] == 0:
+                    del pdfs[path]
+                    extraction = {**assemble_pages(pdf['texts']), 'content_hash': pdf['content_hash']}
+                    submit(process_file, (path, pdf['domain'], None, extraction))
+            elif 'start' in result and path not in pdfs:
+                # Error de otro rango de un PDF ya informado
+                continue
+            else:
+                pdfs.pop(path, None)
+                yield result
+
+    def run(self, path: str) -> Dict[str, Any]:
+        """Ejecuta la ingesta; los lotes confirmados sobreviven a una interrupción y no se reprocesan."""
+        known = self._known_documents()
+        if self.dedup_perm:
+            self._load_signatures()
+        tasks = ((file_path, domain, known.get(file_path, (None, None))[1])
+                 for file_path, domain in self.discover(path))
+        initargs = (self.app.config.get('OPENAI_API_KEY'),
+                    self.app.config.get('EMBEDDING_MODEL', 'text-embedding-3-small'),
+                    self.chunk_tokens, self.embed, self.app.config.get('EMBEDDING_CACHE_PATH'),
+                    self.dedup_perm, self.pdf_pages_per_task)
+
+        started = time.perf_counter()
+        batch: List[Dict[str, Any]] = []
+        with multiprocessing.Pool(self.workers, initializer=_init_worker, initargs=initargs) as pool:
+            for result in self._results(pool, tasks):
+                self.stats['files'] += 1
+                if result['status'] == 'skipped':
+                    self.stats['skipped'] += 1
+                elif result['status'] == 'error':
+                    self.stats['errors'] += 1
+                    logger.error(f"Error procesando {result['path']}: {result['error']}")
+                else:
+                    batch.append(result)
+                    if len(batch) >= self.batch_size:
+                        self._flush(batch, known)
+                if self.stats['files'] % self.report_every == 0:
+                    logger.info(f"Progreso: {self.report(time.perf_counter() - started)}")
+            self._flush(batch, known)
+
+        # La generación vive en la base de datos, así que la ven también los workers web
+        from app.services.llm_cache import llm_cache
+        for domain in self._domains:
+            llm_cache.invalidate_domain(domain)
+        return self.report(time.perf_counter() - started)
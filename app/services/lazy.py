@@ -0,0 +1,124 @@
+import functools
+import importlib
+import threading
+import time
+from typing import Any, Dict, List
+
+# Módulos costosos de importar: se cargan al primer uso o en el maestro de gunicorn
+HEAVY_MODULES = ('ell', 'openai', 'anthropic', 'PIL.Image', 'tiktoken', 'numpy')
+
+_registry: List['LazyLMP'] = []
+
+class LazyLMP:
+    """LMP cuya definición con ell se aplaza hasta la primera llamada.
+
+    Importar un módulo con LMPs no importa ell ni los SDK de los proveedores;
+    al resolverse se inicializa ell (una sola vez por proceso) y se aplica el
+    decorador real. Funciona también como método de una clase.
+    """
+
+    def __init__(self, kind: str, fn, args: tuple, kwargs: Dict[str, Any]):
+        functools.update_wrapper(self, fn)
+        self._kind = kind
+        self._fn = fn
+        self._args = args
+        self._kwargs = kwargs
+        self._lmp = None
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def resolve(self):
+        if self._lmp is None:
+            with self._lock:
+                if self._lmp is None:
+                    import ell
+                    from app.services.ell_recorder import ell_recorder
+                    ell_recorder.ensure_initialized()
+                    kwargs = dict(self._kwargs)
+                    if 'tools' in kwargs:
+                        kwargs['tools'] = [tool.resolve() if isinstance(tool, LazyLMP) else tool
+                                           for tool in kwargs['tools']]
+                    self._lmp = getattr(ell, self._kind)(*self._args, **kwargs)(self._fn)
+        return self._lmp
+
+    def __call__(self, *args, **kwargs):
+        from app.services.model_router import model_router
+
+        lmp = self.resolve()
+        model = self._kwargs.get('model', self._args[0] if self._args else None)
+        if self._kind == 'tool' or model is None or 'client' in kwargs or not model_router.config:
+            return lmp(*args, **kwargs)
+        # El router elige proveedor y modelo en cada llamada y hace failover
+        api_params = kwargs.pop('api_params', None) or {}
+
+        def invoke(endpoint):
+            from app.services.clients import get_client
+            params = {**api_params, 'model': endpoint.model}
+            if endpoint.provider == 'anthropic':
+                params.setdefault('max_tokens', self._kwargs.get('max_tokens', 1024))
+            return lmp(*args, client=get_client(endpoint), api_params=params, **kwargs)
+
+        return model_router.call(model, invoke)
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        return functools.partial(self.__call__, instance)
+
+class _LazyEll:
+    """Decoradores de ell diferidos: ``@lazy_ell.simple(...)``, ``@lazy_ell.complex(...)``, ``@lazy_ell.tool()``."""
+
+    def _decorator(self, kind: str, *args, **kwargs):
+        def decorator(fn):
+            return LazyLMP(kind, fn, args, kwargs)
+        return decorator
+
+    def simple(self, *args, **kwargs):
+        return self._decorator('simple', *args, **kwargs)
+
+    def complex(self, *args, **kwargs):
+        return self._decorator('complex', *args, **kwargs)
+
+    def tool(self, *args, **kwargs):
+        return self._decorator('tool', *args, **kwargs)
+
+lazy_ell = _LazyEll()
+
+def warm_up(app) -> Dict[str, float]:
+    """Carga por adelantado lo que de otro modo se carga en la primera petición.
+
+    Pensado para el maestro de gunicorn con ``preload_app``: los workers
+    heredan los módulos, los LMPs, el tokenizador y los shards de los dominios
+    más usados del índice vectorial por
+    copy-on-write. Retorna la duración de cada paso en milisegundos.
+    """
+    timings = {}
+
+    def step(name: str, fn):
+        started = time.perf_counter()
+        try:
+            fn()
+        except Exception as e:
+            app.logger.warning(f"Precarga de {name} fallida: {str(e)}")
+        timings[name] = (time.perf_counter() - started) * 1000
+
+    for module in HEAVY_MODULES:
+        step(module, lambda: importlib.import_module(module))
+
+    def resolve_lmps():
+        for lmp in list(_registry):
+            lmp.resolve()
+
+    def load_tokenizer():
+        from app.services.chunking import get_encoding
+        get_encoding()
+
+    def load_vector_index():
+        from app.services.vector_index import vector_index
+        vector_index.warm_up()
+
+    with app.app_context():
+        step('lmps', resolve_lmps)
+        step('tokenizer', load_tokenizer)
+        step('vector_index', load_vector_index)
+    return timings
@@ -0,0 +1,101 @@
+import re
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+from flask import current_app
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from app import db
+
+FTS_TABLE = 'documents_fts'
+MAX_TERMS = 32
+TITLE_WEIGHT = 5.0
+CONTENT_WEIGHT = 1.0
+
+SCHEMA = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        title, content, domain UNINDEXED,
+        content='documents', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS documents_fts_ai AFTER INSERT ON documents BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, content, domain)
+        VALUES (new.id, new.title, new.content, new.domain);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS documents_fts_ad AFTER DELETE ON documents BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, content, domain)
+        VALUES ('delete', old.id, old.title, old.content, old.domain);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS documents_fts_au AFTER UPDATE OF title, content, domain ON documents BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, content, domain)
+        VALUES ('delete', old.id, old.title, old.content, old.domain);
+        INSERT INTO {FTS_TABLE}(rowid, title, content, domain)
+        VALUES (new.id, new.title, new.content, new.domain);
+    END""",
+]
+
+def is_available() -> bool:
+    """Indica si la base es SQLite y el índice FTS5 está instalado."""
+    if db.engine.dialect.name != 'sqlite':
+        return False
+    return db.session.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+        {'name': FTS_TABLE}
+    ).first() is not None
+
+def install(rebuild: bool = True):
+    """Crea la tabla FTS5 y los triggers de sincronización (idempotente)."""
+    for statement in SCHEMA:
+        db.session.execute(text(statement))
+    if rebuild:
+        db.session.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+    db.session.commit()
+
+def to_match_query(query: str) -> Optional[str]:
+    """Convierte texto libre en una expresión MATCH segura (términos entre comillas unidos con OR)."""
+    terms = re.findall(r'\w+', query)[:MAX_TERMS]
+    if not terms:
+        return None
+    return ' OR '.join(f'"{term}"' for term in dict.fromkeys(terms))
+
+def search(query: str, domain: Optional[str] = None, k: int = 10,
+           timeout_ms: Optional[int] = None) -> List[Tuple[int, float]]:
+    """Búsqueda BM25 sobre título y contenido; retorna pares (id, score) de mayor a menor.
+
+    La consulta se interrumpe al superar timeout_ms y en ese caso retorna una
+    lista vacía, de modo que la búsqueda híbrida degrada a sólo vectorial.
+    """
+    match = to_match_query(query)
+    if match is None or k <= 0:
+        return []
+    timeout_ms = timeout_ms or current_app.config.get('LEXICAL_SEARCH_TIMEOUT_MS', 200)
+    sql = (f"SELECT rowid, bm25({FTS_TABLE}, {TITLE_WEIGHT}, {CONTENT_WEIGHT}) AS score "
+           f"FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match")
+    params = {'match': match, 'k': k}
+    if domain is not None:
+        sql += " AND domain = :domain"
+        params['domain'] = domain
+    sql += " ORDER BY score LIMIT :k"
+
+    raw = db.session.connection().connection.driver_connection
+    deadline = time.monotonic() + timeout_ms / 1000
+    raw.set_progress_handler(lambda: int(time.monotonic() > deadline), 1000)
+    try:
+        rows = db.session.execute(text(sql), params).fetchall()
+    except OperationalError as e:
+        if 'interrupted' not in str(e):
+            raise
+        current_app.logger.warning(f"Búsqueda léxica interrumpida tras {timeout_ms} ms: {query}")
+        return []
+    finally:
+        raw.set_progress_handler(None, 0)
+    # bm25() retorna valores negativos: más negativo es más relevante
+    return [(row.rowid, -row.score) for row in rows]
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[Tuple[int, float]]],
+                           k: int = 60) -> List[Tuple[int, float]]:
+    """Fusiona rankings con Reciprocal Rank Fusion: score = Σ 1 / (k + rango)."""
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, (doc_id, _) in enumerate(ranking, start=1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
@@ -0,0 +1,260 @@
+import hashlib
+import json
+import sys
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from functools import wraps
+from typing import Any, Callable, Dict, Optional
+from cachelib import BaseCache, FileSystemCache, NullCache, RedisCache
+from flask import Flask
+
+class LRUCache(BaseCache):
+    """Backend en memoria con tamaño acotado (LRU) y expiración por TTL."""
+
+    def __init__(self, max_entries: int = 1000, default_timeout: int = 300):
+        super().__init__(default_timeout)
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expires_at(self, timeout: Optional[int]) -> float:
+        timeout = self._normalize_timeout(timeout)
+        return time.monotonic() + timeout if timeout > 0 else float('inf')
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, timeout: Optional[int] = None) -> bool:
+        with self._lock:
+            self._entries[key] = (self._expires_at(timeout), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return True
+
+    def add(self, key: str, value: Any, timeout: Optional[int] = None) -> bool:
+        if self.has(key):
+            return False
+        return self.set(key, value, timeout)
+
+    def delete(self, key: str) -> bool:
+        with self._lock:
+            return self._entries.pop(key, None) is not None
+
+    def has(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def clear(self) -> bool:
+        with self._lock:
+            self._entries.clear()
+        return True
+
+    def __len__(self):
+        return len(self._entries)
+
+def normalize_text(text: str) -> str:
+    """Normaliza unicode y espacios para que consultas equivalentes compartan clave."""
+    return ' '.join(unicodedata.normalize('NFC', text).split())
+
+def _is_message(value: Any) -> bool:
+    # Si ell aún no se ha importado ningún valor puede ser un Message
+    ell = sys.modules.get('ell')
+    return ell is not None and isinstance(value, ell.Message)
+
+def normalize_value(value: Any) -> Any:
+    """Convierte argumentos de un LMP en una estructura JSON estable."""
+    if _is_message(value):
+        return {'role': value.role, 'text': normalize_text(value.text)}
+    if isinstance(value, str):
+        return normalize_text(value)
+    if isinstance(value, (int, float, bool)) or value is None:
+        return value
+    if isinstance(value, (list, tuple)):
+        return [normalize_value(item) for item in value]
+    if isinstance(value, dict):
+        return {str(k): normalize_value(v) for k, v in sorted(value.items())}
+    # Objetos sin representación estable (p. ej. self) sólo aportan su tipo
+    return type(value).__name__
+
+def is_deterministic(api_params: Dict[str, Any]) -> bool:
+    """Indica si una llamada es cacheable por defecto (sin muestreo ni múltiples respuestas)."""
+    return (api_params.get('temperature') or 0) <= 0 and (api_params.get('n') or 1) <= 1
+
+class LLMCache:
+    """Caché de respuestas de LMPs con backend intercambiable de cachelib.
+
+    La generación de cada dominio, que forma parte de la clave, vive en la base
+    de datos: una ingesta en otro proceso invalida también las respuestas que
+    los workers guardan en su backend ``lru`` en memoria.
+    """
+
+    def __init__(self, app: Flask = None):
+        self.backend: Optional[BaseCache] = None
+        self.timeout = 3600
+        self.generation_ttl = 5.0
+        self._generations: Dict[str, tuple] = {}
+        self._counters = {'hits': 0, 'misses': 0, 'bypass': 0}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask):
+        """Inicializa la extensión con la aplicación Flask."""
+        app.config.setdefault('LLM_CACHE_TYPE', 'lru')
+        app.config.setdefault('LLM_CACHE_TTL', 3600)
+        app.config.setdefault('LLM_CACHE_MAX_ENTRIES', 1000)
+        app.config.setdefault('LLM_CACHE_DIR', './llm_cache')
+        app.config.setdefault('LLM_CACHE_REDIS_URL', None)
+        app.config.setdefault('LLM_CACHE_GENERATION_TTL', 5.0)
+
+        self.timeout = app.config['LLM_CACHE_TTL']
+        self.generation_ttl = app.config['LLM_CACHE_GENERATION_TTL']
+        self._generations = {}
+        self.backend = self._create_backend(app)
+
+        if not hasattr(app, 'extensions'):
+            app.extensions = {}
+        app.extensions['llm_cache'] = self
+
+    def _create_backend(self, app: Flask) -> BaseCache:
+        cache_type = app.config['LLM_CACHE_TYPE']
+        if cache_type == 'lru':
+            return LRUCache(app.config['LLM_CACHE_MAX_ENTRIES'], self.timeout)
+        if cache_type == 'filesystem':
+            return FileSystemCache(app.config['LLM_CACHE_DIR'],
+                                   threshold=app.config['LLM_CACHE_MAX_ENTRIES'],
+                                   default_timeout=self.timeout)
+        if cache_type == 'redis':
+            import redis
+            client = redis.Redis.from_url(app.config['LLM_CACHE_REDIS_URL'])
+            return RedisCache(client, default_timeout=self.timeout, key_prefix='llm:')
+        if cache_type == 'null':
+            return NullCache()
+        raise ValueError(f"Tipo de caché desconocido: {cache_type}")
+
+    def _count(self, name: str):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _generation(self, domain: Optional[str]) -> int:
+        """Generación del dominio, releída de la base de datos cada ``generation_ttl`` segundos."""
+        from app import db
+        from app.models.cache_generation import CacheGeneration
+
+        scope = domain or '*'
+        now = time.monotonic()
+        cached = self._generations.get(scope)
+        if cached is not None and cached[0] > now:
+            return cached[1]
+        generation = db.session.query(CacheGeneration.generation).filter_by(scope=scope).scalar() or 0
+        self._generations[scope] = (now + self.generation_ttl, generation)
+        return generation
+
+    def make_key(self, model: str, api_params: Dict[str, Any], messages: Any,
+                 domain: Optional[str] = None) -> str:
+        """Clave a partir del modelo, los parámetros y la lista de mensajes normalizada."""
+        payload = json.dumps({
+            'model': model,
+            'params': normalize_value(api_params),
+            'messages': normalize_value(messages)
+        }, sort_keys=True, ensure_ascii=False)
+        digest = hashlib.sha256(payload.encode('utf-8')).hexdigest()
+        return f"resp:{domain or '*'}:{self._generation(domain)}:{digest}"
+
+    def get(self, key: str) -> Optional[str]:
+        """Texto cacheado para una clave, registrando acierto o fallo."""
+        hit = self.backend.get(key) if self.backend is not None else None
+        self._count('hits' if hit is not None else 'misses')
+        return hit['text'] if hit is not None else None
+
+    def set(self, key: str, text: str):
+        if self.backend is not None:
+            self.backend.set(key, {'message': False, 'text': text}, self.timeout)
+
+    def invalidate_domain(self, domain: Optional[str] = None):
+        """Invalida todas las respuestas de un dominio incrementando su generación.
+
+        Las respuestas sin dominio (``'*'``) pueden depender de cualquier
+        documento, así que se invalidan también. Los demás procesos ven la
+        nueva generación en menos de ``LLM_CACHE_GENERATION_TTL`` segundos.
+        """
+        from sqlalchemy.exc import IntegrityError
+        from app import db
+        from app.models.cache_generation import CacheGeneration
+
+        for scope in {domain or '*', '*'}:
+            updated = CacheGeneration.query.filter_by(scope=scope) \
+                .update({CacheGeneration.generation: CacheGeneration.generation + 1})
+            if not updated:
+                db.session.add(CacheGeneration(scope=scope, generation=1))
+            try:
+                db.session.commit()
+            except IntegrityError:
+                # Otro proceso creó la fila a la vez
+                db.session.rollback()
+                CacheGeneration.query.filter_by(scope=scope) \
+                    .update({CacheGeneration.generation: CacheGeneration.generation + 1})
+                db.session.commit()
+            self._generations.pop(scope, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+        lookups = counters['hits'] + counters['misses']
+        counters['hit_rate'] = counters['hits'] / lookups if lookups else 0.0
+        return counters
+
+    def cached(self, model: str, cache: Optional[bool] = None, **api_params) -> Callable:
+        """Decorador que cachea las respuestas de un LMP.
+
+        Por defecto sólo se cachean llamadas deterministas; ``cache=True`` fuerza el
+        cacheo y ``cache=False`` lo desactiva. En cada llamada se aceptan además los
+        argumentos ``use_cache`` y ``cache_domain``, que no se pasan al LMP.
+        """
+        enabled = is_deterministic(api_params) if cache is None else cache
+
+        def decorator(lmp: Callable) -> Callable:
+            system_prompt = lmp.__doc__ or ''
+
+            @wraps(lmp)
+            def wrapper(*args, use_cache: bool = True, cache_domain: Optional[str] = None, **kwargs):
+                if self.backend is None or not enabled or not use_cache:
+                    self._count('bypass')
+                    return lmp(*args, **kwargs)
+
+                key = self.make_key(model, api_params,
+                                    [system_prompt, lmp.__name__, list(args), kwargs],
+                                    domain=cache_domain)
+                hit = self.backend.get(key)
+                if hit is not None:
+                    self._count('hits')
+                    if hit['message']:
+                        import ell
+                        return ell.assistant(hit['text'])
+                    return hit['text']
+
+                self._count('misses')
+                result = lmp(*args, **kwargs)
+                if _is_message(result):
+                    # No se cachean respuestas con llamadas a herramientas
+                    if not result.tool_calls:
+                        self.backend.set(key, {'message': True, 'text': result.text}, self.timeout)
+                elif isinstance(result, str):
+                    self.backend.set(key, {'message': False, 'text': result}, self.timeout)
+                return result
+            return wrapper
+        return decorator
+
+# Instancia global de la caché
+llm_cache = LLMCache()
@@ -1,33 +1,66 @@
-from typing import List
-import ell
+from typing import TYPE_CHECKING, List
 from flask import current_app
+from app.services.lazy import lazy_ell
+from app.services.llm_cache import llm_cache
+from config import Config
+
+if TYPE_CHECKING:
+    import ell
+
+@lazy_ell.complex(model=Config.DEFAULT_MODEL, temperature=1.0)
+def ensemble_candidate(query: str) -> List['ell.Message']:
+    """You are a creative assistant that generates multiple alternative responses."""
+    import ell
+    return [
+        ell.system("You are a creative assistant that generates multiple alternative responses."),
+        ell.user(query)
+    ]
+
+@lazy_ell.complex(model=Config.DEFAULT_MODEL, temperature=0.0)
+def ensemble_judge(query: str, candidates: List[str]) -> List['ell.Message']:
+    """You are an expert at selecting the most appropriate response."""
+    import ell
+    options = '\n\n'.join(f"{i + 1}. {text}" for i, text in enumerate(candidates))
+    return [
+        ell.system("You are an expert at selecting the most appropriate response. "
+                   "Select the best response based on clarity, relevance, and helpfulness. "
+                   "Answer only with the number of the chosen option."),
+        ell.user(f"Question:\n{query}\n\nChoose the best response from these options:\n\n{options}")
+    ]
 
 def create_lmps(app=None):
     """Factory para crear Language Model Programs."""
+    import ell
     
+    @llm_cache.cached(model=app.config.get('DEFAULT_MODEL', 'gpt-4'), temperature=0.7)
     @ell.simple(model=app.config.get('DEFAULT_MODEL', 'gpt-4'), temperature=0.7)
     def chat_response(message: str):
         """You are a helpful and friendly assistant."""
         return message
 
+    @llm_cache.cached(model=app.config.get('DEFAULT_MODEL', 'gpt-4'))
     @ell.complex(model=app.config.get('DEFAULT_MODEL', 'gpt-4'))
     def structured_chat(message_history: List[ell.Message]) -> List[ell.Message]:
         """You are a professional assistant that maintains context through conversations."""
+        # message_history debe venir acotado por context_builder.assemble_history
         return [
             ell.system("Maintain conversation context and provide helpful responses."),
         ] + message_history
 
+    @llm_cache.cached(model=app.config.get('DEFAULT_MODEL', 'gpt-4'), cache=False, temperature=1.0, n=3)
     @ell.simple(model=app.config.get('DEFAULT_MODEL', 'gpt-4'), temperature=1.0, n=3)
     def generate_alternatives(prompt: str):
         """You are a creative assistant that generates multiple alternative responses."""
         return f"Generate three different responses for: {prompt}"
 
+    @llm_cache.cached(model=app.config.get('DEFAULT_MODEL', 'gpt-4'), temperature=0.1)
     @ell.complex(model=app.config.get('DEFAULT_MODEL', 'gpt-4'), temperature=0.1)
     def select_best_response(responses: List[str]) -> List[ell.Message]:
         """You are an expert at selecting the most appropriate response."""
+        options = '\n'.join(responses)
         return [
             ell.system("Select the best response based on clarity, relevance, and helpfulness."),
-            ell.user(f"Choose the best response from these options:\n{'\n'.join(responses)}")
+            ell.user(f"Choose the best response from these options:\n{options}")
         ]
     
     return {
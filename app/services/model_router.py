@@ -0,0 +1,386 @@
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional
+from urllib.parse import urlparse
+from flask import Flask
+from app.services.async_llm import provider_for
+
+def is_retryable(error: BaseException) -> bool:
+    """Errores que justifican probar otro endpoint: timeouts, límites de tasa y fallos del servidor."""
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError)):
+        return True
+    if type(error).__name__ in ('APIConnectionError', 'APITimeoutError'):
+        return True
+    status = getattr(error, 'status_code', None)
+    return status is not None and (status in (408, 409, 429) or status >= 500)
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """Segundos indicados por la cabecera Retry-After de un 429, si existe."""
+    response = getattr(error, 'response', None)
+    value = getattr(response, 'headers', {}).get('retry-after') if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+class Endpoint:
+    """Un modelo servido por un proveedor (y opcionalmente una base_url propia).
+
+    Mantiene una ventana móvil de latencias y errores; tras un límite de tasa
+    o una tasa de errores excesiva queda en enfriamiento y deja de preferirse.
+    Un endpoint de respaldo sirve otro modelo y solo se usa en failover o hedging.
+    """
+
+    def __init__(self, provider: str, model: str, base_url: Optional[str] = None,
+                 api_key: Optional[str] = None, name: Optional[str] = None,
+                 window: float = 300.0, max_samples: int = 200, fallback: bool = False):
+        self.provider = provider
+        self.model = model
+        self.fallback = fallback
+        self.base_url = base_url
+        self.api_key = api_key
+        self.name = name or (f"{provider}:{model}@{urlparse(base_url).netloc}" if base_url
+                             else f"{provider}:{model}")
+        # El router reintenta en otro endpoint; el SDK solo reintenta si no hay alternativa
+        self.max_retries = 2
+        self.window = window
+        self.samples = deque(maxlen=max_samples)
+        self.cooldown_until = 0.0
+        self._lock = threading.Lock()
+
+    def _trim(self, now: float):
+        while self.samples and self.samples[0][0] < now - self.window:
+            self.samples.popleft()
+
+    def observe(self, latency: float, ok: bool):
+        now = time.monotonic()
+        with self._lock:
+            self.samples.append((now, latency, ok))
+            self._trim(now)
+
+    def cool_down(self, seconds: float):
+        with self._lock:
+            self.cooldown_until = max(self.cooldown_until, time.monotonic() + seconds)
+
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.cooldown_until
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            self._trim(now)
+            samples = list(self.samples)
+        latencies = sorted(latency for _, latency, ok in samples if ok)
+        errors = sum(1 for _, _, ok in samples if not ok)
+
+        def percentile(q: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return latencies[min(int(q * len(latencies)), len(latencies) - 1)]
+
+        return {
+            'samples': len(samples),
+            'successes': len(latencies),
+            'error_rate': errors / len(samples) if samples else 0.0,
+            'p50': percentile(0.5),
+            'p95': percentile(0.95),
+            'healthy': now >= self.cooldown_until,
+        }
+
+class ModelRouter:
+    """Elige endpoint por latencia, cubre la cola con peticiones de respaldo y hace failover.
+
+    Cada modelo lógico (el que usan los LMPs, p. ej. ``gpt-4o``) se resuelve a
+    una lista de endpoints configurada en ``LLM_ROUTES``. Las peticiones van a
+    la réplica sana más rápida del mismo modelo según la mediana de la ventana;
+    si la primera supera el p95 de su endpoint se lanza una segunda en el
+    siguiente y se cancela la perdedora. Los límites de tasa y timeouts pasan
+    al siguiente. Los endpoints de otro modelo quedan detrás de todas las
+    réplicas sanas: solo reciben hedging y failover.
+    """
+
+    def __init__(self, app: Flask = None):
+        self.config: Dict[str, Any] = {}
+        self._routes: Dict[str, List[Endpoint]] = {}
+        self._lock = threading.Lock()
+        self.counters = {'requests': 0, 'hedges': 0, 'hedge_wins': 0, 'failovers': 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask):
+        """Inicializa la extensión con la aplicación Flask."""
+        app.config.setdefault('LLM_ROUTES', {})
+        app.config.setdefault('LLM_FALLBACK_MODEL', None)
+        app.config.setdefault('LLM_ROUTER_WINDOW', 300.0)
+        app.config.setdefault('LLM_ROUTER_MIN_SAMPLES', 20)
+        app.config.setdefault('LLM_ROUTER_MAX_ERROR_RATE', 0.5)
+        app.config.setdefault('LLM_ROUTER_COOLDOWN', 30.0)
+        app.config.setdefault('LLM_ROUTER_HEDGE', True)
+        app.config.setdefault('LLM_ROUTER_HEDGE_MIN_MS', 200)
+        app.config.setdefault('LLM_ROUTER_PROBE_RATE', 0.05)
+
+        self.config = {
+            'routes': dict(app.config['LLM_ROUTES']),
+            'fallback_model': app.config['LLM_FALLBACK_MODEL'],
+            'window': app.config['LLM_ROUTER_WINDOW'],
+            'min_samples': app.config['LLM_ROUTER_MIN_SAMPLES'],
+            'max_error_rate': app.config['LLM_ROUTER_MAX_ERROR_RATE'],
+            'cooldown': app.config['LLM_ROUTER_COOLDOWN'],
+            'hedge': app.config['LLM_ROUTER_HEDGE'],
+            'hedge_min': app.config['LLM_ROUTER_HEDGE_MIN_MS'] / 1000,
+            'probe_rate': app.config['LLM_ROUTER_PROBE_RATE'],
+            'api_keys': {'openai': app.config.get('OPENAI_API_KEY'),
+                         'anthropic': app.config.get('ANTHROPIC_API_KEY')},
+            'base_urls': {'openai': app.config.get('OPENAI_BASE_URL')},
+        }
+        self._routes = {}
+
+        if not hasattr(app, 'extensions'):
+            app.extensions = {}
+        app.extensions['model_router'] = self
+
+    # Rutas
+
+    def _endpoint(self, model: str, spec: Any) -> Endpoint:
+        if isinstance(spec, str):
+            spec = {'model': spec}
+        provider = spec.get('provider') or provider_for(spec['model'])
+        return Endpoint(provider, spec['model'],
+                        base_url=spec.get('base_url', self.config['base_urls'].get(provider)),
+                        api_key=spec.get('api_key', self.config['api_keys'].get(provider)),
+                        name=spec.get('name'), window=self.config['window'],
+                        fallback=spec.get('fallback', spec['model'] != model))
+
+    def endpoints(self, model: str) -> List[Endpoint]:
+        """Endpoints de un modelo lógico; sin ruta configurada, el propio modelo y el de respaldo."""
+        endpoints = self._routes.get(model)
+        if endpoints is None:
+            with self._lock:
+                endpoints = self._routes.get(model)
+                if endpoints is None:
+                    specs = self.config.get('routes', {}).get(model)
+                    if not specs:
+                        specs = [model]
+                        fallback = self.config.get('fallback_model')
+                        if fallback and fallback != model:
+                            specs.append(fallback)
+                    endpoints = [self._endpoint(model, spec) for spec in specs]
+                    # Con alternativas el failover lo hace el router, no los reintentos del SDK
+                    if len(endpoints) > 1:
+                        for endpoint in endpoints:
+                            endpoint.max_retries = 0
+                    self._routes[model] = endpoints
+        return endpoints
+
+    def ranked(self, model: str) -> List[Endpoint]:
+        """Endpoints ordenados: réplicas sanas del modelo, respaldos sanos y, al final, los que están en enfriamiento.
+
+        Entre las réplicas manda la mediana de las ya medidas; las que aún no
+        tienen muestras suficientes van detrás en el orden configurado y se
+        miden con hedging, failover o, en una fracción ``LLM_ROUTER_PROBE_RATE``
+        de las peticiones, pasando al frente como sonda.
+        """
+        endpoints = self.endpoints(model)
+        measured = {}
+
+        def score(item):
+            position, endpoint = item
+            stats = endpoint.stats()
+            measured[endpoint] = stats['successes'] >= self.config['min_samples']
+            return (not stats['healthy'], endpoint.fallback, not measured[endpoint],
+                    stats['p50'] if measured[endpoint] else 0.0, position)
+
+        ranked = [endpoint for _, endpoint in sorted(enumerate(endpoints), key=score)]
+        probes = [endpoint for endpoint in ranked[1:]
+                  if not measured[endpoint] and not endpoint.fallback and endpoint.healthy()]
+        if probes and measured[ranked[0]] and random.random() < self.config.get('probe_rate', 0.0):
+            ranked.remove(probes[0])
+            ranked.insert(0, probes[0])
+        return ranked
+
+    def hedge_delay(self, endpoint: Endpoint) -> Optional[float]:
+        """Espera antes de lanzar la petición de respaldo: el p95 del endpoint, si está medido."""
+        if not self.config.get('hedge'):
+            return None
+        stats = endpoint.stats()
+        if stats['successes'] < self.config['min_samples']:
+            return None
+        return max(stats['p95'], self.config['hedge_min'])
+
+    def _count(self, name: str):
+        with self._lock:
+            self.counters[name] += 1
+
+    def record_success(self, endpoint: Endpoint, latency: float):
+        endpoint.observe(latency, True)
+
+    def record_failure(self, endpoint: Endpoint, error: BaseException, latency: float):
+        """Registra un error y pone el endpoint en enfriamiento si corresponde."""
+        endpoint.observe(latency, False)
+        if getattr(error, 'status_code', None) == 429:
+            endpoint.cool_down(retry_after(error) or self.config['cooldown'])
+            return
+        stats = endpoint.stats()
+        if stats['samples'] >= min(self.config['min_samples'], 5) and \
+                stats['error_rate'] > self.config['max_error_rate']:
+            endpoint.cool_down(self.config['cooldown'])
+
+    # Llamadas
+
+    async def _attempt(self, endpoint: Endpoint, messages: List[Any], timeout: float, params: Dict[str, Any]) -> str:
+        from app.services.async_llm import llm_pool
+
+        started = time.perf_counter()
+        try:
+            result = await llm_pool.complete(messages, endpoint.model, timeout=timeout,
+                                             endpoint=endpoint, **params)
+        except asyncio.CancelledError:
+            # La perdedora de una petición de respaldo no cuenta como error
+            raise
+        except Exception as e:
+            self.record_failure(endpoint, e, time.perf_counter() - started)
+            raise
+        self.record_success(endpoint, time.perf_counter() - started)
+        return result
+
+    async def complete(self, messages: List[Any], model: str, timeout: Optional[float] = None,
+                       **params) -> str:
+        """Corrutina con hedging y failover; debe ejecutarse en el loop del pool."""
+        from app.services.async_llm import llm_pool
+
+        loop = asyncio.get_running_loop()
+        timeout = timeout or llm_pool.config['timeout']
+        deadline = loop.time() + timeout
+        queue = self.ranked(model)
+        running: Dict[asyncio.Future, Endpoint] = {}
+        hedges = set()
+        last_error: Optional[BaseException] = None
+        self._count('requests')
+
+        def launch() -> asyncio.Future:
+            endpoint = queue.pop(0)
+            task = asyncio.ensure_future(self._attempt(endpoint, messages, deadline - loop.time(), dict(params)))
+            running[task] = endpoint
+            return task
+
+        primary = launch()
+        delay = self.hedge_delay(running[primary])
+        hedge_at = loop.time() + delay if delay is not None and queue else None
+        try:
+            while running:
+                now = loop.time()
+                if now >= deadline:
+                    break
+                wait = deadline - now
+                if hedge_at is not None:
+                    wait = min(wait, max(hedge_at - now, 0))
+                done, _ = await asyncio.wait(running, timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    del running[task]
+                # Se consultan todas las excepciones para que ninguna quede sin recuperar
+                failed = [task for task in done if task.exception() is not None]
+                for task in done:
+                    if task not in failed:
+                        if task in hedges:
+                            self._count('hedge_wins')
+                        return task.result()
+                for task in failed:
+                    last_error = task.exception()
+                    if not is_retryable(last_error):
+                        raise last_error
+                if not running and queue and loop.time() < deadline:
+                    # Failover: la petición falló y no hay otra en curso
+                    self._count('failovers')
+                    launch()
+                    hedge_at = None
+                elif hedge_at is not None and loop.time() >= hedge_at and running and queue:
+                    # La primera superó el p95 de su endpoint: petición de respaldo
+                    self._count('hedges')
+                    hedges.add(launch())
+                    hedge_at = None
+        finally:
+            # En cualquier salida (respuesta, error no reintentable, plazo o
+            # cancelación) las peticiones que siguen en curso se cancelan
+            for task in running:
+                task.cancel()
+        if last_error is not None and loop.time() < deadline:
+            raise last_error
+        raise TimeoutError(f"Sin respuesta de {model} tras {timeout} s")
+
+    async def stream(self, messages: List[Any], model: str, timeout: Optional[float] = None,
+                     **params) -> AsyncIterator[str]:
+        """Generador asíncrono de fragmentos con orden por latencia y failover, sin hedging.
+
+        Sólo se pasa a otro endpoint si el fallo llega antes del primer
+        fragmento; después la respuesta ya está a medias en el cliente.
+        """
+        from app.services.async_llm import llm_pool
+
+        last_error: Optional[BaseException] = None
+        self._count('requests')
+        for attempt, endpoint in enumerate(self.ranked(model)):
+            if attempt:
+                self._count('failovers')
+            started = time.perf_counter()
+            streaming = False
+            try:
+                async for chunk in llm_pool.stream(messages, endpoint.model, timeout=timeout,
+                                                   endpoint=endpoint, **params):
+                    streaming = True
+                    yield chunk
+            except Exception as e:
+                self.record_failure(endpoint, e, time.perf_counter() - started)
+                if streaming or not is_retryable(e):
+                    raise
+                last_error = e
+                continue
+            self.record_success(endpoint, time.perf_counter() - started)
+            return
+        raise last_error
+
+    def call(self, model: str, invoke: Callable[[Endpoint], Any]) -> Any:
+        """Versión síncrona para LMPs de ell: orden por latencia y failover, sin hedging.
+
+        El cuerpo de un LMP puede depender del contexto de la aplicación del
+        hilo que lo llama, así que no se duplica en otro hilo.
+        """
+        last_error: Optional[BaseException] = None
+        self._count('requests')
+        for attempt, endpoint in enumerate(self.ranked(model)):
+            if attempt:
+                self._count('failovers')
+            started = time.perf_counter()
+            try:
+                result = invoke(endpoint)
+            except Exception as e:
+                self.record_failure(endpoint, e, time.perf_counter() - started)
+                if not is_retryable(e):
+                    raise
+                last_error = e
+                continue
+            self.record_success(endpoint, time.perf_counter() - started)
+            return result
+        raise last_error
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {endpoint.name: {'model': model, **endpoint.stats()}
+                for model, endpoints in list(self._routes.items()) for endpoint in endpoints}
+
+def router_metrics() -> Iterator[tuple]:
+    """Estado de los endpoints y contadores de hedging y failover."""
+    for name, value in model_router.counters.items():
+        yield (f"llm_router_{name}_total", 'counter', 'Decisiones del router de modelos', (), value)
+    for name, stats in model_router.stats().items():
+        labels = (('endpoint', name), ('model', stats['model']))
+        yield 'llm_endpoint_healthy', 'gauge', 'Endpoint fuera de enfriamiento', labels, int(stats['healthy'])
+        yield 'llm_endpoint_error_rate', 'gauge', 'Fracción de errores en la ventana', labels, stats['error_rate']
+        for q in ('p50', 'p95'):
+            if stats[q] is not None:
+                yield ('llm_endpoint_latency_seconds', 'gauge', 'Latencia en la ventana',
+                       labels + (('quantile', q),), stats[q])
+
+# Instancia global del router
+model_router = ModelRouter()
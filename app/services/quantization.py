@@ -0,0 +1,84 @@
+from typing import Optional, Tuple
+import numpy as np
+
+MODES = ('none', 'int8', 'binary')
+# Filas por bloque al puntuar: acota la memoria temporal de los códigos convertidos
+BLOCK_ROWS = 4096
+# Popcount por byte para NumPy < 2.0, que no tiene np.bitwise_count
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+def popcount(codes: np.ndarray) -> np.ndarray:
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(codes)
+    return _POPCOUNT[codes]
+
+def code_shape(mode: str, dim: int) -> Tuple[int, np.dtype]:
+    """Ancho y tipo de los códigos de un vector de dimensión dim."""
+    if mode == 'int8':
+        return dim, np.dtype(np.int8)
+    if mode == 'binary':
+        return (dim + 7) // 8, np.dtype(np.uint8)
+    return dim, np.dtype(np.float32)
+
+def bytes_per_vector(mode: str, dim: int) -> int:
+    """Memoria por vector, incluida la escala del modo int8."""
+    width, dtype = code_shape(mode, dim)
+    return width * dtype.itemsize + (4 if mode == 'int8' else 0)
+
+def encode(mode: str, vectors: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """Códigos (y escalas por fila en int8) de una matriz de vectores normalizados."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if mode == 'int8':
+        # Escala simétrica por vector: el mayor componente en valor absoluto pasa a ±127
+        scales = np.abs(vectors).max(axis=1) / 127
+        scales[scales == 0] = 1
+        codes = np.rint(vectors / scales[:, None]).astype(np.int8)
+        return codes, scales.astype(np.float32)
+    if mode == 'binary':
+        return np.packbits(vectors > 0, axis=1), None
+    return vectors, None
+
+def encode_blocks(mode: str, vectors: np.ndarray,
+                  block: int = BLOCK_ROWS) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """encode por bloques, para leer un segmento mapeado sin materializarlo entero en float32."""
+    width, dtype = code_shape(mode, vectors.shape[1])
+    codes = np.empty((len(vectors), width), dtype=dtype)
+    scales = np.empty(len(vectors), dtype=np.float32) if mode == 'int8' else None
+    for start in range(0, len(vectors), block):
+        chunk_codes, chunk_scales = encode(mode, vectors[start:start + block])
+        codes[start:start + len(chunk_codes)] = chunk_codes
+        if scales is not None:
+            scales[start:start + len(chunk_codes)] = chunk_scales
+    return codes, scales
+
+def scores(mode: str, codes: np.ndarray, scales: Optional[np.ndarray], query: np.ndarray,
+           block: int = BLOCK_ROWS) -> np.ndarray:
+    """Similitud aproximada entre la consulta (float32 normalizada) y cada fila de codes.
+
+    int8 usa el producto con la consulta sin cuantizar (asimétrico); binary
+    usa la distancia de Hamming sobre los bits de signo, convertida a
+    1 - 2·h/dim para que un valor mayor signifique más parecido.
+    """
+    if mode == 'none':
+        return codes @ query
+    result = np.empty(len(codes), dtype=np.float32)
+    if mode == 'binary':
+        bits = np.packbits(query > 0)
+        dim = query.shape[0]
+        for start in range(0, len(codes), block):
+            chunk = codes[start:start + block]
+            hamming = popcount(np.bitwise_xor(chunk, bits)).sum(axis=1, dtype=np.int32)
+            result[start:start + len(chunk)] = 1 - 2 * hamming / dim
+        return result
+    for start in range(0, len(codes), block):
+        chunk = codes[start:start + block]
+        result[start:start + len(chunk)] = (chunk.astype(np.float32) @ query) * scales[start:start + len(chunk)]
+    return result
+
+def top_k(values: np.ndarray, k: int) -> np.ndarray:
+    """Índices de los k valores mayores, ordenados de mayor a menor."""
+    k = min(k, len(values))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    top = np.argpartition(-values, k - 1)[:k]
+    return top[np.argsort(-values[top])]
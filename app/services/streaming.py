@@ -0,0 +1,97 @@
+import json
+import queue
+import time
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional
+from flask import current_app
+from markupsafe import escape
+
+if TYPE_CHECKING:
+    from ell import Message
+
+_END = object()
+
+class CompletionStream:
+    """Itera los tokens de una completion y registra el tiempo al primer token.
+
+    El stream corre en el loop del pool de LLM a través del router: ocupa un
+    cupo de concurrencia mientras dura, el endpoint elige el cliente (OpenAI
+    o Anthropic) y un fallo antes del primer token pasa al siguiente.
+    """
+
+    def __init__(self, messages: List['Message'], model: Optional[str] = None, **api_params):
+        self.messages = messages
+        self.model = model or current_app.config['DEFAULT_MODEL']
+        self.api_params = api_params
+        self.started_at = None
+        self.ttft = None
+        self.elapsed = None
+        self.text = ''
+
+    def __iter__(self) -> Iterator[str]:
+        from app.services.async_llm import llm_pool
+        from app.services.model_router import model_router
+        from app.services.telemetry import telemetry
+
+        logger = current_app.logger
+        self.started_at = time.perf_counter()
+        chunks: 'queue.Queue[Any]' = queue.Queue()
+
+        async def pump():
+            try:
+                async for chunk in model_router.stream(self.messages, self.model, **self.api_params):
+                    chunks.put(chunk)
+            except Exception as e:
+                chunks.put(e)
+            else:
+                chunks.put(_END)
+
+        future = llm_pool.submit(pump())
+        parts = []
+        try:
+            while (chunk := chunks.get()) is not _END:
+                if isinstance(chunk, Exception):
+                    raise chunk
+                if self.ttft is None:
+                    self.ttft = time.perf_counter() - self.started_at
+                    telemetry.record_ttft(self.model, self.ttft)
+                    logger.info(f"TTFT {self.model}: {self.ttft * 1000:.0f} ms")
+                parts.append(chunk)
+                yield chunk
+        finally:
+            # Si el cliente se desconecta se cancela el stream, que cierra la conexión y libera el cupo
+            future.cancel()
+            self.elapsed = time.perf_counter() - self.started_at
+            self.text = ''.join(parts)
+
+    def timings(self) -> Dict[str, Any]:
+        return {
+            'ttft_ms': round(self.ttft * 1000, 1) if self.ttft is not None else None,
+            'total_ms': round(self.elapsed * 1000, 1) if self.elapsed is not None else None
+        }
+
+def sse_event(data: str, event: Optional[str] = None) -> str:
+    """Formatea un evento Server-Sent Events."""
+    lines = [f"event: {event}"] if event else []
+    lines.extend(f"data: {line}" for line in data.split('\n'))
+    return '\n'.join(lines) + '\n\n'
+
+def html_events(stream: CompletionStream) -> Iterator[str]:
+    """Eventos SSE con fragmentos HTML para el widget HTMX."""
+    try:
+        for delta in stream:
+            yield sse_event(str(escape(delta)).replace('\n', '<br>'), event='message')
+    except Exception as e:
+        current_app.logger.error(f"Error en streaming: {str(e)}")
+        yield sse_event('Error al procesar la consulta', event='error')
+    yield sse_event(json.dumps(stream.timings()), event='done')
+
+def json_events(stream: CompletionStream) -> Iterator[str]:
+    """Eventos SSE con payloads JSON para clientes de la API."""
+    try:
+        for delta in stream:
+            yield sse_event(json.dumps({'delta': delta}))
+    except Exception as e:
+        current_app.logger.error(f"Error en streaming: {str(e)}")
+        yield sse_event(json.dumps({'error': 'Error interno del servidor'}), event='error')
+        return
+    yield sse_event(json.dumps({'done': True, **stream.timings()}), event='done')
@@ -0,0 +1,334 @@
+import bisect
+import cProfile
+import io
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from flask import Flask, current_app, g, has_request_context, request
+
+# Límites de los histogramas de latencia, en segundos
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+def _labels(labels: Dict[str, str]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ''
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + '}'
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name, self.help, self.type = name, help, 'counter'
+        self._values: Dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = _labels(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> Iterator[Tuple[str, Labels, float]]:
+        with self._lock:
+            items = list(self._values.items())
+        for labels, value in items:
+            yield self.name, labels, value
+
+class Gauge(Counter):
+    def __init__(self, name: str, help: str):
+        super().__init__(name, help)
+        self.type = 'gauge'
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[_labels(labels)] = value
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name, self.help, self.type = name, help, 'histogram'
+        self.buckets = buckets
+        self._values: Dict[Labels, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _labels(labels)
+        with self._lock:
+            # Conteos por bucket (no acumulados), desborde, suma y total
+            state = self._values.setdefault(key, [0.0] * (len(self.buckets) + 3))
+            state[bisect.bisect_left(self.buckets, value)] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def samples(self) -> Iterator[Tuple[str, Labels, float]]:
+        with self._lock:
+            items = [(labels, list(state)) for labels, state in self._values.items()]
+        for labels, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                yield f"{self.name}_bucket", labels + (('le', repr(bound)),), cumulative
+            yield f"{self.name}_bucket", labels + (('le', '+Inf'),), state[-1]
+            yield f"{self.name}_sum", labels, state[-2]
+            yield f"{self.name}_count", labels, state[-1]
+
+class Telemetry:
+    """Spans por etapa, cabecera Server-Timing, métricas en formato Prometheus y perfilado opcional.
+
+    Las métricas son por proceso: con varios workers cada uno expone las suyas.
+    """
+
+    def __init__(self, app: Flask = None):
+        self.request_duration = Histogram('http_request_duration_seconds',
+                                          'Duración de las peticiones HTTP')
+        self.requests_in_flight = Gauge('http_requests_in_flight', 'Peticiones en curso')
+        self.stage_duration = Histogram('request_stage_duration_seconds',
+                                        'Duración de cada etapa de una petición')
+        self.llm_duration = Histogram('llm_request_duration_seconds',
+                                      'Duración de las llamadas a los modelos')
+        self.llm_ttft = Histogram('llm_time_to_first_token_seconds',
+                                  'Tiempo hasta el primer token en respuestas en streaming')
+        self.llm_tokens = Counter('llm_tokens_total', 'Tokens consumidos por modelo y tipo')
+        self._metrics = [self.request_duration, self.requests_in_flight, self.stage_duration,
+                         self.llm_duration, self.llm_ttft, self.llm_tokens]
+        self._collectors: List[Callable[[], Iterator[Tuple[str, str, str, Labels, float]]]] = []
+        self._profile_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask):
+        """Inicializa la extensión con la aplicación Flask."""
+        app.config.setdefault('SERVER_TIMING', True)
+        app.config.setdefault('METRICS_TOKEN', None)
+        app.config.setdefault('PROFILING_TOKEN', None)
+        app.config.setdefault('PROFILE_DIR', './profiles')
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+        from flask import before_render_template, template_rendered
+        before_render_template.connect(self._before_render, app)
+        template_rendered.connect(self._after_render, app)
+        self._register_db_events()
+        if service_metrics not in self._collectors:
+            self.add_collector(service_metrics)
+
+        if not hasattr(app, 'extensions'):
+            app.extensions = {}
+        app.extensions['telemetry'] = self
+
+    # Spans
+
+    def record(self, stage: str, seconds: float):
+        """Registra la duración de una etapa en el histograma y en la petición actual."""
+        self.stage_duration.observe(seconds, stage=stage)
+        if has_request_context():
+            spans = g.setdefault('_spans', {})
+            total, count = spans.get(stage, (0.0, 0))
+            spans[stage] = (total + seconds, count + 1)
+
+    @contextmanager
+    def span(self, stage: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - started)
+
+    # Hooks de petición
+
+    def _before_request(self):
+        g._request_started = time.perf_counter()
+        g._in_flight_endpoint = request.endpoint or 'unknown'
+        self.requests_in_flight.inc(endpoint=g._in_flight_endpoint)
+        self._start_profile()
+
+    def _after_request(self, response):
+        started = g.pop('_request_started', None)
+        if started is None:
+            return response
+        elapsed = time.perf_counter() - started
+        self.request_duration.observe(elapsed, endpoint=request.endpoint or 'unknown',
+                                      method=request.method, status=response.status_code)
+        self._finish_profile(response)
+        if current_app.config['SERVER_TIMING']:
+            response.headers['Server-Timing'] = self.server_timing(elapsed)
+        return response
+
+    def _teardown_request(self, exc=None):
+        endpoint = g.pop('_in_flight_endpoint', None)
+        if endpoint is not None:
+            self.requests_in_flight.dec(endpoint=endpoint)
+        profiler = g.pop('_profiler', None)
+        if profiler is not None:
+            profiler.disable()
+            self._profile_lock.release()
+
+    def server_timing(self, total: float) -> str:
+        """Valor de la cabecera Server-Timing con las etapas medidas en la petición."""
+        parts = []
+        for stage, (seconds, count) in g.get('_spans', {}).items():
+            desc = f';desc="{count}x"' if count > 1 else ''
+            parts.append(f"{stage};dur={seconds * 1000:.1f}{desc}")
+        parts.append(f"total;dur={total * 1000:.1f}")
+        return ', '.join(parts)
+
+    def _before_render(self, sender, template, context, **extra):
+        g._render_started = time.perf_counter()
+
+    def _after_render(self, sender, template, context, **extra):
+        started = g.pop('_render_started', None)
+        if started is not None:
+            self.record('render', time.perf_counter() - started)
+
+    def _register_db_events(self):
+        from sqlalchemy import event
+        from sqlalchemy.engine import Engine
+
+        if event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+            return
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+    # Modelos
+
+    def record_llm(self, provider: str, model: str, seconds: float):
+        self.llm_duration.observe(seconds, provider=provider, model=model)
+
+    def record_ttft(self, model: str, seconds: float):
+        self.llm_ttft.observe(seconds, model=model)
+
+    def record_tokens(self, model: str, prompt: Optional[int], completion: Optional[int]):
+        if prompt:
+            self.llm_tokens.inc(prompt, model=model, kind='prompt')
+        if completion:
+            self.llm_tokens.inc(completion, model=model, kind='completion')
+
+    # Perfilado
+
+    def _start_profile(self):
+        token = current_app.config['PROFILING_TOKEN']
+        if not token or request.headers.get('X-Profile') != token:
+            return
+        # cProfile admite un solo perfilador activo por proceso
+        if not self._profile_lock.acquire(blocking=False):
+            return
+        profiler = cProfile.Profile()
+        g._profiler = profiler
+        profiler.enable()
+
+    def _finish_profile(self, response):
+        profiler = g.pop('_profiler', None)
+        if profiler is None:
+            return
+        profiler.disable()
+        self._profile_lock.release()
+        directory = current_app.config['PROFILE_DIR']
+        os.makedirs(directory, exist_ok=True)
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{request.endpoint or 'unknown'}.prof"
+        path = os.path.join(directory, name)
+        profiler.dump_stats(path)
+        summary = io.StringIO()
+        pstats.Stats(profiler, stream=summary).sort_stats('cumulative').print_stats(20)
+        current_app.logger.info(f"Perfil de {request.path} guardado en {path}\n{summary.getvalue()}")
+        response.headers['X-Profile-File'] = name
+
+    # Exportación
+
+    def add_collector(self, collector: Callable[[], Iterator[Tuple[str, str, str, Labels, float]]]):
+        """Registra una función que produce (nombre, tipo, ayuda, etiquetas, valor) al exportar."""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        """Métricas en el formato de texto de Prometheus."""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+        declared = set()
+        for collector in self._collectors:
+            for name, type_, help, labels, value in collector():
+                if name not in declared:
+                    lines.append(f"# HELP {name} {help}")
+                    lines.append(f"# TYPE {name} {type_}")
+                    declared.add(name)
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+        return '\n'.join(lines) + '\n'
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('_query_started', []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('_query_started')
+    if started:
+        telemetry.record('db', time.perf_counter() - started.pop())
+
+def service_metrics() -> Iterator[Tuple[str, str, str, Labels, float]]:
+    """Estado de la caché, la coalescencia, el pool de modelos, el registro de ell y el router."""
+    from app.services.async_llm import llm_pool
+    from app.services.coalescing import single_flight
+    from app.services.ell_recorder import ell_recorder
+    from app.services.llm_cache import llm_cache
+
+    cache = llm_cache.stats()
+    for result in ('hits', 'misses', 'bypass'):
+        yield ('llm_cache_requests_total', 'counter', 'Consultas a la caché de respuestas',
+               (('result', result),), cache[result])
+    yield 'llm_cache_hit_ratio', 'gauge', 'Fracción de aciertos de la caché', (), cache['hit_rate']
+
+    flights = single_flight.stats()
+    yield 'llm_calls_total', 'counter', 'Llamadas a modelos iniciadas', (), flights['calls']
+    yield ('llm_coalesced_total', 'counter', 'Llamadas ahorradas por coalescencia',
+           (), flights['coalesced'])
+    yield 'llm_in_flight', 'gauge', 'Llamadas en curso en el pool asíncrono', (), llm_pool.in_flight
+
+    for name, value in ell_recorder.stats().items():
+        yield (f"ell_recorder_{name}", 'gauge' if name == 'pending' else 'counter',
+               'Registro diferido de invocaciones de ell', (), value)
+
+    from app.services.embedding_cache import embedding_cache
+    embeddings = embedding_cache.stats()
+    for result in ('hot_hits', 'disk_hits', 'misses', 'errors'):
+        yield ('embedding_cache_requests_total', 'counter', 'Consultas a la caché de embeddings',
+               (('result', result),), embeddings[result])
+    yield 'embedding_cache_hot_entries', 'gauge', 'Vectores en el LRU de embeddings', (), embeddings['hot_entries']
+
+    from app.services.vector_index import vector_index
+    for name, value in vector_index.stats().items():
+        yield (f"vector_index_{name}", 'counter' if name in ('loads', 'evictions', 'hits', 'misses', 'reloads') else 'gauge',
+               'Shards del índice vectorial por dominio', (), value)
+
+    from app.services.tools import tool_executor
+    for name, value in tool_executor.stats().items():
+        yield 'llm_tool_calls_total', 'counter', 'Llamadas a herramientas', (('result', name),), value
+
+    from app.services.model_router import router_metrics
+    yield from router_metrics()
+
+def traced_jwt_required(**options) -> Callable:
+    """Equivalente a ``jwt_required`` que mide la verificación del token como etapa ``jwt``."""
+    from flask_jwt_extended import verify_jwt_in_request
+
+    def wrapper(fn):
+        @wraps(fn)
+        def decorator(*args, **kwargs):
+            with telemetry.span('jwt'):
+                verify_jwt_in_request(**options)
+            return current_app.ensure_sync(fn)(*args, **kwargs)
+        return decorator
+    return wrapper
+
+# Instancia global de la telemetría
+telemetry = Telemetry()
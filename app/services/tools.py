@@ -0,0 +1,127 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+from flask import Flask, current_app
+from app.services.lazy import lazy_ell
+from app.services.llm_cache import llm_cache
+
+if TYPE_CHECKING:
+    from ell import Message
+
+@lazy_ell.tool()
+def search_documents(query: str, max_results: int = 5, domain: Optional[str] = None) -> str:
+    """Search the expert documents and return the most relevant passages with their source."""
+    from app.services.context_builder import format_passages
+    from app.services.ell_service import ell_service
+
+    results = ell_service.retrieve_passages(query, domain=domain, max_documents=max(1, min(max_results, 10)))
+    if not results:
+        return f"No relevant content found for: {query}"
+    return format_passages(results)
+
+class ToolExecutor:
+    """Ejecuta las llamadas a herramientas de un turno en paralelo y las memoiza por conversación.
+
+    Cada llamada corre en un hilo del pool con su propio contexto de
+    aplicación (y por tanto su propia sesión de base de datos). Los
+    resultados se guardan en la caché de respuestas con la conversación en
+    la clave, así que repetir una búsqueda en el mismo chat no vuelve a
+    consultar el índice.
+    """
+
+    def __init__(self, app: Flask = None):
+        self.config: Dict[str, Any] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._counters = {'executed': 0, 'memoized': 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask):
+        """Inicializa la extensión con la aplicación Flask."""
+        app.config.setdefault('TOOL_MAX_WORKERS', 8)
+        app.config.setdefault('TOOL_CACHE_TTL', 600)
+        app.config.setdefault('TOOL_MAX_ROUNDS', 3)
+
+        self.config = {
+            'max_workers': app.config['TOOL_MAX_WORKERS'],
+            'cache_ttl': app.config['TOOL_CACHE_TTL'],
+            'max_rounds': app.config['TOOL_MAX_ROUNDS'],
+        }
+
+        if not hasattr(app, 'extensions'):
+            app.extensions = {}
+        app.extensions['tools'] = self
+
+    def _ensure_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.config['max_workers'],
+                                                        thread_name_prefix='ell-tools')
+        return self._executor
+
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            self._counters[name] += amount
+
+    @staticmethod
+    def _key(tool_call, conversation: Optional[str]) -> str:
+        return llm_cache.make_key('tool', {'conversation': conversation},
+                                  [tool_call.tool.__name__, tool_call.params.model_dump()])
+
+    @staticmethod
+    def _result_block(tool_call_id: str, texts: List[str]):
+        from ell.types.message import ContentBlock, ToolResult
+        return ContentBlock(tool_result=ToolResult(tool_call_id=tool_call_id,
+                                                   result=[ContentBlock(text=text) for text in texts]))
+
+    def run(self, message: 'Message', conversation: Optional[str] = None) -> 'Message':
+        """Mensaje con los resultados de las llamadas de message, en el mismo orden."""
+        from ell import Message
+
+        app = current_app._get_current_object()
+        calls = [block.tool_call for block in message.content if block.tool_call]
+        memo = llm_cache.backend if conversation is not None else None
+        keys = [self._key(call, conversation) for call in calls]
+
+        texts: Dict[str, List[str]] = {}
+        if memo is not None:
+            for key in set(keys):
+                hit = memo.get(key)
+                if hit is not None:
+                    texts[key] = hit
+            self._count('memoized', sum(1 for key in keys if key in texts))
+
+        def execute(tool_call) -> Optional[List[str]]:
+            with app.app_context():
+                try:
+                    block = tool_call.call_and_collect_as_content_block()
+                except Exception as e:
+                    app.logger.error(f"Error en la herramienta {tool_call.tool.__name__}: {str(e)}")
+                    return None
+            return [str(content.text) for content in block.tool_result.result]
+
+        # Las llamadas repetidas dentro del mismo turno se ejecutan una sola vez
+        pending = {key: call for key, call in zip(keys, calls) if key not in texts}
+        futures = {key: self._ensure_executor().submit(execute, call) for key, call in pending.items()}
+        for key, future in futures.items():
+            result = future.result()
+            if result is None:
+                # El error se informa al modelo y no se memoiza
+                texts[key] = [f"Tool {pending[key].tool.__name__} failed."]
+                continue
+            texts[key] = result
+            if memo is not None:
+                memo.set(key, result, self.config['cache_ttl'])
+        self._count('executed', len(futures))
+
+        return Message(role='user', content=[self._result_block(call.tool_call_id, texts[key])
+                                             for key, call in zip(keys, calls)])
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counters)
+
+# Instancia global del ejecutor de herramientas
+tool_executor = ToolExecutor()
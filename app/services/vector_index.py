@@ -0,0 +1,539 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from flask import Flask
+from sqlalchemy import event, or_
+from sqlalchemy.orm import object_session
+from app import db
+from app.services import quantization
+
+class _Partition:
+    """Matriz contigua de embeddings normalizados para un dominio.
+
+    Con cuantización la matriz guarda los códigos (int8 con una escala por
+    fila, o bits de signo empaquetados) y search devuelve puntuaciones
+    aproximadas que el índice vuelve a calcular con precisión completa.
+    """
+
+    def __init__(self, dim: int, capacity: int = 1024, mode: str = 'none'):
+        width, dtype = quantization.code_shape(mode, dim)
+        self.dim = dim
+        self.mode = mode
+        self.matrix = np.zeros((capacity, width), dtype=dtype)
+        self.scales = np.zeros(capacity, dtype=np.float32) if mode == 'int8' else None
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.rows: Dict[int, int] = {}
+        self.size = 0
+        # Ids del segmento cuyo vector mapeado ya no es el vigente
+        self.overrides = set()
+        self.marker = None
+
+    @classmethod
+    def from_view(cls, ids: np.ndarray, matrix: np.ndarray, mode: str = 'none') -> '_Partition':
+        """Crea una partición sobre vistas existentes (p. ej. memoria mapeada).
+
+        Sin cuantización no se copian; con ella se codifican por bloques y
+        sólo los códigos quedan residentes.
+        """
+        partition = cls.__new__(cls)
+        partition.dim = matrix.shape[1]
+        partition.mode = mode
+        partition.matrix, partition.scales = (quantization.encode_blocks(mode, matrix) if mode != 'none'
+                                              else (matrix, None))
+        partition.ids = ids
+        partition.rows = {int(doc_id): row for row, doc_id in enumerate(ids)}
+        partition.size = len(ids)
+        partition.overrides = set()
+        partition.marker = None
+        return partition
+
+    @property
+    def nbytes(self) -> int:
+        return self.matrix.nbytes + self.ids.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def _grow(self, needed: int):
+        capacity = self.matrix.shape[0]
+        if needed <= capacity and self.matrix.flags.writeable and self.ids.flags.writeable:
+            return
+        # Las vistas de solo lectura se copian en la primera modificación
+        capacity = max(capacity, 1)
+        while capacity < needed:
+            capacity *= 2
+        matrix = np.zeros((capacity, self.matrix.shape[1]), dtype=self.matrix.dtype)
+        matrix[:self.size] = self.matrix[:self.size]
+        ids = np.zeros(capacity, dtype=np.int64)
+        ids[:self.size] = self.ids[:self.size]
+        if self.scales is not None:
+            scales = np.zeros(capacity, dtype=np.float32)
+            scales[:self.size] = self.scales[:self.size]
+            self.scales = scales
+        self.matrix, self.ids = matrix, ids
+
+    def add(self, doc_id: int, vector: np.ndarray):
+        row = self.rows.get(doc_id)
+        self._grow(self.size + (row is None))
+        if row is None:
+            row = self.size
+            self.size += 1
+            self.rows[doc_id] = row
+            self.ids[row] = doc_id
+        codes, scales = quantization.encode(self.mode, vector[None])
+        self.matrix[row] = codes[0]
+        if self.scales is not None:
+            self.scales[row] = scales[0]
+
+    def remove(self, doc_id: int) -> bool:
+        self.overrides.discard(doc_id)
+        row = self.rows.pop(doc_id, None)
+        if row is None:
+            return False
+        self._grow(self.size)
+        last = self.size - 1
+        if row != last:
+            # Mover la última fila al hueco para mantener la matriz contigua
+            moved_id = int(self.ids[last])
+            self.matrix[row] = self.matrix[last]
+            if self.scales is not None:
+                self.scales[row] = self.scales[last]
+            self.ids[row] = moved_id
+            self.rows[moved_id] = row
+        self.size = last
+        return True
+
+    def search(self, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        if self.size == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        scales = self.scales[:self.size] if self.scales is not None else None
+        scores = quantization.scores(self.mode, self.matrix[:self.size], scales, query)
+        top = quantization.top_k(scores, k)
+        return self.ids[top], scores[top]
+
+class VectorIndex:
+    """Índice vectorial en memoria con búsqueda top-k por coseno, en un shard por dominio.
+
+    Cada shard se carga en la primera consulta de su dominio: la porción del
+    segmento mapeado más los documentos posteriores leídos de la base. Un LRU
+    descarta los shards menos usados cuando la memoria residente supera
+    VECTOR_INDEX_MAX_MB, y warm_up precarga los dominios con más tráfico.
+
+    Los cambios confirmados en este proceso se aplican al momento; los de
+    otros procesos (p. ej. scripts/load_documents.py) se detectan cada
+    VECTOR_INDEX_SYNC_INTERVAL segundos comparando el número de filas y el
+    último updated_at del dominio, y el shard se vuelve a cargar.
+
+    Con VECTOR_INDEX_QUANTIZATION (int8 o binary) los shards guardan sólo
+    códigos cuantizados; la primera pasada los recorre y los
+    k·VECTOR_INDEX_RERANK_FACTOR mejores candidatos se puntúan de nuevo con
+    los vectores float32 del segmento o de la base.
+    """
+
+    def __init__(self, app: Flask = None):
+        self._shards: 'OrderedDict[str, _Partition]' = OrderedDict()
+        self._known: Optional[set] = None
+        self._segment = None
+        self._checked: Dict[str, float] = {}
+        self._synced_at = 0.0
+        self._loading: Dict[str, list] = {}
+        self._loading_locks: Dict[str, threading.Lock] = {}
+        self._hits: Dict[str, int] = {}
+        self._counters = {'loads': 0, 'evictions': 0, 'hits': 0, 'misses': 0, 'reloads': 0}
+        self._lock = threading.RLock()
+        self._warm_pid = None
+        self.dim = None
+        self.max_bytes = 1024 * 1024 * 1024
+        self.warm_domains = 8
+        self.hot_days = 7
+        self.quantization = 'none'
+        self.rerank_factor = 4
+        self.sync_interval = 2.0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask):
+        """Registra el índice en la aplicación Flask."""
+        app.config.setdefault('VECTOR_INDEX_MAX_MB', 1024)
+        app.config.setdefault('VECTOR_INDEX_WARM_DOMAINS', 8)
+        app.config.setdefault('VECTOR_INDEX_HOT_DAYS', 7)
+        app.config.setdefault('VECTOR_INDEX_QUANTIZATION', 'none')
+        app.config.setdefault('VECTOR_INDEX_RERANK_FACTOR', 4)
+        app.config.setdefault('VECTOR_INDEX_SYNC_INTERVAL', 2.0)
+        if app.config['VECTOR_INDEX_QUANTIZATION'] not in quantization.MODES:
+            raise ValueError(f"VECTOR_INDEX_QUANTIZATION debe ser uno de: {', '.join(quantization.MODES)}")
+        self.max_bytes = app.config['VECTOR_INDEX_MAX_MB'] * 1024 * 1024
+        self.warm_domains = app.config['VECTOR_INDEX_WARM_DOMAINS']
+        self.hot_days = app.config['VECTOR_INDEX_HOT_DAYS']
+        with self._lock:
+            if app.config['VECTOR_INDEX_QUANTIZATION'] != self.quantization:
+                # Los shards residentes tienen el formato anterior
+                self._shards.clear()
+            self.quantization = app.config['VECTOR_INDEX_QUANTIZATION']
+        self.rerank_factor = max(1, app.config['VECTOR_INDEX_RERANK_FACTOR'])
+        self.sync_interval = app.config['VECTOR_INDEX_SYNC_INTERVAL']
+        if not hasattr(app, 'extensions'):
+            app.extensions = {}
+        app.extensions['vector_index'] = self
+
+    @staticmethod
+    def _normalize(vector) -> Optional[np.ndarray]:
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+        norm = np.linalg.norm(vector)
+        if not vector.size or norm == 0:
+            return None
+        return vector / norm
+
+    def _check_dim(self, vector: np.ndarray):
+        if self.dim is None:
+            self.dim = vector.shape[0]
+        elif vector.shape[0] != self.dim:
+            raise ValueError(f"Dimensión de embedding inválida: {vector.shape[0]} != {self.dim}")
+
+    # Shards
+
+    def _read_shard(self, domain: str, segment, batch_size: int = 1000) -> Optional[_Partition]:
+        """Lee un dominio desde el segmento y la base, sin tomar el lock del índice.
+
+        Del segmento sólo se usan las filas que la base no modificó ni borró
+        desde que se construyó; el resto, y los documentos posteriores, se leen
+        de la base.
+        """
+        from app.models.document import Document
+
+        partition = None
+        rows = (db.session.query(Document.id, Document.embedding)
+                .filter(Document.domain == domain, Document.embedding.isnot(None)))
+        if segment is not None:
+            fresh = Document.id > segment.max_id
+            unchanged = rows.with_entities(Document.id).filter(Document.id <= segment.max_id)
+            if segment.built_at is not None:
+                fresh = or_(fresh, Document.updated_at >= segment.built_at)
+                unchanged = unchanged.filter(or_(Document.updated_at.is_(None),
+                                                 Document.updated_at < segment.built_at))
+            if domain in segment.domains:
+                ids, vectors = segment.partition(domain)
+                current = np.fromiter((doc_id for doc_id, in unchanged), dtype=np.int64)
+                keep = np.isin(ids, current)
+                if not keep.all():
+                    ids, vectors = ids[keep], vectors[keep]
+                if len(ids):
+                    with self._lock:
+                        self._check_dim(vectors[0])
+                    partition = _Partition.from_view(ids, vectors, self.quantization)
+            # Sólo se leen de la base los documentos posteriores o modificados después del segmento
+            rows = rows.filter(fresh)
+        for doc_id, embedding in rows.execution_options(yield_per=batch_size):
+            vector = self._normalize(embedding)
+            if vector is None:
+                continue
+            with self._lock:
+                self._check_dim(vector)
+            if partition is None:
+                partition = _Partition(self.dim, mode=self.quantization)
+            partition.add(doc_id, vector)
+            if segment is not None and doc_id <= segment.max_id:
+                partition.overrides.add(doc_id)
+        return partition
+
+    def _loading_lock(self, domain: str) -> threading.Lock:
+        with self._lock:
+            return self._loading_locks.setdefault(domain, threading.Lock())
+
+    @staticmethod
+    def _marker(domain: str) -> Tuple:
+        """Número de filas y último updated_at del dominio, cubiertos por idx_document_domain_updated."""
+        from app.models.document import Document
+
+        return tuple(db.session.query(db.func.count(Document.id), db.func.max(Document.updated_at))
+                     .filter(Document.domain == domain).one())
+
+    def _sync(self):
+        """Detecta un segmento nuevo y olvida los dominios conocidos, cada sync_interval segundos."""
+        from app.services.embedding_store import embedding_store
+
+        now = time.monotonic()
+        if now - self._synced_at < self.sync_interval:
+            return
+        self._synced_at = now
+        segment = embedding_store.refresh()
+        with self._lock:
+            self._known = None
+            if segment is not self._segment:
+                # Los shards residentes se leyeron del segmento anterior
+                self._segment = segment
+                self._shards.clear()
+                self._checked.clear()
+
+    def _check(self, domain: str):
+        """Descarta el shard si otro proceso cambió el dominio desde que se cargó."""
+        now = time.monotonic()
+        with self._lock:
+            shard = self._shards.get(domain)
+            if shard is None or now - self._checked.get(domain, 0.0) < self.sync_interval:
+                return
+            self._checked[domain] = now
+        if self._marker(domain) != shard.marker:
+            with self._lock:
+                if self._shards.get(domain) is shard:
+                    del self._shards[domain]
+                    self._counters['reloads'] += 1
+
+    def _shard(self, domain: str) -> Optional[_Partition]:
+        """Shard de un dominio, cargándolo si no está residente o si cambió en la base."""
+        self._check(domain)
+        with self._lock:
+            shard = self._shards.get(domain)
+            if shard is not None:
+                self._shards.move_to_end(domain)
+                self._counters['hits'] += 1
+                return shard
+        # Un solo hilo carga cada dominio; las búsquedas en otros dominios no esperan
+        with self._loading_lock(domain):
+            with self._lock:
+                shard = self._shards.get(domain)
+                if shard is not None:
+                    return shard
+                self._counters['misses'] += 1
+                self._loading[domain] = []
+                segment = self._segment
+            try:
+                # La marca se toma antes de leer: un cambio durante la lectura provoca otra carga
+                marker = self._marker(domain)
+                shard = self._read_shard(domain, segment)
+            finally:
+                with self._lock:
+                    events = self._loading.pop(domain)
+            with self._lock:
+                # Cambios confirmados en este proceso durante la lectura, en orden
+                for action, doc_id, changed, vector in events:
+                    if action == 'add' and changed == domain:
+                        if shard is None:
+                            shard = _Partition(self.dim, mode=self.quantization)
+                        shard.add(doc_id, vector)
+                        if segment is not None and doc_id <= segment.max_id:
+                            shard.overrides.add(doc_id)
+                    elif shard is not None:
+                        shard.remove(doc_id)
+                if shard is None or shard.size == 0:
+                    return None
+                if segment is not self._segment:
+                    # Se publicó otro segmento durante la lectura: sirve a esta búsqueda sin quedar residente
+                    return shard
+                shard.marker = marker
+                self._checked[domain] = time.monotonic()
+                self._shards[domain] = shard
+                self._counters['loads'] += 1
+                self._evict(keep=domain)
+            return shard
+
+    def _evict(self, keep: str):
+        """Descarta los shards menos usados mientras se supere el techo de memoria."""
+        while self.resident_bytes() > self.max_bytes and len(self._shards) > 1:
+            oldest = next(iter(self._shards))
+            if oldest == keep:
+                self._shards.move_to_end(keep)
+                continue
+            del self._shards[oldest]
+            self._counters['evictions'] += 1
+
+    def resident_bytes(self) -> int:
+        with self._lock:
+            return sum(shard.nbytes for shard in self._shards.values())
+
+    def domains(self) -> List[str]:
+        """Dominios con embeddings, según el segmento y la base."""
+        if self._known is None:
+            from app.models.document import Document
+
+            known = set(segment.domains) if (segment := self._segment) is not None else set()
+            # Sin filtrar por embedding la consulta se resuelve con el índice de dominio
+            known.update(domain for domain, in db.session.query(Document.domain).distinct())
+            with self._lock:
+                if self._known is None:
+                    self._known = known
+        with self._lock:
+            return sorted(self._known)
+
+    # Cambios
+
+    def apply(self, action: str, doc_id: int, domain: Optional[str] = None, embedding=None) -> bool:
+        """Aplica un alta, cambio o baja a los shards residentes y a los que se están cargando."""
+        vector = self._normalize(embedding) if action == 'add' and embedding is not None else None
+        if vector is None:
+            action = 'remove'
+        with self._lock:
+            segment = self._segment
+            if vector is not None:
+                self._check_dim(vector)
+            for name, shard in self._shards.items():
+                if action == 'remove' or name != domain:
+                    shard.remove(doc_id)
+            if action == 'add':
+                if domain in self._shards:
+                    self._shards[domain].add(doc_id, vector)
+                    if segment is not None and doc_id <= segment.max_id:
+                        self._shards[domain].overrides.add(doc_id)
+                if self._known is not None:
+                    self._known.add(domain)
+            for events in self._loading.values():
+                events.append((action, doc_id, domain, vector))
+        return action == 'add'
+
+    def add(self, doc_id: int, domain: str, embedding) -> bool:
+        """Agrega o reemplaza un documento en el shard de su dominio."""
+        return self.apply('add', doc_id, domain, embedding)
+
+    def remove(self, doc_id: int) -> bool:
+        """Elimina un documento del índice."""
+        return not self.apply('remove', doc_id)
+
+    # Consultas
+
+    def _full_vectors(self, candidates: List[Tuple[int, str]]) -> Dict[int, np.ndarray]:
+        """Vectores float32 normalizados de los candidatos: segmento mapeado y, si no está vigente, la base."""
+        from app.models.document import Document
+
+        with self._lock:
+            segment = self._segment
+            # Sin el shard residente no se sabe si la fila mapeada sigue vigente
+            current = {doc_id for doc_id, domain in candidates
+                       if domain in self._shards and doc_id not in self._shards[domain].overrides}
+        vectors, missing = {}, []
+        for doc_id, domain in candidates:
+            vector = None
+            if doc_id in current and segment is not None and doc_id <= segment.max_id:
+                vector = segment.get(doc_id, domain)
+            if vector is None:
+                missing.append(doc_id)
+            else:
+                vectors[doc_id] = vector
+        if missing:
+            # Documentos posteriores al segmento: una sola consulta por búsqueda
+            for doc_id, embedding in (db.session.query(Document.id, Document.embedding)
+                                      .filter(Document.id.in_(missing))):
+                vector = self._normalize(embedding)
+                if vector is not None:
+                    vectors[doc_id] = vector
+        return vectors
+
+    def _rerank(self, query: np.ndarray, candidates: List[Tuple[int, str]], k: int) -> List[Tuple[int, float]]:
+        """Puntuación exacta de los candidatos de la primera pasada cuantizada."""
+        vectors = self._full_vectors(candidates)
+        found = [doc_id for doc_id, _ in candidates if doc_id in vectors]
+        if not found:
+            return []
+        scores = np.stack([vectors[doc_id] for doc_id in found]).astype(np.float32, copy=False) @ query
+        return [(found[i], float(scores[i])) for i in quantization.top_k(scores, k)]
+
+    def search(self, query, domain: Optional[str] = None, k: int = 5) -> List[Tuple[int, float]]:
+        """Retorna los k documentos más similares como pares (id, score).
+
+        Sin dominio se recorren todos los shards, cargando los que falten.
+        """
+        vector = self._normalize(query)
+        if vector is None or k <= 0:
+            return []
+        self._sync()
+        quantized = self.quantization != 'none'
+        candidates = k * self.rerank_factor if quantized else k
+        results = []
+        for name in ([domain] if domain is not None else self.domains()):
+            shard = self._shard(name)
+            with self._lock:
+                self._hits[name] = self._hits.get(name, 0) + 1
+                if shard is not None:
+                    results.append((name, *shard.search(vector, candidates)))
+        if not results:
+            return []
+        names = [name for name, ids, _ in results for _ in range(len(ids))]
+        ids = np.concatenate([r[1] for r in results])
+        scores = np.concatenate([r[2] for r in results])
+        order = quantization.top_k(scores, candidates)
+        if quantized:
+            return self._rerank(vector, [(int(ids[i]), names[i]) for i in order], k)
+        return [(int(ids[i]), float(scores[i])) for i in order]
+
+    # Precarga
+
+    def hot_domains(self, limit: int) -> List[str]:
+        """Dominios con más tráfico: chats recientes más las consultas de este proceso."""
+        from app.models.chat import Chat
+
+        since = datetime.utcnow() - timedelta(days=self.hot_days)
+        counts = dict(db.session.query(Chat.domain, db.func.count(Chat.id))
+                      .filter(Chat.domain.isnot(None), Chat.updated_at >= since)
+                      .group_by(Chat.domain))
+        with self._lock:
+            for name, hits in self._hits.items():
+                counts[name] = counts.get(name, 0) + hits
+        known = set(self.domains())
+        ranked = sorted((name for name in counts if name in known), key=lambda name: -counts[name])
+        return ranked[:limit]
+
+    def warm_up(self, limit: Optional[int] = None) -> List[str]:
+        """Carga los dominios más usados sin pasar del 80 % del techo de memoria."""
+        self._sync()
+        loaded = []
+        for name in self.hot_domains(limit or self.warm_domains):
+            if self.resident_bytes() >= self.max_bytes * 0.8:
+                break
+            if self._shard(name) is not None:
+                loaded.append(name)
+        return loaded
+
+    def start_warm_up(self, app: Flask):
+        """Precarga en segundo plano, una vez por proceso."""
+        if self._warm_pid == os.getpid():
+            return
+        self._warm_pid = os.getpid()
+
+        def run():
+            with app.app_context():
+                try:
+                    loaded = self.warm_up()
+                    app.logger.info(f"Índice vectorial: precargados {len(loaded)} dominios")
+                except Exception as e:
+                    app.logger.warning(f"Precarga del índice vectorial fallida: {str(e)}")
+
+        threading.Thread(target=run, name='vector-index-warm-up', daemon=True).start()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._counters, 'shards': len(self._shards), 'resident_bytes': self.resident_bytes(),
+                    'documents': len(self)}
+
+    def __len__(self):
+        with self._lock:
+            return sum(shard.size for shard in self._shards.values())
+
+# Instancia global del índice
+vector_index = VectorIndex()
+
+def _pending(session) -> list:
+    return session.info.setdefault('vector_index_pending', [])
+
+def _track_upsert(mapper, connection, target):
+    _pending(object_session(target)).append(('add', target.id, target.domain, target.embedding))
+
+def _track_delete(mapper, connection, target):
+    _pending(object_session(target)).append(('remove', target.id, None, None))
+
+def _apply_pending(session):
+    for action, doc_id, domain, embedding in session.info.pop('vector_index_pending', []):
+        vector_index.apply(action, doc_id, domain, embedding)
+
+def _discard_pending(session):
+    session.info.pop('vector_index_pending', None)
+
+def register_events():
+    """Sincroniza el índice con los cambios confirmados sobre Document."""
+    from app.models.document import Document
+    if event.contains(Document, 'after_insert', _track_upsert):
+        return
+    event.listen(Document, 'after_insert', _track_upsert)
+    event.listen(Document, 'after_update', _track_upsert)
+    event.listen(Document, 'after_delete', _track_delete)
+    event.listen(db.session, 'after_commit', _apply_pending)
+    event.listen(db.session, 'after_rollback', _discard_pending)
@@ -0,0 +1,83 @@
+import os
+import random
+from datetime import datetime, timedelta
+from typing import Dict
+
+# Tamaños de los conjuntos de datos sembrados
+SIZES: Dict[str, Dict[str, int]] = {
+    'small': {'documents': 50, 'domains': 2, 'paragraphs': 4, 'chats': 5, 'messages': 20},
+    'medium': {'documents': 500, 'domains': 5, 'paragraphs': 8, 'chats': 20, 'messages': 200},
+    'large': {'documents': 5000, 'domains': 10, 'paragraphs': 12, 'chats': 50, 'messages': 2000},
+}
+
+VOCABULARY = (
+    'gobierno', 'regional', 'proyecto', 'inversión', 'presupuesto', 'convenio', 'municipio',
+    'programa', 'ejecución', 'licitación', 'contrato', 'obra', 'servicio', 'ciudadanía',
+    'desarrollo', 'territorio', 'planificación', 'evaluación', 'indicador', 'informe',
+    'resolución', 'decreto', 'financiamiento', 'transferencia', 'seguimiento', 'control',
+    'salud', 'educación', 'vivienda', 'transporte', 'agua', 'energía', 'medio', 'ambiente',
+    'fomento', 'productivo', 'innovación', 'cultura', 'deporte', 'seguridad', 'social',
+)
+
+QUESTIONS = (
+    '¿Cuál es el presupuesto del proyecto de {}?',
+    '¿Qué convenios de {} están vigentes?',
+    'Resume el informe de evaluación sobre {}.',
+    '¿Cómo se financia el programa de {}?',
+    '¿Qué indicadores miden el avance en {}?',
+)
+
+def _sentence(rng: random.Random) -> str:
+    words = [rng.choice(VOCABULARY) for _ in range(rng.randint(8, 20))]
+    return ' '.join(words).capitalize() + '.'
+
+def _paragraph(rng: random.Random) -> str:
+    return ' '.join(_sentence(rng) for _ in range(rng.randint(3, 7)))
+
+def question(rng: random.Random) -> str:
+    return rng.choice(QUESTIONS).format(rng.choice(VOCABULARY))
+
+def write_corpus(path: str, size: str = 'small', seed: int = 0) -> int:
+    """Genera un corpus reproducible de archivos .md en subcarpetas por dominio."""
+    spec = SIZES[size]
+    rng = random.Random(seed)
+    for i in range(spec['documents']):
+        domain = f"dominio{i % spec['domains'] + 1}"
+        os.makedirs(os.path.join(path, domain), exist_ok=True)
+        title = ' '.join(rng.choice(VOCABULARY) for _ in range(3)).title()
+        body = '\n\n'.join(_paragraph(rng) for _ in range(rng.randint(1, spec['paragraphs'])))
+        with open(os.path.join(path, domain, f"doc_{i:05d}.md"), 'w', encoding='utf-8') as f:
+            f.write(f"# {title}\n\n{body}\n")
+    return spec['documents']
+
+def seed_chats(username: str, size: str = 'small', seed: int = 0) -> Dict[str, int]:
+    """Crea historiales de chat reproducibles para un usuario.
+
+    Retorna {session_key: chat_id}; cada sesión puede usarse como claim
+    chat_session del JWT para consultar con ese historial.
+    """
+    from app import db
+    from app.models.chat import Chat, Message
+    from app.services.chat_history import resolve_user
+    from app.services.chunking import count_tokens
+
+    spec = SIZES[size]
+    rng = random.Random(seed)
+    user = resolve_user(username)
+    started = datetime.utcnow() - timedelta(days=1)
+    sessions = {}
+    for i in range(spec['chats']):
+        chat = Chat(user_id=user.id, session_key=f"bench-{size}-{i}")
+        db.session.add(chat)
+        db.session.flush()
+        rows = []
+        for j in range(spec['messages']):
+            role = 'user' if j % 2 == 0 else 'assistant'
+            content = question(rng) if role == 'user' else _paragraph(rng)
+            rows.append(Message(chat_id=chat.id, role=role, content=content,
+                                timestamp=started + timedelta(seconds=j),
+                                token_count=count_tokens(content)))
+        db.session.add_all(rows)
+        sessions[chat.session_key] = chat.id
+    db.session.commit()
+    return sessions
@@ -0,0 +1,94 @@
+import argparse
+import json
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+
+from app.services import quantization
+
+def synthetic_corpus(documents: int, dim: int, clusters: int, spread: float, seed: int) -> np.ndarray:
+    """Vectores normalizados agrupados en temas, más parecidos a embeddings reales que ruido uniforme."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, documents)
+    vectors = centers[labels] + spread * rng.standard_normal((documents, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+def synthetic_queries(corpus: np.ndarray, queries: int, noise: float, seed: int) -> np.ndarray:
+    """Consultas cercanas a documentos del corpus, para que los vecinos sean significativos."""
+    rng = np.random.default_rng(seed + 1)
+    picked = corpus[rng.integers(0, len(corpus), queries)]
+    vectors = picked + noise * rng.standard_normal(picked.shape).astype(np.float32) / np.sqrt(corpus.shape[1])
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+def evaluate(mode: str, corpus: np.ndarray, queries: np.ndarray, truth: np.ndarray, k: int,
+             factors: List[int]) -> List[Dict[str, Any]]:
+    """Recall@k y latencia de la primera pasada más el re-rank exacto para cada factor."""
+    started = time.perf_counter()
+    codes, scales = quantization.encode_blocks(mode, corpus)
+    encode_s = time.perf_counter() - started
+    per_vector = quantization.bytes_per_vector(mode, corpus.shape[1])
+    rows = []
+    for factor in (factors if mode != 'none' else [1]):
+        hits, elapsed = 0, 0.0
+        for query, expected in zip(queries, truth):
+            started = time.perf_counter()
+            approx = quantization.scores(mode, codes, scales, query)
+            candidates = quantization.top_k(approx, k * factor)
+            if mode != 'none':
+                # Re-rank con los vectores float32, como hace el índice con el segmento mapeado
+                exact = corpus[np.sort(candidates)] @ query
+                candidates = np.sort(candidates)[quantization.top_k(exact, k)]
+            elapsed += time.perf_counter() - started
+            hits += len(np.intersect1d(candidates[:k], expected))
+        rows.append({
+            'mode': mode,
+            'rerank_factor': factor,
+            f'recall@{k}': hits / (len(queries) * k),
+            'bytes_per_vector': per_vector,
+            'resident_mb': per_vector * len(corpus) / (1024 * 1024),
+            'compression': quantization.bytes_per_vector('none', corpus.shape[1]) / per_vector,
+            'query_ms': elapsed / len(queries) * 1000,
+            'encode_s': encode_s,
+        })
+    return rows
+
+def main(argv=None) -> List[Dict[str, Any]]:
+    parser = argparse.ArgumentParser(description="Recall frente a memoria de los embeddings cuantizados")
+    parser.add_argument('--documents', type=int, default=20000)
+    parser.add_argument('--dim', type=int, default=1536)
+    parser.add_argument('--clusters', type=int, default=200)
+    parser.add_argument('--spread', type=float, default=0.6, help="dispersión dentro de cada tema")
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--noise', type=float, default=0.5, help="distancia de la consulta a su documento")
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--factors', type=int, nargs='+', default=[1, 2, 4, 8, 16],
+                        help="valores de VECTOR_INDEX_RERANK_FACTOR a comparar")
+    parser.add_argument('--modes', nargs='+', choices=quantization.MODES, default=list(quantization.MODES))
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--output', default=None, help="archivo JSON de resultados")
+    args = parser.parse_args(argv)
+
+    corpus = synthetic_corpus(args.documents, args.dim, args.clusters, args.spread, args.seed)
+    queries = synthetic_queries(corpus, args.queries, args.noise, args.seed)
+    truth = np.stack([quantization.top_k(corpus @ query, args.k) for query in queries])
+
+    rows = []
+    for mode in args.modes:
+        rows.extend(evaluate(mode, corpus, queries, truth, args.k, args.factors))
+
+    recall = f'recall@{args.k}'
+    print(f"{'modo':<8}{'factor':>8}{recall:>12}{'B/vector':>10}{'MB':>10}{'x':>7}{'ms/consulta':>13}")
+    for row in rows:
+        print(f"{row['mode']:<8}{row['rerank_factor']:>8}{row[recall]:>12.4f}{row['bytes_per_vector']:>10}"
+              f"{row['resident_mb']:>10.1f}{row['compression']:>7.1f}{row['query_ms']:>13.2f}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'settings': vars(args), 'results': rows}, f, indent=2)
+    return rows
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,285 @@
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from benchmarks import fixtures
+from benchmarks.stub_server import StubServer, add_arguments, settings_from_args
+
+SCENARIOS = ('ingestion', 'chat_query', 'api_query', 'api_documents')
+BENCH_USER = 'bench_user'
+
+def percentiles(latencies: List[float]) -> Dict[str, float]:
+    """Percentiles de latencia en milisegundos."""
+    if not latencies:
+        return {'p50_ms': None, 'p95_ms': None, 'p99_ms': None, 'mean_ms': None, 'max_ms': None}
+    values = np.asarray(latencies) * 1000
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {'p50_ms': float(p50), 'p95_ms': float(p95), 'p99_ms': float(p99),
+            'mean_ms': float(values.mean()), 'max_ms': float(values.max())}
+
+def rss_mb(pid: Optional[int] = None) -> Optional[float]:
+    """Memoria residente de un proceso según /proc (Linux)."""
+    try:
+        with open(f"/proc/{pid or os.getpid()}/status") as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+def worker_pids(master_pid: int) -> List[int]:
+    """Procesos hijos de un maestro de gunicorn."""
+    try:
+        with open(f"/proc/{master_pid}/task/{master_pid}/children") as f:
+            return [int(pid) for pid in f.read().split()]
+    except OSError:
+        return []
+
+class InProcessClient:
+    """Peticiones contra la aplicación en el mismo proceso (un cliente de pruebas por hilo)."""
+
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+
+    def request(self, method: str, path: str, headers=None, data=None, json_body=None) -> int:
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        response = client.open(path, method=method, headers=headers, data=data, json=json_body)
+        response.get_data()
+        return response.status_code
+
+class HttpClient:
+    """Peticiones HTTP contra un servidor externo (p. ej. gunicorn)."""
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip('/')
+
+    def request(self, method: str, path: str, headers=None, data=None, json_body=None) -> int:
+        headers = dict(headers or {})
+        body = None
+        if json_body is not None:
+            body = json.dumps(json_body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        elif data is not None:
+            from urllib.parse import urlencode
+            body = urlencode(data).encode('utf-8')
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        req = urllib.request.Request(self.base_url + path, data=body, headers=headers, method=method)
+        try:
+            with urllib.request.urlopen(req, timeout=120) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+def run_load(call: Callable[[int], int], requests: int, concurrency: int,
+             memory: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+    """Ejecuta requests llamadas con la concurrencia indicada y resume latencias y errores."""
+    latencies, statuses = [], {}
+    lock = threading.Lock()
+    memory_before = memory()
+
+    def one(i: int):
+        started = time.perf_counter()
+        try:
+            status = call(i)
+        except Exception as e:
+            status = type(e).__name__
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(requests)))
+    elapsed = time.perf_counter() - started
+
+    errors = sum(count for status, count in statuses.items() if not status.startswith('2'))
+    return {
+        'requests': requests,
+        'concurrency': concurrency,
+        'duration_s': elapsed,
+        'rps': requests / elapsed if elapsed else None,
+        'errors': errors,
+        'error_rate': errors / requests if requests else 0.0,
+        'statuses': statuses,
+        **percentiles(latencies),
+        'memory_before_mb': memory_before,
+        'memory_after_mb': memory(),
+    }
+
+def scenario_errors(result: Dict[str, Any]) -> int:
+    """Errores de un escenario; la ingesta los reporta por pasada (cold e incremental)."""
+    if 'errors' in result:
+        return result['errors']
+    return sum(scenario_errors(value) for value in result.values() if isinstance(value, dict))
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except Exception:
+        return None
+
+def configure_environment(args, workdir: str, stub_url: Optional[str]):
+    """Variables de entorno leídas por Config; deben fijarse antes de importar la aplicación."""
+    if stub_url:
+        os.environ['OPENAI_BASE_URL'] = stub_url
+        os.environ.setdefault('OPENAI_API_KEY', 'stub')
+    if not args.url:
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+        os.environ['ELL_STORE_PATH'] = os.path.join(workdir, 'ell_store')
+        os.environ['EMBEDDING_SEGMENT_PATH'] = os.path.join(workdir, 'embedding_store')
+        os.environ['CHAT_STREAMING'] = 'false'
+        os.environ['LLM_CACHE_TYPE'] = 'lru' if args.cache else 'null'
+        # Sin --cache tampoco se reutilizan embeddings: cada consulta paga su llamada
+        os.environ['EMBEDDING_CACHE_PATH'] = os.path.join(workdir, 'embedding_cache.sqlite') if args.cache else ''
+        os.environ['EMBEDDING_CACHE_HOT_ENTRIES'] = '10000' if args.cache else '0'
+        os.environ['ELL_RECORDING'] = args.ell_recording
+
+def main(argv=None) -> Dict[str, Any]:
+    parser = argparse.ArgumentParser(description="Benchmarks sin coste de tokens contra un modelo simulado")
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                        help=f"lista separada por comas de: {', '.join(SCENARIOS)}")
+    parser.add_argument('--size', choices=sorted(fixtures.SIZES), default='small')
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--url', default=None,
+                        help="servidor externo; sin él se usa la aplicación en el mismo proceso")
+    parser.add_argument('--master-pid', type=int, default=None,
+                        help="pid del maestro de gunicorn para medir la memoria por worker")
+    parser.add_argument('--cache', action='store_true', help="mantener la caché de respuestas")
+    parser.add_argument('--ell-recording', default='async', choices=('async', 'sync', 'off'))
+    parser.add_argument('--workers', type=int, default=None, help="procesos de ingesta")
+    parser.add_argument('--no-stub', action='store_true', help="no levantar el servidor simulado")
+    parser.add_argument('--output', default=None, help="archivo JSON de resultados")
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Escenarios desconocidos: {', '.join(sorted(unknown))}")
+
+    workdir = tempfile.mkdtemp(prefix='bench-')
+    stub = None if args.no_stub else StubServer(**settings_from_args(args)).start()
+    configure_environment(args, workdir, stub.base_url if stub else None)
+
+    from flask_jwt_extended import create_access_token
+    from app import create_app, db
+    from app.services import lexical_index
+    from app.services.context_builder import shutdown_summaries
+    from app.services.ell_recorder import ell_recorder
+    from app.services.ingestion import IngestionPipeline
+    from app.services.lazy import warm_up
+
+    app = create_app()
+    if not args.url:
+        # Igual que el maestro de gunicorn: la importación de ell no cuenta como latencia
+        warm_up(app)
+    rng = random.Random(args.seed)
+    results: Dict[str, Any] = {}
+
+    def memory() -> Dict[str, Any]:
+        if args.master_pid:
+            return {str(pid): rss_mb(pid) for pid in worker_pids(args.master_pid)}
+        if args.url:
+            return {}
+        return {str(os.getpid()): rss_mb()}
+
+    try:
+        with app.app_context():
+            if not args.url:
+                db.create_all()
+                if db.engine.dialect.name == 'sqlite':
+                    lexical_index.install()
+
+            corpus = os.path.join(workdir, 'corpus')
+            fixtures.write_corpus(corpus, args.size, seed=args.seed)
+            # En el mismo proceso la ingesta también siembra los documentos de los demás escenarios
+            if 'ingestion' in scenarios or not args.url:
+                cold = IngestionPipeline(app, workers=args.workers).run(corpus)
+                incremental = IngestionPipeline(app, workers=args.workers).run(corpus)
+                if 'ingestion' in scenarios:
+                    results['ingestion'] = {'cold': cold, 'incremental': incremental,
+                                            'memory_mb': memory()}
+
+            sessions = list(fixtures.seed_chats(BENCH_USER, args.size, seed=args.seed))
+            tokens = [create_access_token(identity=BENCH_USER, additional_claims={'chat_session': key})
+                      for key in sessions]
+
+        client = HttpClient(args.url) if args.url else InProcessClient(app)
+        questions = [fixtures.question(rng) for _ in range(args.requests)]
+
+        def auth(i: int) -> Dict[str, str]:
+            return {'Authorization': f"Bearer {tokens[i % len(tokens)]}"}
+
+        calls = {
+            'chat_query': lambda i: client.request('POST', '/chat/query', headers=auth(i),
+                                                   data={'query': questions[i]}),
+            'api_query': lambda i: client.request('POST', '/api/query', headers=auth(i),
+                                                  json_body={'query': questions[i]}),
+            'api_documents': lambda i: client.request('GET', '/api/documents', headers=auth(i)),
+        }
+        for name in scenarios:
+            if name in calls:
+                results[name] = run_load(calls[name], args.requests, args.concurrency, memory)
+    finally:
+        # Los resúmenes en segundo plano y el registro de ell todavía usan el
+        # modelo simulado y el directorio de trabajo: se vacían antes de borrarlos
+        shutdown_summaries()
+        ell_recorder.close()
+        if stub is not None:
+            stub_counters = dict(stub.settings.counters)
+            stub.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'target': args.url or 'in-process',
+            'size': args.size,
+            'seed': args.seed,
+            'cache': args.cache,
+            'ell_recording': args.ell_recording,
+            'stub': None if stub is None else {**settings_from_args(args), 'counters': stub_counters},
+        },
+        'scenarios': results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    print(output)
+    failed = {name: errors for name, errors in ((name, scenario_errors(result))
+                                                for name, result in results.items()) if errors}
+    for name, errors in failed.items():
+        print(f"ERROR: el escenario {name} terminó con {errors} errores; "
+              f"sus resultados no son comparables", file=sys.stderr)
+    report['failed'] = sorted(failed)
+    return report
+
+if __name__ == '__main__':
+    sys.exit(1 if main()['failed'] else 0)
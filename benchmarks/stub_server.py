@@ -0,0 +1,227 @@
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict
+
+import numpy as np
+
+WORDS = ('el', 'la', 'de', 'que', 'y', 'en', 'un', 'documento', 'respuesta', 'consulta',
+         'modelo', 'contexto', 'datos', 'sistema', 'proceso', 'resultado', 'usuario')
+
+class StubSettings:
+    """Comportamiento del servidor simulado."""
+
+    def __init__(self, latency_ms: float = 200, tokens_per_second: float = 50,
+                 completion_tokens: int = 64, error_rate: float = 0.0,
+                 embedding_dim: int = 1536, seed: int = 0, tail_rate: float = 0.0,
+                 tail_latency_ms: float = 2000):
+        self.latency_ms = latency_ms
+        self.tail_rate = tail_rate
+        self.tail_latency_ms = tail_latency_ms
+        self.tokens_per_second = tokens_per_second
+        self.completion_tokens = completion_tokens
+        self.error_rate = error_rate
+        self.embedding_dim = embedding_dim
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counters = {'chat': 0, 'embeddings': 0, 'errors': 0}
+
+    def count(self, name: str):
+        with self.lock:
+            self.counters[name] += 1
+
+    def should_fail(self) -> bool:
+        with self.lock:
+            return self.random.random() < self.error_rate
+
+    def first_token_delay(self) -> float:
+        """Latencia hasta el primer token; una fracción tail_rate cae en la cola lenta."""
+        with self.lock:
+            slow = self.random.random() < self.tail_rate
+        return (self.tail_latency_ms if slow else self.latency_ms) / 1000
+
+def _tokens(n: int, seed: str):
+    rng = random.Random(seed)
+    return [rng.choice(WORDS) + ' ' for _ in range(n)]
+
+def _embedding(text: str, dim: int):
+    # Determinista por texto: la misma entrada produce siempre el mismo vector
+    seed = int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:8], 'little')
+    vector = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+class StubHandler(BaseHTTPRequestHandler):
+    """API compatible con OpenAI: /v1/chat/completions (con y sin stream) y /v1/embeddings."""
+
+    protocol_version = 'HTTP/1.1'
+    settings: StubSettings = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _json(self, status: int, payload: Dict[str, Any]):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self) -> Dict[str, Any]:
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def do_GET(self):
+        if self.path.rstrip('/').endswith('/models'):
+            return self._json(200, {'object': 'list', 'data': [{'id': 'stub', 'object': 'model'}]})
+        self._json(404, {'error': {'message': 'not found'}})
+
+    def do_POST(self):
+        body = self._read_body()
+        if self.settings.should_fail():
+            self.settings.count('errors')
+            status = self.settings.random.choice((429, 500, 503))
+            return self._json(status, {'error': {'message': 'stub error', 'type': 'server_error'}})
+        if self.path.endswith('/chat/completions'):
+            self.settings.count('chat')
+            try:
+                return self._chat(body)
+            except (BrokenPipeError, ConnectionResetError):
+                # El cliente canceló la petición (p. ej. la perdedora de un hedge)
+                self.close_connection = True
+                return
+        if self.path.endswith('/embeddings'):
+            self.settings.count('embeddings')
+            return self._embeddings(body)
+        self._json(404, {'error': {'message': 'not found'}})
+
+    def _chat(self, body: Dict[str, Any]):
+        settings = self.settings
+        prompt = json.dumps(body.get('messages', []))
+        prompt_tokens = max(len(prompt) // 4, 1)
+        tokens = _tokens(settings.completion_tokens, prompt)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+        model = body.get('model', 'stub')
+        usage = {'prompt_tokens': prompt_tokens, 'completion_tokens': len(tokens),
+                 'total_tokens': prompt_tokens + len(tokens)}
+        delay = 1 / settings.tokens_per_second if settings.tokens_per_second > 0 else 0
+
+        time.sleep(settings.first_token_delay())
+        if not body.get('stream'):
+            time.sleep(delay * len(tokens))
+            return self._json(200, {
+                'id': completion_id, 'object': 'chat.completion', 'created': created, 'model': model,
+                'choices': [{'index': 0, 'finish_reason': 'stop',
+                             'message': {'role': 'assistant', 'content': ''.join(tokens)}}],
+                'usage': usage
+            })
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+        def chunk(choices, **extra):
+            payload = {'id': completion_id, 'object': 'chat.completion.chunk', 'created': created,
+                       'model': model, 'choices': choices, **extra}
+            self.wfile.write(f"data: {json.dumps(payload)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+
+        chunk([{'index': 0, 'delta': {'role': 'assistant', 'content': ''}, 'finish_reason': None}])
+        for token in tokens:
+            chunk([{'index': 0, 'delta': {'content': token}, 'finish_reason': None}])
+            time.sleep(delay)
+        chunk([{'index': 0, 'delta': {}, 'finish_reason': 'stop'}])
+        if (body.get('stream_options') or {}).get('include_usage'):
+            chunk([], usage=usage)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def _embeddings(self, body: Dict[str, Any]):
+        inputs = body.get('input', [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        dim = body.get('dimensions') or self.settings.embedding_dim
+        time.sleep(self.settings.latency_ms / 4000)
+        tokens = sum(len(text) // 4 for text in inputs)
+        self._json(200, {
+            'object': 'list',
+            'model': body.get('model', 'stub'),
+            'data': [{'object': 'embedding', 'index': i, 'embedding': _embedding(text, dim)}
+                     for i, text in enumerate(inputs)],
+            'usage': {'prompt_tokens': tokens, 'total_tokens': tokens}
+        })
+
+class StubServer:
+    """Servidor simulado en un hilo; base_url apunta a su API /v1."""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, **settings):
+        self.settings = StubSettings(**settings)
+        handler = type('BoundStubHandler', (StubHandler,), {'settings': self.settings})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> 'StubServer':
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name='stub-llm', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--latency-ms', type=float, default=200, help="tiempo hasta el primer token")
+    parser.add_argument('--tokens-per-second', type=float, default=50, help="velocidad de generación")
+    parser.add_argument('--completion-tokens', type=int, default=64, help="tokens por respuesta")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fracción de respuestas con error")
+    parser.add_argument('--tail-rate', type=float, default=0.0, help="fracción de respuestas en la cola lenta")
+    parser.add_argument('--tail-latency-ms', type=float, default=2000, help="latencia de la cola lenta")
+    parser.add_argument('--embedding-dim', type=int, default=1536)
+    parser.add_argument('--seed', type=int, default=0)
+
+def settings_from_args(args) -> Dict[str, Any]:
+    return {
+        'latency_ms': args.latency_ms,
+        'tokens_per_second': args.tokens_per_second,
+        'completion_tokens': args.completion_tokens,
+        'error_rate': args.error_rate,
+        'tail_rate': args.tail_rate,
+        'tail_latency_ms': args.tail_latency_ms,
+        'embedding_dim': args.embedding_dim,
+        'seed': args.seed,
+    }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Servidor de modelos simulado compatible con OpenAI")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    server = StubServer(args.host, args.port, **settings_from_args(args))
+    print(f"Servidor simulado en {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
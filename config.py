@@ -1,3 +1,4 @@
+import json
 import os
 from dotenv import load_dotenv
 
@@ -10,7 +11,80 @@ class Config:
     DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///app.db')
     SQLALCHEMY_DATABASE_URI = DATABASE_URL
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL')
     DEFAULT_MODEL = "gpt-4o"
+    SUMMARY_MODEL = os.getenv('SUMMARY_MODEL', 'gpt-4o-mini')
+    CONTEXT_TOKEN_BUDGETS = {
+        'gpt-4o': 6000,
+        'gpt-4': 3000,
+        'default': 3000
+    }
+    LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', 256))
+    LLM_PROVIDER_CONCURRENCY = {
+        'openai': int(os.getenv('LLM_OPENAI_CONCURRENCY', 128)),
+        'anthropic': int(os.getenv('LLM_ANTHROPIC_CONCURRENCY', 64))
+    }
+    LLM_TIMEOUT = float(os.getenv('LLM_TIMEOUT', 60))
+    # {"gpt-4o": ["gpt-4o", {"provider": "anthropic", "model": "claude-3-5-sonnet-latest"}], ...};
+    # los endpoints de otro modelo (o con "fallback": true) solo se usan en failover y hedging;
+    # cada endpoint admite provider, model, base_url, api_key y name
+    LLM_ROUTES = json.loads(os.getenv('LLM_ROUTES', '{}'))
+    LLM_FALLBACK_MODEL = os.getenv('LLM_FALLBACK_MODEL')  # respaldo de los modelos sin ruta propia
+    LLM_ROUTER_WINDOW = float(os.getenv('LLM_ROUTER_WINDOW', 300))  # ventana de estadísticas en segundos
+    LLM_ROUTER_MIN_SAMPLES = int(os.getenv('LLM_ROUTER_MIN_SAMPLES', 20))
+    LLM_ROUTER_MAX_ERROR_RATE = float(os.getenv('LLM_ROUTER_MAX_ERROR_RATE', 0.5))
+    LLM_ROUTER_COOLDOWN = float(os.getenv('LLM_ROUTER_COOLDOWN', 30))
+    LLM_ROUTER_HEDGE = os.getenv('LLM_ROUTER_HEDGE', 'true').lower() == 'true'
+    LLM_ROUTER_HEDGE_MIN_MS = int(os.getenv('LLM_ROUTER_HEDGE_MIN_MS', 200))
+    LLM_ROUTER_PROBE_RATE = float(os.getenv('LLM_ROUTER_PROBE_RATE', 0.05))  # peticiones que miden réplicas sin muestras
+    CHAT_STREAMING = os.getenv('CHAT_STREAMING', 'true').lower() == 'true'
+    LLM_CACHE_TYPE = os.getenv('LLM_CACHE_TYPE', 'lru')
+    LLM_CACHE_TTL = int(os.getenv('LLM_CACHE_TTL', 3600))
+    LLM_CACHE_MAX_ENTRIES = int(os.getenv('LLM_CACHE_MAX_ENTRIES', 1000))
+    LLM_CACHE_GENERATION_TTL = float(os.getenv('LLM_CACHE_GENERATION_TTL', 5))  # segundos hasta ver una invalidación de otro proceso
+    RETRIEVAL_MODE = os.getenv('RETRIEVAL_MODE', 'hybrid')
+    LEXICAL_SEARCH_TIMEOUT_MS = int(os.getenv('LEXICAL_SEARCH_TIMEOUT_MS', 200))
+    RETRIEVAL_TOKEN_BUDGET = int(os.getenv('RETRIEVAL_TOKEN_BUDGET', 2000))
+    EMBEDDING_MODEL = os.getenv('EMBEDDING_MODEL', 'text-embedding-3-small')
+    EMBEDDING_SEGMENT_PATH = os.getenv('EMBEDDING_SEGMENT_PATH', './embedding_store')
+    EMBEDDING_CACHE_PATH = os.getenv('EMBEDDING_CACHE_PATH', './embedding_cache.sqlite')  # vacío desactiva el disco
+    EMBEDDING_CACHE_HOT_ENTRIES = int(os.getenv('EMBEDDING_CACHE_HOT_ENTRIES', 10000))  # vectores en memoria
+    INGEST_DEDUP_THRESHOLD = float(os.getenv('INGEST_DEDUP_THRESHOLD', 0.85))  # Jaccard estimado; 0 desactiva
+    INGEST_DEDUP_NUM_PERM = int(os.getenv('INGEST_DEDUP_NUM_PERM', 128))  # permutaciones de la firma MinHash
+    INGEST_PDF_PAGES_PER_TASK = int(os.getenv('INGEST_PDF_PAGES_PER_TASK', 16))  # páginas por tarea del pool
+    VECTOR_INDEX_MAX_MB = int(os.getenv('VECTOR_INDEX_MAX_MB', 1024))  # techo de los shards residentes
+    VECTOR_INDEX_WARM_DOMAINS = int(os.getenv('VECTOR_INDEX_WARM_DOMAINS', 8))  # dominios precargados al arrancar
+    VECTOR_INDEX_HOT_DAYS = int(os.getenv('VECTOR_INDEX_HOT_DAYS', 7))  # ventana de tráfico para elegirlos
+    VECTOR_INDEX_QUANTIZATION = os.getenv('VECTOR_INDEX_QUANTIZATION', 'none')  # none, int8 o binary
+    VECTOR_INDEX_RERANK_FACTOR = int(os.getenv('VECTOR_INDEX_RERANK_FACTOR', 4))  # candidatos re-puntuados por resultado
+    VECTOR_INDEX_SYNC_INTERVAL = float(os.getenv('VECTOR_INDEX_SYNC_INTERVAL', 2))  # segundos entre comprobaciones de cambios de otros procesos
+    ELL_STORE_PATH = os.getenv('ELL_STORE_PATH', './ell_store')
+    ELL_VERBOSE = os.getenv('ELL_VERBOSE', 'false').lower() == 'true'
+    ELL_RECORDING = os.getenv('ELL_RECORDING', 'async')  # async, sync u off
+    ELL_RECORD_SAMPLE_RATE = float(os.getenv('ELL_RECORD_SAMPLE_RATE', 1.0))
+    ELL_RECORD_MAX_PENDING = int(os.getenv('ELL_RECORD_MAX_PENDING', 10000))
+    ELL_RECORD_BATCH_SIZE = int(os.getenv('ELL_RECORD_BATCH_SIZE', 200))
+    ELL_RECORD_FLUSH_INTERVAL = float(os.getenv('ELL_RECORD_FLUSH_INTERVAL', 1.0))
+    SERVER_TIMING = os.getenv('SERVER_TIMING', 'true').lower() == 'true'
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN')  # si se define, /api/metrics exige Bearer
+    PROFILING_TOKEN = os.getenv('PROFILING_TOKEN')  # valor de la cabecera X-Profile que activa cProfile
+    PROFILE_DIR = os.getenv('PROFILE_DIR', './profiles')
+    CHAT_TOOLS = os.getenv('CHAT_TOOLS', 'false').lower() == 'true'  # el chat busca en documentos vía herramientas
+    TOOL_MAX_WORKERS = int(os.getenv('TOOL_MAX_WORKERS', 8))
+    TOOL_CACHE_TTL = int(os.getenv('TOOL_CACHE_TTL', 600))  # memoización de resultados por conversación
+    TOOL_MAX_ROUNDS = int(os.getenv('TOOL_MAX_ROUNDS', 3))
+    IMAGE_MAX_UPLOAD_BYTES = int(os.getenv('IMAGE_MAX_UPLOAD_BYTES', 20 * 1024 * 1024))
+    IMAGE_SPOOL_BYTES = int(os.getenv('IMAGE_SPOOL_BYTES', 1024 * 1024))  # a disco por encima de este tamaño
+    IMAGE_MAX_SIDE = int(os.getenv('IMAGE_MAX_SIDE', 2048))  # resolución útil del modelo de visión
+    IMAGE_MIN_SIDE = int(os.getenv('IMAGE_MIN_SIDE', 768))
+    IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 4))
+    ENSEMBLE_N = int(os.getenv('ENSEMBLE_N', 3))
+    ENSEMBLE_MAX_N = int(os.getenv('ENSEMBLE_MAX_N', 5))
+    ENSEMBLE_QUORUM = int(os.getenv('ENSEMBLE_QUORUM', 2))  # candidatos necesarios para llamar al juez
+    ENSEMBLE_DEADLINE = float(os.getenv('ENSEMBLE_DEADLINE', 20))  # plazo total en segundos
+    ENSEMBLE_JUDGE_TIMEOUT = float(os.getenv('ENSEMBLE_JUDGE_TIMEOUT', 5))
+    ENSEMBLE_MODELS = [m.strip() for m in os.getenv('ENSEMBLE_MODELS', 'gpt-4o').split(',') if m.strip()]
+    ENSEMBLE_JUDGE_MODEL = os.getenv('ENSEMBLE_JUDGE_MODEL', 'gpt-4o')
 
 class DevelopmentConfig(Config):
     DEBUG = True
@@ -0,0 +1,36 @@
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.getenv('GUNICORN_WORKERS', 4))
+threads = int(os.getenv('GUNICORN_THREADS', 8))
+wsgi_app = 'app:create_app()'
+
+# La aplicación se crea y precarga en el maestro; los workers heredan
+# módulos, LMPs, tokenizador e índice vectorial por copy-on-write.
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true').lower() == 'true'
+
+def when_ready(server):
+    if not preload_app:
+        return
+    from app.services.lazy import warm_up
+    timings = warm_up(server.app.wsgi())
+    total = sum(timings.values())
+    detail = ', '.join(f"{name}={ms:.0f}ms" for name, ms in timings.items())
+    server.log.info(f"Precarga completada en {total:.0f} ms ({detail})")
+
+def post_fork(server, worker):
+    # Las conexiones abiertas por el maestro no se comparten entre procesos
+    from app import db
+    if preload_app:
+        with server.app.wsgi().app_context():
+            db.engine.dispose(close=False)
+
+def post_worker_init(worker):
+    # Sin preload cada worker precarga en segundo plano los dominios más usados;
+    # con preload sólo completa los que el maestro no alcanzó a cargar
+    from app.services.vector_index import vector_index
+    vector_index.start_warm_up(worker.wsgi)
+
+def worker_exit(server, worker):
+    from app.services.ell_recorder import ell_recorder
+    ell_recorder.flush()
@@ -0,0 +1,32 @@
+"""add source path and content hash to documents
+
+Revision ID: 3a9e61c0f2d7
+Revises: 8c1f2a7d4b90
+Create Date: 2025-01-09 16:04:12.338415
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3a9e61c0f2d7'
+down_revision = '8c1f2a7d4b90'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('documents', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('source_path', sa.String(length=512), nullable=True))
+        batch_op.add_column(sa.Column('content_hash', sa.String(length=64), nullable=True))
+        batch_op.create_index(batch_op.f('ix_documents_source_path'), ['source_path'], unique=False)
+        batch_op.create_index(batch_op.f('ix_documents_content_hash'), ['content_hash'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('documents', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_documents_content_hash'))
+        batch_op.drop_index(batch_op.f('ix_documents_source_path'))
+        batch_op.drop_column('content_hash')
+        batch_op.drop_column('source_path')
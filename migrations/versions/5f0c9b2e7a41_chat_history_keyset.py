@@ -0,0 +1,34 @@
+"""chat session key and keyset index on messages
+
+Revision ID: 5f0c9b2e7a41
+Revises: e2b8c4f19a6d
+Create Date: 2025-01-14 15:20:44.671032
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5f0c9b2e7a41'
+down_revision = 'e2b8c4f19a6d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('chats', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('session_key', sa.String(length=64), nullable=True))
+        batch_op.create_index('idx_chat_user_session', ['user_id', 'session_key'], unique=False)
+
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.create_index('idx_message_chat_time', ['chat_id', 'timestamp', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.drop_index('idx_message_chat_time')
+
+    with op.batch_alter_table('chats', schema=None) as batch_op:
+        batch_op.drop_index('idx_chat_user_session')
+        batch_op.drop_column('session_key')
@@ -0,0 +1,56 @@
+"""convert pickled embeddings to float32 blobs
+
+Revision ID: 8c1f2a7d4b90
+Revises: 5ed42e57e2c3
+Create Date: 2025-01-08 10:12:41.512904
+
+"""
+import pickle
+
+from alembic import op
+import numpy as np
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c1f2a7d4b90'
+down_revision = '5ed42e57e2c3'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 500
+
+documents = sa.table(
+    'documents',
+    sa.column('id', sa.Integer()),
+    sa.column('embedding', sa.LargeBinary()),
+)
+
+
+def _convert(transform):
+    connection = op.get_bind()
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            sa.select(documents.c.id, documents.c.embedding)
+            .where(documents.c.id > last_id)
+            .where(documents.c.embedding.isnot(None))
+            .order_by(documents.c.id)
+            .limit(BATCH_SIZE)
+        ).fetchall()
+        if not rows:
+            break
+        connection.execute(
+            documents.update().where(documents.c.id == sa.bindparam('doc_id')),
+            [{'doc_id': row.id, 'embedding': transform(row.embedding)} for row in rows]
+        )
+        last_id = rows[-1].id
+
+
+def upgrade():
+    # El tipo SQL sigue siendo BLOB; sólo cambia la codificación del contenido
+    _convert(lambda blob: np.asarray(pickle.loads(blob), dtype='<f4').ravel().tobytes())
+
+
+def downgrade():
+    _convert(lambda blob: pickle.dumps(np.frombuffer(blob, dtype='<f4').tolist()))
@@ -0,0 +1,36 @@
+"""message token counts and rolling chat summary
+
+Revision ID: 9d3a7e15c8b2
+Revises: 5f0c9b2e7a41
+Create Date: 2025-01-15 12:03:57.118240
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d3a7e15c8b2'
+down_revision = '5f0c9b2e7a41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('token_count', sa.Integer(), nullable=True))
+
+    with op.batch_alter_table('chats', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('summary', sa.Text(), nullable=True))
+        batch_op.add_column(sa.Column('summary_tokens', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('summary_until_id', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('chats', schema=None) as batch_op:
+        batch_op.drop_column('summary_until_id')
+        batch_op.drop_column('summary_tokens')
+        batch_op.drop_column('summary')
+
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.drop_column('token_count')
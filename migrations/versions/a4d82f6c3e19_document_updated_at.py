@@ -0,0 +1,28 @@
+"""add updated_at to documents for cross-process index sync
+
+Revision ID: a4d82f6c3e19
+Revises: f3c5a8d21b76
+Create Date: 2025-01-22 16:41:03.527184
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4d82f6c3e19'
+down_revision = 'f3c5a8d21b76'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('documents', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+        batch_op.create_index('idx_document_domain_updated', ['domain', 'updated_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('documents', schema=None) as batch_op:
+        batch_op.drop_index('idx_document_domain_updated')
+        batch_op.drop_column('updated_at')
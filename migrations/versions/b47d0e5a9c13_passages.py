@@ -0,0 +1,40 @@
+"""add passages table
+
+Revision ID: b47d0e5a9c13
+Revises: 3a9e61c0f2d7
+Create Date: 2025-01-10 11:27:05.914477
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b47d0e5a9c13'
+down_revision = '3a9e61c0f2d7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('passages',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('document_id', sa.Integer(), nullable=False),
+    sa.Column('position', sa.Integer(), nullable=False),
+    sa.Column('content', sa.Text(), nullable=False),
+    sa.Column('start_offset', sa.Integer(), nullable=False),
+    sa.Column('end_offset', sa.Integer(), nullable=False),
+    sa.Column('token_count', sa.Integer(), nullable=False),
+    sa.Column('embedding', sa.LargeBinary(), nullable=True),
+    sa.ForeignKeyConstraint(['document_id'], ['documents.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('passages', schema=None) as batch_op:
+        batch_op.create_index('idx_passage_document_position', ['document_id', 'position'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('passages', schema=None) as batch_op:
+        batch_op.drop_index('idx_passage_document_position')
+
+    op.drop_table('passages')
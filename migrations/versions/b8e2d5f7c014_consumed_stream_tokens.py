@@ -0,0 +1,33 @@
+"""single-use chat stream tokens
+
+Revision ID: b8e2d5f7c014
+Revises: a4d82f6c3e19
+Create Date: 2025-01-24 09:27:51.640273
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b8e2d5f7c014'
+down_revision = 'a4d82f6c3e19'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('consumed_stream_tokens',
+    sa.Column('jti', sa.String(length=32), nullable=False),
+    sa.Column('consumed_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('jti')
+    )
+    with op.batch_alter_table('consumed_stream_tokens', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_consumed_stream_tokens_consumed_at'), ['consumed_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('consumed_stream_tokens', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_consumed_stream_tokens_consumed_at'))
+
+    op.drop_table('consumed_stream_tokens')
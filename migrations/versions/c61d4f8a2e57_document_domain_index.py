@@ -0,0 +1,25 @@
+"""index on documents.domain for the paginated listing
+
+Revision ID: c61d4f8a2e57
+Revises: 9d3a7e15c8b2
+Create Date: 2025-01-16 11:05:12.318904
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'c61d4f8a2e57'
+down_revision = '9d3a7e15c8b2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('documents', schema=None) as batch_op:
+        batch_op.create_index('idx_document_domain', ['domain', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('documents', schema=None) as batch_op:
+        batch_op.drop_index('idx_document_domain')
@@ -0,0 +1,26 @@
+"""add minhash signature to documents
+
+Revision ID: d7e3f9a1b254
+Revises: c61d4f8a2e57
+Create Date: 2025-01-20 11:26:47.815309
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd7e3f9a1b254'
+down_revision = 'c61d4f8a2e57'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('documents', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('minhash', sa.LargeBinary(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('documents', schema=None) as batch_op:
+        batch_op.drop_column('minhash')
@@ -0,0 +1,58 @@
+"""add FTS5 index over documents
+
+Revision ID: e2b8c4f19a6d
+Revises: b47d0e5a9c13
+Create Date: 2025-01-13 09:48:30.206117
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2b8c4f19a6d'
+down_revision = 'b47d0e5a9c13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # FTS5 sólo existe en SQLite; en otros motores la búsqueda híbrida usa sólo vectores
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    op.execute("""
+        CREATE VIRTUAL TABLE documents_fts USING fts5(
+            title, content, domain UNINDEXED,
+            content='documents', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+    """)
+    op.execute("""
+        CREATE TRIGGER documents_fts_ai AFTER INSERT ON documents BEGIN
+            INSERT INTO documents_fts(rowid, title, content, domain)
+            VALUES (new.id, new.title, new.content, new.domain);
+        END
+    """)
+    op.execute("""
+        CREATE TRIGGER documents_fts_ad AFTER DELETE ON documents BEGIN
+            INSERT INTO documents_fts(documents_fts, rowid, title, content, domain)
+            VALUES ('delete', old.id, old.title, old.content, old.domain);
+        END
+    """)
+    op.execute("""
+        CREATE TRIGGER documents_fts_au AFTER UPDATE OF title, content, domain ON documents BEGIN
+            INSERT INTO documents_fts(documents_fts, rowid, title, content, domain)
+            VALUES ('delete', old.id, old.title, old.content, old.domain);
+            INSERT INTO documents_fts(rowid, title, content, domain)
+            VALUES (new.id, new.title, new.content, new.domain);
+        END
+    """)
+    op.execute("INSERT INTO documents_fts(documents_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    op.execute("DROP TRIGGER IF EXISTS documents_fts_au")
+    op.execute("DROP TRIGGER IF EXISTS documents_fts_ad")
+    op.execute("DROP TRIGGER IF EXISTS documents_fts_ai")
+    op.execute("DROP TABLE IF EXISTS documents_fts")
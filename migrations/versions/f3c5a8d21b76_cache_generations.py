@@ -0,0 +1,28 @@
+"""cache generations shared across processes
+
+Revision ID: f3c5a8d21b76
+Revises: d7e3f9a1b254
+Create Date: 2025-01-22 10:14:36.902518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3c5a8d21b76'
+down_revision = 'd7e3f9a1b254'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('cache_generations',
+    sa.Column('scope', sa.String(length=64), nullable=False),
+    sa.Column('generation', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('scope')
+    )
+
+
+def downgrade():
+    op.drop_table('cache_generations')
@@ -0,0 +1,71 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Se ejecuta en un intérprete limpio para medir el arranque en frío
+PROBE = '''
+import json, sys, time
+started = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+app = create_app()
+created = time.perf_counter()
+from app.services.lazy import HEAVY_MODULES
+report = {
+    'import_ms': (imported - started) * 1000,
+    'create_app_ms': (created - imported) * 1000,
+    'loaded_at_boot': sorted(m for m in HEAVY_MODULES if m in sys.modules),
+}
+if WARM_UP:
+    from app.services.lazy import warm_up
+    report['warm_up_ms'] = warm_up(app)
+requested = time.perf_counter()
+app.test_client().get('/api/health')
+report['first_request_ms'] = (time.perf_counter() - requested) * 1000
+report['boot_ms'] = (time.perf_counter() - started) * 1000
+print(json.dumps(report))
+'''
+
+def parse_importtime(stderr: str, top: int):
+    """Módulos con mayor tiempo de importación acumulado según -X importtime."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        rows.append({
+            'module': name.strip(),
+            'depth': (len(name) - len(name.lstrip()) - 1) // 2,
+            'self_ms': int(self_us) / 1000,
+            'cumulative_ms': int(cumulative_us) / 1000,
+        })
+    rows.sort(key=lambda row: row['cumulative_ms'], reverse=True)
+    return rows[:top]
+
+def boot_report(warm_up=False, top=15):
+    code = f"WARM_UP = {warm_up!r}\n" + PROBE
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                            cwd=ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr[-2000:])
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    report['top_imports'] = parse_importtime(result.stderr, top)
+    return report
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Informe de tiempos de importación y arranque")
+    parser.add_argument('--warm-up', action='store_true', help="incluir la precarga del maestro de gunicorn")
+    parser.add_argument('--top', type=int, default=15, help="módulos más lentos a listar")
+    parser.add_argument('--max-boot-ms', type=float, default=None,
+                        help="falla si import + create_app supera este tiempo")
+    args = parser.parse_args()
+
+    report = boot_report(warm_up=args.warm_up, top=args.top)
+    print(json.dumps(report, indent=2))
+    if args.max_boot_ms is not None and report['import_ms'] + report['create_app_ms'] > args.max_boot_ms:
+        print(f"Arranque sobre el límite de {args.max_boot_ms} ms", file=sys.stderr)
+        sys.exit(1)
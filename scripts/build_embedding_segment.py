@@ -0,0 +1,15 @@
+import sys
+from app import create_app
+from app.services.embedding_store import embedding_store
+
+def build_segment():
+    app = create_app()
+    with app.app_context():
+        count = embedding_store.build()
+        print(f"Segmento generado en {embedding_store.path} con {count} embeddings")
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        print("Uso: python build_embedding_segment.py")
+        sys.exit(1)
+    build_segment()
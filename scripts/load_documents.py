@@ -1,32 +1,27 @@
-import sys
-import os
-import yaml
-from app import create_app, db
-from app.models.document import Document
-from app.services.ell_service import ell_service
+import argparse
+import json
+import logging
+from app import create_app
+from app.services.ingestion import IngestionPipeline
 
-def load_documents(path):
+def load_documents(path, workers=None, batch_size=50, embed=True, dedup_threshold=None):
     app = create_app()
     with app.app_context():
-        for root, _, files in os.walk(path):
-            for file in files:
-                if file.endswith(('.txt', '.md', '.pdf')):
-                    file_path = os.path.join(root, file)
-                    domain = os.path.basename(os.path.dirname(file_path))
-                    
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                        
-                    doc = Document(
-                        title=file,
-                        content=content,
-                        domain=domain
-                    )
-                    db.session.add(doc)
-        db.session.commit()
+        pipeline = IngestionPipeline(app, workers=workers, batch_size=batch_size, embed=embed,
+                                     dedup_threshold=dedup_threshold)
+        return pipeline.run(path)
 
 if __name__ == '__main__':
-    if len(sys.argv) < 2:
-        print("Uso: python load_documents.py [ruta-a-documentos]")
-        sys.exit(1)
-    load_documents(sys.argv[1]) 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Carga documentos de forma incremental")
+    parser.add_argument('path', help="ruta-a-documentos")
+    parser.add_argument('--workers', type=int, default=None, help="procesos del pool (por defecto, CPUs)")
+    parser.add_argument('--batch-size', type=int, default=50, help="documentos por transacción")
+    parser.add_argument('--no-embed', action='store_true', help="no calcular embeddings")
+    parser.add_argument('--dedup-threshold', type=float, default=None,
+                        help="similitud para enlazar casi duplicados (0 desactiva; por defecto INGEST_DEDUP_THRESHOLD)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    report = load_documents(args.path, workers=args.workers, batch_size=args.batch_size,
+                            embed=not args.no_embed, dedup_threshold=args.dedup_threshold)
+    print(json.dumps(report, indent=2))